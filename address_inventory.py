@@ -0,0 +1,371 @@
+import argparse
+import csv
+import fcntl
+import io
+import ipaddress
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from google.cloud import resourcemanager_v3
+from clients import get_client
+from inventory_cache import get_inventory_cache
+from org_crawler import discover_hierarchy
+from allocated_ip_range import iter_allocated_ip_ranges
+
+# Location of the address inventory database
+ADDRESS_INVENTORY_PATH = os.environ.get('ADDRESS_INVENTORY_PATH', 'address_inventory.sqlite3')
+# Seconds the address inventory of an organization is served before it is collected again
+ADDRESS_INVENTORY_TTL = int(os.environ.get('ADDRESS_INVENTORY_TTL', '3600'))
+# Number of projects whose addresses are listed concurrently
+ADDRESS_WORKERS = int(os.environ.get('ADDRESS_WORKERS', '16'))
+# Addresses written per insert, at most ADDRESS_WORKERS * 2 batches wait for the writer
+ADDRESS_BATCH_SIZE = int(os.environ.get('ADDRESS_BATCH_SIZE', '500'))
+# Number of organizations whose addresses are refreshed concurrently in the background
+ADDRESS_REFRESH_WORKERS = int(os.environ.get('ADDRESS_REFRESH_WORKERS', '2'))
+
+# Columns of the address table, in ip_table.html and CSV export order
+ADDRESS_COLUMNS = [
+    'project_id', 'address', 'address_type', 'creation_timestamp', 'description', 'name',
+    'network_tier', 'purpose', 'region', 'self_link', 'status', 'users'
+]
+# Columns ?q= is matched against
+FILTER_COLUMNS = ['project_id', 'address', 'name', 'description', 'purpose', 'region', 'status', 'users']
+
+
+def address_sort_key(address):
+    """Returns a text key sorting addresses numerically, IPv4 before IPv6, e.g. "40a000001"."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return ''
+    return f"{ip.version}{ip.packed.hex()}"
+
+
+def list_org_project_ids(organization_id):
+    """Returns the IDs of every project in an organization, read through the inventory cache."""
+    containers = discover_hierarchy(get_client(resourcemanager_v3.FoldersClient),
+                                    get_client(resourcemanager_v3.ProjectsClient),
+                                    f"organizations/{organization_id}", cache=get_inventory_cache())
+    return [project['project_id'] for container in containers for project in container['projects']]
+
+
+class AddressInventory:
+    """SQLite table of the addresses of every project of an organization.
+
+    Addresses are written as they are listed and read a page or a cursor at a time, so memory
+    stays bounded whatever the size of the organization. Every call opens its own connection.
+
+    A refresh writes a new generation of the organization's rows, committed a batch at a time,
+    and switches the organization's 'refreshes' row to it at the end; readers keep seeing the
+    previous generation until then, and the older ones are deleted a batch at a time. Refreshes
+    of an organization are serialized across processes with a lock file next to the database.
+    """
+
+    def __init__(self, path=ADDRESS_INVENTORY_PATH, refresh_workers=ADDRESS_REFRESH_WORKERS):
+        self.path = path
+        self._refreshes = {}
+        self._refreshes_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="address-refresh")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS addresses ("
+                " organization_id TEXT NOT NULL,"
+                " address_sort TEXT NOT NULL, "
+                + ", ".join(f"{column} TEXT" for column in ADDRESS_COLUMNS) +
+                ", generation INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refreshes ("
+                " organization_id TEXT PRIMARY KEY,"
+                " refreshed_at REAL NOT NULL,"
+                " project_count INTEGER NOT NULL,"
+                " address_count INTEGER NOT NULL,"
+                " failed_projects INTEGER NOT NULL,"
+                " generation INTEGER NOT NULL DEFAULT 0)"
+            )
+            # databases written before generations keep their rows as generation 0
+            for table in ("addresses", "refreshes"):
+                if "generation" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+            conn.execute("DROP INDEX IF EXISTS addresses_by_address")
+            conn.execute("CREATE INDEX IF NOT EXISTS addresses_by_generation"
+                         " ON addresses (organization_id, generation, address_sort)")
+
+    @contextmanager
+    def _connect(self):
+        """Yields a new connection in a transaction, committed and closed on exit."""
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _refresh_lock(self, organization_id, blocking=True):
+        """Holds the organization's refresh lock file, shared by every process and thread.
+
+        Yields whether the lock was acquired, always True when blocking.
+        """
+        with open(f"{self.path}.{organization_id}.lock", 'w') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def refresh(self, organization_id, project_ids=None, max_workers=ADDRESS_WORKERS, refreshed_before=None):
+        """Lists the addresses of every project concurrently and replaces the organization's rows.
+
+        Workers hand batches of ADDRESS_BATCH_SIZE rows to the calling thread through a bounded
+        queue, and the calling thread commits them as a new generation as they arrive. If the
+        writer fails, the workers stop listing and their pending batches are dropped.
+
+        Args:
+            organization_id: The organization ID.
+            project_ids: Projects to list, by default every project of the organization.
+            max_workers: Number of projects listed concurrently.
+            refreshed_before: Skip the refresh if, once the refresh lock is held, the
+                organization was refreshed since this time, e.g. by another process.
+
+        Returns:
+            The organization's new status, see status.
+        """
+        with self._refresh_lock(organization_id):
+            status = self.status(organization_id)
+            if status is not None and refreshed_before is not None and status['refreshed_at'] > refreshed_before:
+                return status
+            if project_ids is None:
+                project_ids = list_org_project_ids(organization_id)
+            return self._refresh(organization_id, project_ids, max_workers)
+
+    def _refresh(self, organization_id, project_ids, max_workers):
+        batches = queue.Queue(maxsize=max_workers * 2)
+        cancelled = threading.Event()
+        failed = []
+
+        def put(item):
+            while not cancelled.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def collect(project_id):
+            batch = []
+            try:
+                for address in iter_allocated_ip_ranges(project_id):
+                    if cancelled.is_set():
+                        return
+                    batch.append((organization_id, address_sort_key(address['address']), project_id)
+                                 + tuple(str(address[column]) for column in ADDRESS_COLUMNS[1:]))
+                    if len(batch) >= ADDRESS_BATCH_SIZE:
+                        put(batch)
+                        batch = []
+            except Exception:
+                print(f"project: {project_id} does not Compute Engine API Enabled")
+                failed.append(project_id)
+            finally:
+                put(batch)
+                put(None)
+
+        insert = (f"INSERT INTO addresses (organization_id, address_sort, {', '.join(ADDRESS_COLUMNS)}, generation) "
+                  f"VALUES ({', '.join('?' * (len(ADDRESS_COLUMNS) + 3))})")
+        address_count = 0
+        conn = sqlite3.connect(self.path)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            generation = conn.execute(
+                "SELECT MAX(generation) + 1 FROM (SELECT generation FROM addresses WHERE organization_id = ?"
+                " UNION ALL SELECT generation FROM refreshes WHERE organization_id = ?)",
+                (organization_id, organization_id)
+            ).fetchone()[0] or 1
+            for project_id in project_ids:
+                executor.submit(collect, project_id)
+            remaining = len(project_ids)
+            while remaining:
+                batch = batches.get()
+                if batch is None:
+                    remaining -= 1
+                    continue
+                with conn:
+                    conn.executemany(insert, [row + (generation,) for row in batch])
+                address_count += len(batch)
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?, ?, ?, ?)",
+                    (organization_id, time.time(), len(project_ids), address_count, len(failed), generation)
+                )
+            # the previous generations, and the rows of refreshes that failed
+            while conn.execute(
+                "DELETE FROM addresses WHERE rowid IN (SELECT rowid FROM addresses"
+                " WHERE organization_id = ? AND generation != ? LIMIT ?)",
+                (organization_id, generation, ADDRESS_BATCH_SIZE)
+            ).rowcount:
+                conn.commit()
+            conn.commit()
+        except BaseException:
+            cancelled.set()
+            raise
+        finally:
+            executor.shutdown(cancel_futures=True)
+            conn.close()
+        return self.status(organization_id)
+
+    def status(self, organization_id):
+        """Returns when the organization was last refreshed and what was found, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT refreshed_at, project_count, address_count, failed_projects FROM refreshes"
+                " WHERE organization_id = ?", (organization_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"refreshed_at": row[0], "project_count": row[1], "address_count": row[2], "failed_projects": row[3]}
+
+    def is_refreshing(self, organization_id):
+        """Returns whether a refresh of the organization runs in this or another process."""
+        with self._refreshes_lock:
+            future = self._refreshes.get(organization_id)
+        if future is not None and not future.done():
+            return True
+        with self._refresh_lock(organization_id, blocking=False) as acquired:
+            return not acquired
+
+    def ensure_fresh(self, organization_id, refresh=False, ttl=ADDRESS_INVENTORY_TTL):
+        """Returns the organization's status right away, refreshing it in the background when
+        missing, older than ttl or when refresh is set.
+
+        Raises:
+            The exception the last background refresh of the organization failed with, once.
+
+        Returns:
+            A tuple of the status, None until the first refresh is done, and whether a refresh
+            is running.
+        """
+        with self._refreshes_lock:
+            future = self._refreshes.get(organization_id)
+            if future is not None and future.done():
+                del self._refreshes[organization_id]
+                if future.exception() is not None:
+                    raise future.exception()
+                future = None
+            status = self.status(organization_id)
+            now = time.time()
+            if future is None and (refresh or status is None or now - status['refreshed_at'] >= ttl):
+                future = self._refreshes[organization_id] = self._executor.submit(
+                    self.refresh, organization_id, refreshed_before=now if refresh else now - ttl
+                )
+        return status, future is not None or self.is_refreshing(organization_id)
+
+    @staticmethod
+    def _query(organization_id, query, sort, descending):
+        where = "organization_id = ? AND generation = (SELECT generation FROM refreshes WHERE organization_id = ?)"
+        params = [organization_id, organization_id]
+        if query:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where += " AND (" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in FILTER_COLUMNS) + ")"
+            params.extend([pattern] * len(FILTER_COLUMNS))
+        order_column = 'address_sort' if sort == 'address' or sort not in ADDRESS_COLUMNS else sort
+        order = f"{order_column} {'DESC' if descending else 'ASC'}, rowid"
+        return where, params, order
+
+    def page(self, organization_id, query='', sort='address', descending=False, page=1, per_page=100):
+        """Returns one page of the organization's addresses and the number of matching addresses.
+
+        Args:
+            organization_id: The organization ID.
+            query: Text the address, name, project, region, ... of the addresses must contain.
+            sort: Column of ADDRESS_COLUMNS to sort by, addresses sort numerically.
+            descending: Sort in descending order.
+            page: Page number, from 1.
+            per_page: Addresses per page.
+
+        Returns:
+            A tuple of the page's addresses, dictionaries of ADDRESS_COLUMNS, and the total count.
+        """
+        where, params, order = self._query(organization_id, query, sort, descending)
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM addresses WHERE {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(ADDRESS_COLUMNS)} FROM addresses WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [per_page, (max(page, 1) - 1) * per_page]
+            ).fetchall()
+        return [dict(zip(ADDRESS_COLUMNS, row)) for row in rows], total
+
+    def rows(self, organization_id, query='', sort='address', descending=False):
+        """Yields every matching address as a tuple of ADDRESS_COLUMNS, read from a cursor."""
+        where, params, order = self._query(organization_id, query, sort, descending)
+        with self._connect() as conn:
+            yield from conn.execute(
+                f"SELECT {', '.join(ADDRESS_COLUMNS)} FROM addresses WHERE {where} ORDER BY {order}", params
+            )
+
+
+def iter_csv(rows, columns=ADDRESS_COLUMNS, rows_per_chunk=1000):
+    """Yields rows as CSV text, a header line and then chunks of rows_per_chunk rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+_default_inventory = None
+_default_inventory_lock = threading.Lock()
+
+
+def get_address_inventory():
+    """Returns the process-wide AddressInventory at ADDRESS_INVENTORY_PATH."""
+    global _default_inventory
+    with _default_inventory_lock:
+        if _default_inventory is None:
+            _default_inventory = AddressInventory()
+        return _default_inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect or export the addresses of an organization.")
+    parser.add_argument('--path', default=ADDRESS_INVENTORY_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparser = subparsers.add_parser('refresh')
+    subparser.add_argument('organization_id')
+    subparser = subparsers.add_parser('export', help="write the addresses as CSV to stdout")
+    subparser.add_argument('organization_id')
+    subparser.add_argument('--query', default='')
+    subparser.add_argument('--sort', default='address', choices=ADDRESS_COLUMNS)
+    subparser.add_argument('--descending', action='store_true')
+    args = parser.parse_args()
+
+    inventory = AddressInventory(args.path)
+
+    if args.command == 'refresh':
+        start = time.perf_counter()
+        status = inventory.refresh(args.organization_id)
+        print(f"{status['address_count']} addresses in {status['project_count']} projects "
+              f"({status['failed_projects']} failed) collected in {time.perf_counter() - start:.1f} s")
+
+    elif args.command == 'export':
+        for chunk in iter_csv(inventory.rows(args.organization_id, args.query, args.sort, args.descending)):
+            sys.stdout.write(chunk)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,34 @@
 from google.cloud import compute_v1
 
-def get_allocated_ip_ranges(project_id):
+from clients import get_client
+
+def iter_allocated_ip_ranges(project_id):
     """
-    Fetches the list and CIDR of allocated IP ranges for a given VPC under private service access.
+    Yields the regional and global addresses of a project, one page of aggregated_list at a time.
 
     Args:
         project_id: The ID of the Google Cloud project.
 
-    Returns:
-        A list of dictionaries, each containing address details.
+    Yields:
+        A dictionary of address details per address.
     """
 
-    client = compute_v1.AddressesClient()
+    client = get_client(compute_v1.AddressesClient)
 
-    # List all addresses in the project and region
+    # List all addresses of the project, every region and global
     request = compute_v1.AggregatedListAddressesRequest(
         project=project_id
     )
 
-    allocated_ranges = []
-    # Iterate through all addresses
+    # Iterate through all addresses, the pager fetches the next page when this one is consumed
     for response in client.aggregated_list(request=request):
-        # Get the region name (first element of the tuple)
+        # Get the region name (first element of the tuple), e.g. "regions/us-central1" or "global"
         region_name = response[0]
         # Get the region data (second element of the tuple)
         region_data = response[1]
 
         for address in region_data.addresses:
-            address_data = {
+            yield {
                 'address': address.address,
                 'address_type': address.address_type,
                 'creation_timestamp': address.creation_timestamp,
@@ -38,23 +39,29 @@ def get_allocated_ip_ranges(project_id):
                 'name': address.name,
                 'network_tier': address.network_tier,
                 'purpose': address.purpose,
-                'region': address.region.split('/')[-1],  # Extract region name
+                'region': address.region.split('/')[-1] if address.region else region_name.split('/')[-1],
                 'self_link': address.self_link,
                 'status': address.status,
                 'users': ', '.join(address.users) if address.users else ''
             }
-            allocated_ranges.append(address_data)
 
-    return allocated_ranges
+
+def get_allocated_ip_ranges(project_id):
+    """
+    Fetches the list and CIDR of allocated IP ranges for a given VPC under private service access.
+
+    Args:
+        project_id: The ID of the Google Cloud project.
+
+    Returns:
+        A list of dictionaries, each containing address details.
+    """
+    return list(iter_allocated_ip_ranges(project_id))
 
 # Example usage (you can move this to a Flask app later)
 if __name__ == "__main__":
     project_id = "enter_your_project_id_here"
-    region = "enter_your_region_here"
-    vpc_name = "enter_vpc_name_here"
-
-    allocated_ip_ranges = get_allocated_ip_ranges(project_id, region, vpc_name)
 
     # For now, just print the data
-    for ip_range in allocated_ip_ranges:
+    for ip_range in iter_allocated_ip_ranges(project_id):
         print(ip_range)
@@ -0,0 +1,233 @@
+import json
+import os
+from collections import defaultdict
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import asset_v1
+
+from clients import get_client
+from nw_pycharm_2 import build_vpc_details, nat_router_id
+
+# Asset types read by the Cloud Asset Inventory backend, all in one paged list_assets sweep
+ASSET_TYPES = [
+    "cloudresourcemanager.googleapis.com/Folder",
+    "cloudresourcemanager.googleapis.com/Project",
+    "compute.googleapis.com/Network",
+    "compute.googleapis.com/Subnetwork",
+    "compute.googleapis.com/Router",
+    "compute.googleapis.com/GlobalAddress",
+]
+
+# Point the backend at a local fake or emulator, e.g. "http://localhost:8080"
+ASSET_API_ENDPOINT = os.environ.get('ASSET_API_ENDPOINT', '')
+# Or serve the assets from a JSON file with FakeAssetServiceClient
+ASSET_FIXTURE = os.environ.get('ASSET_FIXTURE', '')
+
+
+class FakeAssetServiceClient:
+    """Local stand-in for AssetServiceClient that serves list_assets from a list of asset dicts.
+
+    Assets use the dictionary shape list_org_assets yields. An asset is returned for a parent
+    when the parent is one of its 'ancestors', or when it has no ancestors.
+    """
+
+    def __init__(self, assets):
+        self.assets = assets
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def list_assets(self, request):
+        asset_types = set(request.asset_types)
+        return [
+            asset for asset in self.assets
+            if (not asset_types or asset['asset_type'] in asset_types)
+            and request.parent in asset.get('ancestors', [request.parent])
+        ]
+
+
+def get_asset_client():
+    if ASSET_FIXTURE:
+        return FakeAssetServiceClient.from_file(ASSET_FIXTURE)
+    if ASSET_API_ENDPOINT:
+        return asset_v1.AssetServiceClient(
+            credentials=AnonymousCredentials(),
+            transport="rest",
+            client_options={"api_endpoint": ASSET_API_ENDPOINT}
+        )
+    return get_client(asset_v1.AssetServiceClient)
+
+
+def list_org_assets(client, organization_id, asset_types=ASSET_TYPES, page_size=1000):
+    """Yields every asset of the given types in an organization as a dictionary.
+
+    Args:
+        client: asset_v1.AssetServiceClient, or any object with a compatible list_assets method.
+        organization_id: The organization ID.
+        asset_types: Cloud Asset Inventory asset types to list.
+        page_size: Assets per page.
+
+    Yields:
+        Assets as dictionaries with 'name', 'asset_type', 'ancestors' and 'resource', whose
+        'data' holds the resource in its REST (camelCase) representation.
+    """
+    request = asset_v1.ListAssetsRequest(
+        parent=f"organizations/{organization_id}",
+        asset_types=asset_types,
+        content_type=asset_v1.ContentType.RESOURCE,
+        page_size=page_size
+    )
+    for asset in client.list_assets(request=request):
+        yield asset if isinstance(asset, dict) else asset_v1.Asset.to_dict(asset)
+
+
+def resource_parent(asset):
+    """Returns the parent of a folder or project asset as a resource name, e.g. "folders/123"."""
+    parent = asset['resource'].get('parent', '')
+    if parent:
+        return parent.split('googleapis.com/')[-1]
+    data_parent = asset['resource']['data'].get('parent', '')
+    if isinstance(data_parent, dict):
+        return f"{data_parent['type']}s/{data_parent['id']}"
+    return data_parent
+
+
+def self_link_project(url):
+    """Returns the project ID of a compute selfLink or network URL."""
+    return url.split('/projects/')[-1].split('/')[0]
+
+
+def is_active(data):
+    return data.get('lifecycleState', data.get('state', 'ACTIVE')) == 'ACTIVE'
+
+
+def collect_org_from_assets(organization_id, client=None):
+    """Collects the folders, projects, networks, subnets, routers and PSA ranges of an organization.
+
+    Everything comes from the paged list_assets sweep of list_org_assets, instead of
+    per-project Compute Engine calls. Shared VPC hosts are not part of these assets, every
+    inventory has xpn_host None until resolve_shared_vpc sets it.
+
+    Args:
+        organization_id: The organization ID.
+        client: Optional asset client, get_asset_client() is used when omitted.
+
+    Returns:
+        A tuple of (containers, inventories) in the shapes returned by discover_hierarchy and
+        collect_inventories, ready for assemble_graph.
+    """
+    if client is None:
+        client = get_asset_client()
+
+    folders_by_parent = defaultdict(list)
+    projects_by_parent = defaultdict(list)
+    network_names = defaultdict(list)
+    peerings = defaultdict(list)
+    subnets = defaultdict(lambda: defaultdict(list))
+    nat_configs = defaultdict(dict)
+    psa_ranges = defaultdict(list)
+
+    for asset in list_org_assets(client, organization_id):
+        asset_type = asset['asset_type']
+        data = asset['resource']['data']
+
+        if asset_type == "cloudresourcemanager.googleapis.com/Folder":
+            if is_active(data):
+                folders_by_parent[resource_parent(asset)].append({
+                    "name": data.get('name') or asset['name'].split('googleapis.com/')[-1],
+                    "display_name": data.get('displayName', ''),
+                    "state": data.get('lifecycleState', data.get('state')),
+                    "etag": data.get('etag'),
+                    "update_time": data.get('updateTime')
+                })
+
+        elif asset_type == "cloudresourcemanager.googleapis.com/Project":
+            if is_active(data):
+                projects_by_parent[resource_parent(asset)].append({
+                    "project_id": data['projectId'],
+                    "name": f"projects/{data.get('projectNumber', '')}",
+                    "create_time": data.get('createTime'),
+                    "update_time": data.get('updateTime'),
+                    "etag": data.get('etag'),
+                    "labels": data.get('labels', {})
+                })
+
+        elif asset_type == "compute.googleapis.com/Network":
+            project_id = self_link_project(data['selfLink'])
+            network_names[project_id].append(data['name'])
+            for peering in data.get('peerings', []):
+                peerings[project_id].append({
+                    'network': data['name'],
+                    'name': peering.get('name', ''),
+                    'peered_network': peering.get('network', ''),
+                    'state': peering.get('state', ''),
+                    'auto_create_routes': peering.get('autoCreateRoutes', False)
+                })
+
+        elif asset_type == "compute.googleapis.com/Subnetwork":
+            project_id = self_link_project(data['selfLink'])
+            subnets[project_id][data['network'].split('/')[-1]].append({
+                'name': data['name'],
+                'region': data['region'].split('/')[-1],
+                'ip_cidr_range': data.get('ipCidrRange', ''),
+                'private_ip_google_access': data.get('privateIpGoogleAccess', False),
+                'fingerprint': data.get('fingerprint', ''),
+                'secondary_ip_ranges': [
+                    {'range_name': range['rangeName'], 'ip_cidr_range': range['ipCidrRange']}
+                    for range in data.get('secondaryIpRanges', [])
+                ]
+            })
+
+        elif asset_type == "compute.googleapis.com/Router":
+            project_id = self_link_project(data['selfLink'])
+            router_id = nat_router_id(project_id, data['region'].split('/')[-1], data['name'])
+            nat_configs[project_id][router_id] = [
+                {
+                    'name': nat['name'],
+                    'region': data['region'].split('/')[-1],
+                    'vpc_network': data['network'].split('/')[-1]
+                }
+                for nat in data.get('nats', [])
+            ]
+
+        elif asset_type == "compute.googleapis.com/GlobalAddress":
+            if data.get('purpose') == "VPC_PEERING":
+                psa_ranges[self_link_project(data['selfLink'])].append({
+                    'name': data['name'],
+                    'network': data.get('network', '').split('/')[-1],
+                    'address': data.get('address', 'N/A'),
+                    'prefix_length': data.get('prefixLength', 'N/A')
+                })
+
+    # rebuild the breadth-first container list discover_hierarchy returns
+    containers = []
+    wave = [f"organizations/{organization_id}"]
+    level = 0
+    while wave:
+        next_wave = []
+        for parent in wave:
+            folders = sorted(folders_by_parent.get(parent, []), key=lambda folder: folder['display_name'])
+            projects = sorted(projects_by_parent.get(parent, []), key=lambda project: project['project_id'])
+            containers.append({"parent": parent, "level": level, "folders": folders, "projects": projects})
+            next_wave.extend(folder['name'] for folder in folders)
+        wave = next_wave
+        level += 1
+
+    inventories = {}
+    for container in containers:
+        for project in container['projects']:
+            project_id = project['project_id']
+            inventories[project_id] = {
+                "project_id": project_id,
+                "vpc_details": build_vpc_details(network_names.get(project_id, []), subnets[project_id]),
+                "vpc_peering_pairs": peerings.get(project_id, []),
+                "nat_configs_by_router": nat_configs.get(project_id, {}),
+                "psa_ranges": psa_ranges.get(project_id, []),
+                "xpn_host": None,
+                "reused": False,
+                "errors": {}
+            }
+
+    return containers, inventories
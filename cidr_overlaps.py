@@ -0,0 +1,220 @@
+import heapq
+import ipaddress
+from array import array
+from collections import defaultdict
+
+from graph_builder import OVERLAP_EDGE_STYLE
+
+# Edges between VPCs whose ranges must not overlap
+PEERING_EDGE_KINDS = ("vpc-peering", "psa-peering")
+
+
+def collect_ranges(nodes):
+    """Flattens the 'ranges' of graph nodes: subnet primary and secondary ranges and PSA ranges.
+
+    Args:
+        nodes: Graph nodes, the ones with 'ranges' also carry the id of their 'vpc' node.
+
+    Returns:
+        A tuple of the range rows, dictionaries with the 'node', 'vpc', 'name', 'type' and
+        'cidr' of every IPv4 range, and the array('Q') columns of their first and last address.
+    """
+    rows = []
+    starts = array('Q')
+    ends = array('Q')
+    for node in nodes:
+        for ip_range in node.get('ranges') or []:
+            try:
+                network = ipaddress.ip_network(ip_range['cidr'], strict=False)
+            except ValueError:
+                continue
+            if network.version != 4:
+                continue
+            rows.append({
+                "node": node['id'],
+                "vpc": node.get('vpc'),
+                "name": ip_range.get('name'),
+                "type": ip_range.get('type'),
+                "cidr": str(network)
+            })
+            starts.append(int(network.network_address))
+            ends.append(int(network.broadcast_address))
+    return rows, starts, ends
+
+
+def table_ranges(tables, with_project=False):
+    """collect_ranges of a snapshot, read from the ranges table of its GraphTables without
+    decoding the nodes.
+
+    Args:
+        tables: GraphTables of a snapshot.
+        with_project: Also give every row the 'project' of its node.
+    """
+    rows = []
+    starts = array('Q')
+    ends = array('Q')
+    nodes, ranges = tables.nodes, tables.ranges
+    for position in range(tables.range_count):
+        prefix_length = ranges['prefix_length'][position]
+        if prefix_length < 0:
+            continue
+        node = ranges['node'][position]
+        network = ranges['network'][position]
+        row = {
+            "node": tables.string(nodes['id'][node]),
+            "vpc": tables.string(nodes['vpc'][node]),
+            "name": tables.string(ranges['name'][position]),
+            "type": tables.string(ranges['type'][position]),
+            "cidr": f"{ipaddress.IPv4Address(network)}/{prefix_length}"
+        }
+        if with_project:
+            row["project"] = tables.string(nodes['project_id'][node])
+        rows.append(row)
+        starts.append(network)
+        ends.append(network + (1 << (32 - prefix_length)) - 1)
+    return rows, starts, ends
+
+
+def find_overlaps(starts, ends):
+    """Finds every pair of overlapping ranges with one sort and one sweep.
+
+    Identical ranges are grouped first, so the thousands of copies of e.g. a default VPC range
+    count as one interval. The distinct intervals are sorted by start, widest first, and swept
+    with a heap of the intervals still open: each interval overlaps exactly the open ones. CIDR
+    blocks are either nested or disjoint, so every overlap is a containment. The cost is
+    O(n log n) plus the number of overlapping pairs.
+
+    Args:
+        starts: First address of every range.
+        ends: Last address of every range.
+
+    Returns:
+        A tuple of the groups, lists of the indexes of identical ranges, and the (outer, inner)
+        index pairs of groups where the outer one contains the inner one.
+    """
+    group_of = {}
+    groups = []
+    for row in range(len(starts)):
+        key = (starts[row], ends[row])
+        group = group_of.get(key)
+        if group is None:
+            group = group_of[key] = len(groups)
+            groups.append([])
+        groups[group].append(row)
+
+    group_starts = array('Q', (starts[rows[0]] for rows in groups))
+    group_ends = array('Q', (ends[rows[0]] for rows in groups))
+    order = sorted(range(len(groups)), key=lambda group: (group_starts[group], -group_ends[group]))
+
+    pairs = []
+    open_groups = []
+    for group in order:
+        start = group_starts[group]
+        while open_groups and open_groups[0][0] < start:
+            heapq.heappop(open_groups)
+        pairs.extend((outer, group) for _, outer in open_groups)
+        heapq.heappush(open_groups, (group_ends[group], group))
+    return groups, pairs
+
+
+def peered_vpcs(edges):
+    """Returns the VPCs each VPC is peered with, from the (from, to, kind) of the edges of a graph."""
+    peers = defaultdict(set)
+    for from_id, to_id, kind in edges:
+        if kind in PEERING_EDGE_KINDS:
+            peers[from_id].add(to_id)
+            peers[to_id].add(from_id)
+    return peers
+
+
+def analyze_overlaps(graph_data):
+    """Finds the overlapping ranges of a graph and the conflicts among them, see analyze_ranges."""
+    rows, starts, ends = collect_ranges(graph_data['nodes'])
+    peers = peered_vpcs((edge['from'], edge['to'], edge['kind']) for edge in graph_data['edges'])
+    return analyze_ranges(rows, starts, ends, peers)
+
+
+def analyze_ranges(rows, starts, ends, peers):
+    """Finds the overlapping ranges and the conflicts among them.
+
+    A conflict is an overlap between ranges of two different nodes of the same VPC or of two
+    peered VPCs, where the overlap breaks routing. Overlaps between unconnected VPCs are
+    reported, but not as conflicts.
+
+    Args:
+        rows, starts, ends: Ranges, as returned by collect_ranges or table_ranges.
+        peers: Peered VPCs of every VPC, as returned by peered_vpcs.
+
+    Returns:
+        A dictionary with the 'range_count', the 'overlaps' between CIDRs, each with the
+        'ranges' using the 'cidr' and the 'overlapping_ranges' using the 'overlapping_cidr' it
+        contains, and the 'conflicts' between two ranges with their 'scope', "same-vpc" or
+        "peered".
+    """
+    groups, pairs = find_overlaps(starts, ends)
+
+    overlaps = []
+    conflicts = []
+
+    def add_conflicts(outer_rows, inner_rows):
+        inner_by_vpc = defaultdict(list)
+        for row in inner_rows:
+            inner_by_vpc[rows[row]['vpc']].append(row)
+        for outer in outer_rows:
+            vpc = rows[outer]['vpc']
+            if vpc is None:
+                continue
+            for scope, vpcs in (("same-vpc", [vpc]), ("peered", peers.get(vpc, ()))):
+                for inner_vpc in vpcs:
+                    for inner in inner_by_vpc.get(inner_vpc, []):
+                        # identical ranges are seen from both sides, keep one
+                        if rows[outer]['node'] != rows[inner]['node'] and (outer_rows is not inner_rows or outer < inner):
+                            conflicts.append({"scope": scope, "range": rows[outer], "overlapping_range": rows[inner]})
+
+    for group_rows in groups:
+        if len(group_rows) > 1:
+            cidr = rows[group_rows[0]]['cidr']
+            overlaps.append({
+                "cidr": cidr,
+                "overlapping_cidr": cidr,
+                "ranges": [rows[row] for row in group_rows],
+                "overlapping_ranges": []
+            })
+            add_conflicts(group_rows, group_rows)
+    for outer, inner in pairs:
+        overlaps.append({
+            "cidr": rows[groups[outer][0]]['cidr'],
+            "overlapping_cidr": rows[groups[inner][0]]['cidr'],
+            "ranges": [rows[row] for row in groups[outer]],
+            "overlapping_ranges": [rows[row] for row in groups[inner]]
+        })
+        add_conflicts(groups[outer], groups[inner])
+
+    return {"range_count": len(rows), "overlaps": overlaps, "conflicts": conflicts}
+
+
+def add_overlap_edges(graph):
+    """Adds an "overlap" edge, highlighted with OVERLAP_EDGE_STYLE, between the nodes of every
+    conflict found by analyze_overlaps."""
+    labels = defaultdict(list)
+    for conflict in analyze_overlaps(graph.to_graph_data())['conflicts']:
+        first, second = conflict['range'], conflict['overlapping_range']
+        key = tuple(sorted((first['node'], second['node'])))
+        labels[key].append(f"{first['cidr']} / {second['cidr']}")
+    for (from_id, to_id), overlapping in labels.items():
+        label = "overlap " + overlapping[0] + (f" (+{len(overlapping) - 1})" if len(overlapping) > 1 else "")
+        graph.add_edge(from_id, to_id, "overlap", label=label, title="\n".join(overlapping), **OVERLAP_EDGE_STYLE)
+
+
+def snapshot_overlaps(snapshot):
+    """Returns the analyze_overlaps result of a Snapshot, computed once per snapshot."""
+    def analyze(snapshot):
+        tables = snapshot.tables
+        edges = tables.edges
+        peerings = (
+            (tables.string(edges['from'][row]), tables.string(edges['to'][row]), kind)
+            for row, kind in enumerate(tables.strings(edges['kind'])) if kind in PEERING_EDGE_KINDS
+        )
+        return analyze_ranges(*table_ranges(tables), peered_vpcs(peerings))
+
+    return snapshot.derived("overlaps", analyze)
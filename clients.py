@@ -0,0 +1,106 @@
+import json
+import threading
+import urllib.request
+
+from google.auth import default
+from googleapiclient import discovery, discovery_cache
+
+# Shared google-cloud clients keyed by (client class, credentials). Each client keeps its own
+# transport and connection pool, so building it once per process avoids paying for credential
+# resolution and channel setup on every call.
+_clients = {}
+_credentials = None
+_lock = threading.Lock()
+
+# Parsed discovery documents keyed by (service name, version), loaded once per process
+_documents = {}
+
+# Discovery services use httplib2, which is not thread-safe, so they are shared per thread
+_local = threading.local()
+
+
+def get_credentials():
+    """Returns the application default credentials, resolved once per process."""
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            _credentials, _ = default()
+        return _credentials
+
+
+def get_client(client_class, credentials=None):
+    """Returns the shared instance of a google-cloud client class.
+
+    Args:
+        client_class: A client class such as compute_v1.NetworksClient or
+            resourcemanager_v3.FoldersClient.
+        credentials: Optional credentials, application default credentials are used when omitted.
+
+    Returns:
+        The client created for this class and credentials, built on first use.
+    """
+    if credentials is None:
+        credentials = get_credentials()
+    key = (client_class, id(credentials))
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None:
+            # keep a reference to the credentials so their id is not reused while cached
+            entry = (credentials, client_class(credentials=credentials))
+            _clients[key] = entry
+    return entry[1]
+
+
+def get_discovery_document(service_name, version):
+    """Returns the parsed discovery document of an API, loaded once per process.
+
+    The document bundled with googleapiclient is used when there is one, otherwise it is
+    fetched from the discovery service. The compute document alone is about 5 MB of JSON, so
+    threads build their services from this copy instead of parsing it each.
+    """
+    key = (service_name, version)
+    with _lock:
+        document = _documents.get(key)
+    if document is None:
+        text = discovery_cache.get_static_doc(service_name, version)
+        if text is None:
+            with urllib.request.urlopen(discovery.DISCOVERY_URI.format(api=service_name, apiVersion=version)) as response:
+                text = response.read()
+        document = json.loads(text)
+        with _lock:
+            document = _documents.setdefault(key, document)
+    return document
+
+
+def get_discovery_service(service_name, version, credentials=None):
+    """Returns a googleapiclient discovery service, built once per thread and credentials from
+    the process-wide discovery document, see get_discovery_document.
+
+    Args:
+        service_name: API name, e.g. 'compute' or 'servicenetworking'.
+        version: API version, e.g. 'v1'.
+        credentials: Optional credentials, application default credentials are used when omitted.
+    """
+    if credentials is None:
+        credentials = get_credentials()
+    services = getattr(_local, 'services', None)
+    if services is None:
+        services = _local.services = {}
+    key = (service_name, version, id(credentials))
+    entry = services.get(key)
+    if entry is None:
+        entry = (credentials, discovery.build_from_document(get_discovery_document(service_name, version),
+                                                            credentials=credentials))
+        services[key] = entry
+    return entry[1]
+
+
+def clear_clients():
+    """Drops the cached credentials, clients and discovery documents, and the calling thread's
+    discovery services."""
+    global _credentials
+    with _lock:
+        _clients.clear()
+        _documents.clear()
+        _credentials = None
+    _local.__dict__.clear()
@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from nw_pycharm_2 import CrawlScope
+from org_crawler import get_organization_structure
+from graph_builder import GraphBuilder
+from graph_snapshot import crawl_lock, open_latest_snapshot, read_job_status, write_job_status, write_snapshot
+
+# Number of organizations crawled at the same time, later jobs wait in the queue
+CRAWL_WORKERS = int(os.environ.get('CRAWL_WORKERS', '2'))
+# Seconds the graph of a finished crawl, or its snapshot, is served before the organization
+# is crawled again
+CRAWL_RESULT_TTL = int(os.environ.get('CRAWL_RESULT_TTL', '900'))
+# Seconds between two writes of a crawling job's status to the organization's job status file,
+# and between two reads of it by the jobs of other processes waiting for that crawl
+JOB_STATUS_INTERVAL = float(os.environ.get('JOB_STATUS_INTERVAL', '1'))
+
+
+class CrawlJob:
+    """One background crawl of an organization, followed by any number of requests.
+
+    While the crawl runs, every node and edge its GraphBuilder adds is recorded as it is added,
+    so the requests following the job draw the graph while it is discovered. A publisher thread
+    replaces the job's 'progress' record, only the latest one is kept, every
+    JOB_STATUS_INTERVAL seconds. When the job finishes, its records are replaced by the last
+    one, which points to the snapshot the crawl wrote, see follow.
+
+    Jobs of the same organization in other processes are serialized with crawl_lock. A job
+    that finds a snapshot younger than result_ttl loads it instead of crawling, otherwise it
+    crawls and writes a new snapshot. A crawling job also publishes its status with
+    write_job_status, so every worker can report it, and a job waiting for the crawl of another
+    process follows that status as its own 'progress' records.
+    """
+
+    def __init__(self, organization_id, result_ttl=CRAWL_RESULT_TTL, **kwargs):
+        self.organization_id = organization_id
+        self.result_ttl = result_ttl
+        self.kwargs = kwargs
+        self.state = "queued"
+        self.progress = Counter()
+        self.warnings = []
+        self.records = []
+        self.progress_record = None
+        self.node_count = 0
+        self.edge_count = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.snapshot_stamp = None
+        self.from_snapshot = False
+        self.crawl = CrawlScope()
+        self.crawled = False
+        self.remote_status = None
+        # number of records dropped from the start of records when the job finished
+        self._dropped = 0
+        self._condition = threading.Condition()
+
+    def _record(self, record):
+        with self._condition:
+            self.records.append(record)
+            self._condition.notify_all()
+
+    def _record_progress(self, status):
+        with self._condition:
+            self.progress_record = {"type": "progress", "data": status}
+            self._condition.notify_all()
+
+    def _finish(self, record):
+        """Replaces the job's records with its last one, the graph is read from the snapshot."""
+        with self._condition:
+            self._dropped += len(self.records)
+            self.records = [record]
+            self._condition.notify_all()
+
+    def _listener(self, kind, item):
+        """GraphBuilder listener, records the node or edge. It runs under the builder's lock, the
+        progress is reported by _report_progress."""
+        self._record({"type": kind, "data": item})
+
+    def _report_progress(self, finished):
+        """Records and publishes the job's status every JOB_STATUS_INTERVAL until finished is set."""
+        while not finished.wait(JOB_STATUS_INTERVAL):
+            status = self.status()
+            self._record_progress(status)
+            self._publish(status)
+
+    def _publish(self, status=None):
+        """Writes the job's status to the job status file, see read_job_status."""
+        status = status or self.status()
+        try:
+            write_job_status(self.organization_id, dict(status, updated_at=time.time()))
+        except OSError as e:
+            print(f"Error writing the job status of organization {self.organization_id}: {str(e)}")
+
+    def _wait(self):
+        """Follows the crawl another process holds the crawl_lock for, see crawl_lock."""
+        self.state = "waiting"
+        remote_status = read_job_status(self.organization_id)
+        if remote_status is not None and remote_status != self.remote_status:
+            self.remote_status = remote_status
+            self._record_progress(self.status())
+
+    def run(self):
+        """Crawls the organization, called on a CrawlJobQueue worker."""
+        self.state = "running"
+        self.started_at = time.time()
+        try:
+            with crawl_lock(self.organization_id, on_wait=self._wait, poll_interval=JOB_STATUS_INTERVAL):
+                self.state = "running"
+                self.remote_status = None
+                snapshot = open_latest_snapshot(self.organization_id)
+                if snapshot is not None and snapshot.age() < self.result_ttl:
+                    self.from_snapshot = True
+                else:
+                    self.crawled = True
+                    self._publish()
+                    finished = threading.Event()
+                    publisher = threading.Thread(target=self._report_progress, args=(finished,),
+                                                 name=f"crawl-status-{self.organization_id}", daemon=True)
+                    publisher.start()
+                    try:
+                        graph = get_organization_structure(self.organization_id,
+                                                           graph=GraphBuilder(listener=self._listener),
+                                                           progress=self.progress, warnings=self.warnings,
+                                                           crawl=self.crawl, **self.kwargs)
+                    finally:
+                        finished.set()
+                        publisher.join()
+                    write_snapshot(self.organization_id, graph)
+                    snapshot = open_latest_snapshot(self.organization_id)
+                self.snapshot_stamp = snapshot.stamp
+                self.node_count, self.edge_count = snapshot.tables.node_count, snapshot.tables.edge_count
+        except Exception as e:
+            print(f"Crawl of organization {self.organization_id} failed: {str(e)}")
+            self.error = e
+            self.finished_at = time.time()
+            self.state = "failed"
+            if self.crawled:
+                self._publish()
+            self._finish({"type": "error", "exception": e})
+            return
+        self.finished_at = time.time()
+        self.state = "done"
+        if self.crawled:
+            self._publish()
+        self._finish({"type": "done", "nodes": self.node_count, "edges": self.edge_count,
+                      "snapshot": self.snapshot_stamp})
+
+    def is_finished(self):
+        return self.state in ("done", "failed")
+
+    def is_expired(self, result_ttl, now=None):
+        return self.is_finished() and (now or time.time()) - self.finished_at >= result_ttl
+
+    def follow(self):
+        """Yields the job's records from the start, waiting for new ones until the job finishes.
+
+        Records are {'type': 'node'} and {'type': 'edge'} with the 'data' the GraphBuilder
+        added while the job crawls, and {'type': 'progress', 'data': <status>} whenever the
+        latest status changed, while it crawls or waits for the crawl of another process. The
+        last record is {'type': 'done'} with the graph's node and edge counts and its snapshot
+        stamp, or {'type': 'error'}. Node and edge records not yet yielded when the job finishes
+        are skipped, the graph is then read from the snapshot.
+        """
+        index = 0
+        progress_record = None
+        while True:
+            with self._condition:
+                while (index == self._dropped + len(self.records)
+                       and self.progress_record is progress_record):
+                    self._condition.wait()
+                index = max(index, self._dropped)
+                records = self.records[index - self._dropped:]
+                index += len(records)
+                latest = self.progress_record
+            if latest is not progress_record:
+                progress_record = latest
+                yield latest
+            for record in records:
+                yield record
+                if record["type"] in ("done", "error"):
+                    return
+
+    def status(self):
+        """Returns the job's state and progress as a JSON-serializable dictionary.
+
+        Hierarchy listings are two per container (its folders and its projects), so the remaining
+        ones are known from the folders found so far. api_calls counts the compute list calls
+        made by this job's crawl only. A 'waiting' job reports the status of the crawl it waits
+        for, as published by the process running it.
+        """
+        if self.state == "waiting" and self.remote_status is not None:
+            return dict(self.remote_status, state="waiting", created_at=self.created_at)
+        progress = self.progress
+        listings_total = 2 * (1 + progress['folders'])
+        now = self.finished_at or time.time()
+        return {
+            "organization_id": self.organization_id,
+            "state": self.state,
+            "folders": progress['folders'],
+            "projects": progress['projects'],
+            "listings_done": progress['listings_done'],
+            "listings_remaining": max(listings_total - progress['listings_done'], 0),
+            "projects_collected": progress['projects_collected'],
+            "projects_remaining": max(progress['projects'] - progress['projects_collected'], 0),
+            "api_calls": self.crawl.api_call_total(),
+            "created_at": self.created_at,
+            "elapsed": round(now - (self.started_at or now), 1),
+            "snapshot": self.snapshot_stamp,
+            "from_snapshot": self.from_snapshot,
+            "error": str(self.error) if self.error else None,
+            "warnings": list(self.warnings)
+        }
+
+
+class CrawlJobQueue:
+    """Runs crawl jobs on a bounded worker pool, at most one live job per organization."""
+
+    def __init__(self, max_workers=CRAWL_WORKERS, result_ttl=CRAWL_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl")
+
+    def submit(self, organization_id, **kwargs):
+        """Returns the queued, running or unexpired finished job of an organization, or starts one.
+
+        Failed jobs are not reused, asking again retries the crawl.
+
+        Args:
+            organization_id: The organization ID.
+            **kwargs: Passed to get_organization_structure when a new job is started.
+        """
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(organization_id)
+            if job is None or job.state == "failed":
+                job = self._jobs[organization_id] = CrawlJob(organization_id, self.result_ttl, **kwargs)
+                self._executor.submit(job.run)
+            return job
+
+    def get(self, organization_id):
+        """Returns the organization's job, or None when there is none or its result expired."""
+        with self._lock:
+            self._purge_expired()
+            return self._jobs.get(organization_id)
+
+    def status(self, organization_id):
+        """Returns the status of the organization's job in this process, or else the status the
+        job of another process published, or None."""
+        job = self.get(organization_id)
+        if job is not None:
+            return job.status()
+        return read_job_status(organization_id)
+
+    def jobs(self):
+        with self._lock:
+            self._purge_expired()
+            return list(self._jobs.values())
+
+    def _purge_expired(self):
+        now = time.time()
+        for organization_id, job in list(self._jobs.items()):
+            if job.is_expired(self.result_ttl, now):
+                del self._jobs[organization_id]
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_crawl_jobs():
+    """Returns the process-wide CrawlJobQueue."""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = CrawlJobQueue()
+        return _default_queue
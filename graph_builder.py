@@ -0,0 +1,126 @@
+import threading
+from collections import defaultdict
+
+# vis.js colors of each node kind
+NODE_COLORS = {
+    "organization": "#4169E1",  # Royal Blue for organization
+    "folder": "#FFA500",  # Orange for folders
+    "project": "#90EE90",  # Light green for projects
+    "vpc": "#90d8ee",  # cyan color for vpc
+    "subnet": "#ee90b7",  # pink color for subnets
+    "nat": "#e3d914",  # yellow color for cloud nat
+}
+
+# vis.js style of the dashed relationship edges (peerings, shared VPC)
+RELATION_EDGE_STYLE = {"dashes": "true", "color": "#140f0f", "smooth": {"type": "curvedCCW", "roundness": 0.2}}
+# vis.js style of the highlighted edges between overlapping CIDR ranges
+OVERLAP_EDGE_STYLE = {"color": "#e0201b", "width": 3, "smooth": {"type": "curvedCW", "roundness": 0.2}}
+
+
+class GraphBuilder:
+    """Thread-safe builder of the vis.js organization graph.
+
+    Nodes are indexed by id and edges by (from, to, kind), so adding an existing node or edge
+    updates it in place instead of creating a duplicate. nodes and edges are returned in the
+    order they were first added, which depends on which project of a crawl finished first;
+    to_graph_data returns them in a canonical order instead, so identical crawls give identical
+    layouts and snapshots.
+
+    An optional listener is called as listener("node", node) or listener("edge", edge) with a
+    copy of every node or edge added or updated, in the order the changes were made.
+    """
+
+    def __init__(self, listener=None):
+        self._nodes = {}
+        self._edges = {}
+        self._project_nodes = defaultdict(list)
+        self._lock = threading.Lock()
+        self._listener = listener
+
+    def add_node(self, node_id, kind, label, level, project_id=None, **attributes):
+        """Adds a node, or updates the attributes of the node with this id.
+
+        Args:
+            node_id: Unique node id.
+            kind: Node kind, one of NODE_COLORS; also picks the default color.
+            label: vis.js label.
+            level: Hierarchical level of the node.
+            project_id: Project the node belongs to, kept as its 'project_id' and indexed for
+                project_node_ids.
+            **attributes: Other vis.js node attributes, e.g. color.
+        """
+        with self._lock:
+            node = self._nodes.get(node_id)
+            if node is None:
+                node = self._nodes[node_id] = {"id": node_id}
+                if project_id is not None:
+                    self._project_nodes[project_id].append(node_id)
+            node.update({"label": label, "level": level, "color": NODE_COLORS.get(kind), "kind": kind})
+            if project_id is not None:
+                node["project_id"] = project_id
+            node.update(attributes)
+            if self._listener is not None:
+                self._listener("node", dict(node))
+            return node
+
+    def add_edge(self, from_id, to_id, kind="parent", **attributes):
+        """Adds an edge, or updates the attributes of the edge with the same (from, to, kind)."""
+        key = (from_id, to_id, kind)
+        with self._lock:
+            edge = self._edges.get(key)
+            if edge is None:
+                edge = self._edges[key] = {"from": from_id, "to": to_id, "kind": kind}
+            edge.update(attributes)
+            if self._listener is not None:
+                self._listener("edge", dict(edge))
+            return edge
+
+    def add_node_data(self, node):
+        """Adds a node dictionary as to_graph_data returns it, e.g. one of another graph."""
+        node = dict(node)
+        return self.add_node(node.pop('id'), node.pop('kind', None), node.pop('label', ''), node.pop('level', 0), **node)
+
+    def add_edge_data(self, edge):
+        """Adds an edge dictionary as to_graph_data returns it, e.g. one of another graph."""
+        edge = dict(edge)
+        return self.add_edge(edge.pop('from'), edge.pop('to'), edge.pop('kind', 'parent'), **edge)
+
+    @classmethod
+    def from_graph_data(cls, graph_data, listener=None):
+        """Rebuilds a graph from the dictionary to_graph_data returns, e.g. a loaded snapshot."""
+        graph = cls(listener=listener)
+        for node in graph_data['nodes']:
+            graph.add_node_data(node)
+        for edge in graph_data['edges']:
+            graph.add_edge_data(edge)
+        return graph
+
+    def get_node(self, node_id):
+        """Returns the node with this id, or None."""
+        return self._nodes.get(node_id)
+
+    def project_node_ids(self, project_id):
+        """Returns the ids of the nodes added with this project_id, e.g. the subtree of a project
+        an incremental crawl copies from the previous one (see org_crawler.copy_project_resources).
+        """
+        return list(self._project_nodes.get(project_id, []))
+
+    @property
+    def nodes(self):
+        with self._lock:
+            return list(self._nodes.values())
+
+    @property
+    def edges(self):
+        with self._lock:
+            return list(self._edges.values())
+
+    def to_graph_data(self):
+        """Returns the graph in the {'nodes': [...], 'edges': [...]} shape vis.js DataSets take.
+
+        Nodes are sorted by level and id, so every node comes after the nodes of the levels above
+        it, and edges by (from, to, kind).
+        """
+        nodes = sorted(self.nodes, key=lambda node: (node.get('level') or 0, str(node['id'])))
+        edges = sorted(self.edges, key=lambda edge: (str(edge['from']), str(edge['to']), edge['kind']))
+        return {"nodes": nodes, "edges": edges}
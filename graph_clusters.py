@@ -0,0 +1,253 @@
+import threading
+from collections import Counter, defaultdict
+
+from graph_layout import with_layout
+
+# Edges that make up the containment tree: org > folders > projects > VPCs > subnets and NATs.
+# Every other edge kind (peerings, shared VPC, ...) is a relation between two tree nodes.
+HIERARCHY_EDGE_KINDS = ("parent", "nat")
+
+# Suffix of the id of the node the subnets of a VPC are rolled up into
+SUBNETS_CLUSTER_SUFFIX = "|subnets"
+
+
+class GraphClusters:
+    """Collapsed view of a graph, with the expansion of every cluster computed on first use.
+
+    Folders are clusters: collapsed, a folder node summarizes everything below it with counts.
+    The subnets of a VPC are rolled up into one node with the id '<vpc id>|subnets'. Projects,
+    VPCs and NATs are always shown with their parent.
+
+    Relation edges are drawn between the visible nodes closest to their endpoints, counted when
+    several relations meet between the same two nodes. Each relation is returned with the
+    'from_path' and 'to_path' of its endpoints, the clusters containing them outermost first
+    and then the endpoint itself, so a client can redraw it on the nodes it currently shows.
+
+    The view is laid out with layered_layout. The nodes of an expansion are laid out on their
+    own, with x relative to the expanded cluster's node ('relative_to'), so a client places them
+    under the cluster wherever it is drawn.
+
+    The structure only needs the node ids and kinds and the hierarchy edges, nodes and edges
+    are decoded when they are shown, see from_tables.
+    """
+
+    def __init__(self, kinds, node, hierarchy, edge, relations):
+        """Builds the view of a graph.
+
+        Args:
+            kinds: Dictionary of the kind of every node id, in graph order.
+            node: Function returning the node dictionary of a node id.
+            hierarchy: (key, from, to, kind) of every hierarchy edge, in graph order.
+            edge: Function returning the edge dictionary of a hierarchy edge key.
+            relations: Dictionaries of every other edge.
+        """
+        self.kinds = kinds
+        self._node = node
+        self._edge = edge
+        self.children = defaultdict(list)
+        self.parents = {}
+        for key, from_id, to_id, _ in hierarchy:
+            if to_id not in self.parents:
+                self.parents[to_id] = from_id
+                self.children[from_id].append((key, to_id))
+
+        self.counts = {}
+        for node_id in self.kinds:
+            if self.is_folder(node_id):
+                self._count(node_id)
+
+        self.relations = [
+            dict(edge, from_path=self.cluster_path(edge['from']), to_path=self.cluster_path(edge['to']))
+            for edge in relations
+        ]
+        self.relations_by_cluster = defaultdict(list)
+        for relation in self.relations:
+            for cluster_id in set(relation['from_path'][:-1] + relation['to_path'][:-1]):
+                self.relations_by_cluster[cluster_id].append(relation)
+
+        roots = [node_id for node_id in self.kinds if node_id not in self.parents]
+        view_nodes, view_edges = [], []
+        for root in roots:
+            view_nodes.append(self.summary_node(root) if self.is_folder(root) else self._node(root))
+            self._add_children(root, view_nodes, view_edges)
+        visible = {node['id'] for node in view_nodes}
+        self.view = with_layout({
+            "nodes": view_nodes,
+            "edges": view_edges + aggregate_relations(self.relations, visible)
+        })
+
+        self.expansions = {}
+        self._expansions_lock = threading.Lock()
+
+    @classmethod
+    def from_graph_data(cls, graph_data):
+        nodes = {node['id']: node for node in graph_data['nodes']}
+        hierarchy = [
+            (edge, edge['from'], edge['to'], edge['kind'])
+            for edge in graph_data['edges'] if edge['kind'] in HIERARCHY_EDGE_KINDS
+        ]
+        relations = [edge for edge in graph_data['edges'] if edge['kind'] not in HIERARCHY_EDGE_KINDS]
+        return cls({node_id: node.get('kind') for node_id, node in nodes.items()}, nodes.get, hierarchy,
+                   lambda edge: edge, relations)
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Builds the view of a snapshot's GraphTables from its id, kind and edge columns."""
+        node_ids = tables.strings(tables.nodes['id'])
+        rows = {node_id: row for row, node_id in enumerate(node_ids)}
+        edge_kinds = tables.strings(tables.edges['kind'])
+        hierarchy = [
+            (row, tables.string(tables.edges['from'][row]), tables.string(tables.edges['to'][row]), kind)
+            for row, kind in enumerate(edge_kinds) if kind in HIERARCHY_EDGE_KINDS
+        ]
+        relations = [tables.edge(row) for row, kind in enumerate(edge_kinds) if kind not in HIERARCHY_EDGE_KINDS]
+        return cls(dict(zip(node_ids, tables.strings(tables.nodes['kind']))),
+                   lambda node_id: tables.node(rows[node_id]), hierarchy, tables.edge, relations)
+
+    def _kind(self, node_id):
+        return self.kinds.get(node_id)
+
+    def is_folder(self, node_id):
+        return self._kind(node_id) == "folder"
+
+    def _count(self, node_id):
+        """Counts the nodes below node_id by kind, memoized per node."""
+        counts = self.counts.get(node_id)
+        if counts is None:
+            counts = Counter()
+            for _, child_id in self.children.get(node_id, []):
+                counts[self._kind(child_id)] += 1
+                counts.update(self._count(child_id))
+            self.counts[node_id] = counts
+        return counts
+
+    def summary_node(self, folder_id):
+        """Returns the collapsed node of a folder, labelled with what it contains."""
+        node = self._node(folder_id)
+        counts = self._count(folder_id)
+        return dict(
+            node,
+            label=(f"{node['label']}\n{counts['folder']} folders, {counts['project']} projects\n"
+                   f"{counts['vpc']} VPCs, {counts['subnet']} subnets"),
+            cluster="folder",
+            counts=dict(counts)
+        )
+
+    def cluster_path(self, node_id):
+        """Returns the clusters containing a node, outermost first, followed by the node."""
+        path = []
+        parent = self.parents.get(node_id)
+        while parent is not None:
+            if self.is_folder(parent):
+                path.append(parent)
+            parent = self.parents.get(parent)
+        path.reverse()
+        if self._kind(node_id) == "subnet" and node_id in self.parents:
+            path.append(self.parents[node_id] + SUBNETS_CLUSTER_SUFFIX)
+        path.append(node_id)
+        return path
+
+    def _add_children(self, node_id, nodes, edges):
+        """Adds what is shown below an expanded node: folders collapsed, subnets rolled up and
+        the whole subtree of every other child."""
+        subnet_count = 0
+        for key, child_id in self.children.get(node_id, []):
+            kind = self._kind(child_id)
+            if kind == "subnet":
+                subnet_count += 1
+                continue
+            edges.append(with_edge_id(self._edge(key)))
+            if kind == "folder":
+                nodes.append(self.summary_node(child_id))
+            else:
+                nodes.append(self._node(child_id))
+                self._add_children(child_id, nodes, edges)
+        if subnet_count:
+            cluster_id = node_id + SUBNETS_CLUSTER_SUFFIX
+            node = self._node(node_id)
+            nodes.append({
+                "id": cluster_id,
+                "label": f"{subnet_count} subnets",
+                "level": node.get('level', 0) + 1,
+                "color": node.get('color'),
+                "kind": "subnet",
+                "cluster": "subnets",
+                "counts": {"subnet": subnet_count}
+            })
+            edges.append(with_edge_id({"from": node_id, "to": cluster_id, "kind": "parent"}))
+
+    def expand(self, cluster_id):
+        """Returns the 'nodes', 'edges', 'relations' and node ids to 'remove' when a cluster is
+        expanded, or None for an unknown cluster. Expansions are computed once per cluster."""
+        with self._expansions_lock:
+            if cluster_id not in self.expansions:
+                self.expansions[cluster_id] = self._expansion(cluster_id)
+            return self.expansions[cluster_id]
+
+    def _expansion(self, cluster_id):
+        if self.is_folder(cluster_id):
+            nodes, edges = [self._node(cluster_id)], []
+            self._add_children(cluster_id, nodes, edges)
+            expansion = {"nodes": nodes, "edges": edges, "remove": []}
+        elif cluster_id.endswith(SUBNETS_CLUSTER_SUFFIX):
+            node_id = cluster_id[:-len(SUBNETS_CLUSTER_SUFFIX)]
+            subnets = [(key, child_id) for key, child_id in self.children.get(node_id, [])
+                       if self._kind(child_id) == "subnet"]
+            if not subnets:
+                return None
+            expansion = {
+                "nodes": [self._node(child_id) for _, child_id in subnets],
+                "edges": [with_edge_id(self._edge(key)) for key, _ in subnets],
+                "remove": [cluster_id]
+            }
+        else:
+            return None
+        laid_out = with_layout(expansion)['nodes']
+        origin = next((node['x'] for node in laid_out if node['id'] == cluster_id), 0.0)
+        for node in laid_out:
+            node['x'] -= origin
+        expansion["nodes"] = laid_out
+        expansion["relative_to"] = cluster_id
+        expansion["relations"] = self.relations_by_cluster.get(cluster_id, [])
+        return expansion
+
+
+def with_edge_id(edge):
+    """Returns a copy of an edge with the 'id' the graph stream gives it, from|to|kind."""
+    return dict(edge, id=f"{edge['from']}|{edge['to']}|{edge['kind']}")
+
+
+def aggregate_relations(relations, visible):
+    """Draws relations between the visible nodes closest to their endpoints.
+
+    Args:
+        relations: Relation edges with their 'from_path' and 'to_path'.
+        visible: Set of the ids of the visible nodes.
+
+    Returns:
+        One edge per (from, to, kind) of visible nodes, labelled with the number of relations it
+        stands for when there are several. Relations inside one visible node are left out.
+    """
+    aggregated = {}
+    for relation in relations:
+        from_id = next((node_id for node_id in reversed(relation['from_path']) if node_id in visible), None)
+        to_id = next((node_id for node_id in reversed(relation['to_path']) if node_id in visible), None)
+        if from_id is None or to_id is None or from_id == to_id:
+            continue
+        key = (from_id, to_id, relation['kind'])
+        edge = aggregated.get(key)
+        if edge is None:
+            edge = aggregated[key] = {
+                name: value for name, value in relation.items() if name not in ("from_path", "to_path")
+            }
+            edge.update({"id": "|".join(key), "from": from_id, "to": to_id, "count": 0})
+        edge['count'] += 1
+    for edge in aggregated.values():
+        if edge['count'] > 1:
+            edge['label'] = f"{edge.get('label', edge['kind'])} x{edge['count']}"
+    return list(aggregated.values())
+
+
+def snapshot_clusters(snapshot):
+    """Returns the GraphClusters of a Snapshot, computed once per snapshot."""
+    return snapshot.derived("clusters", lambda snapshot: GraphClusters.from_tables(snapshot.tables))
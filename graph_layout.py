@@ -0,0 +1,142 @@
+import os
+from array import array
+from collections import defaultdict
+
+# Vertical distance between levels and horizontal distance between neighbouring leaves, the
+# levelSeparation and nodeSpacing the vis.js hierarchical layout used
+LEVEL_SEPARATION = 150
+NODE_SPACING = 200
+# Barycenter passes reordering siblings to shorten and uncross relation edges
+LAYOUT_SWEEPS = int(os.environ.get('LAYOUT_SWEEPS', '4'))
+
+# Edges that form the tree the layout follows, the others are relations between tree nodes
+TREE_EDGE_KINDS = ("parent", "nat")
+
+
+def layered_layout(graph_data, sweeps=LAYOUT_SWEEPS):
+    """Computes node coordinates for a layered top-down drawing of a graph.
+
+    Every node is placed on the row of its 'level'. The parent and nat edges form a tree whose
+    leaves get consecutive slots and whose inner nodes are centered over their children, so tree
+    edges never cross and nodes of one row never overlap. Crossings of the other edges are then
+    reduced with barycenter sweeps: the children of every node are reordered by the mean position
+    of the nodes their subtree is related to. A sweep is kept only if it shortens the relation
+    edges, the sweeps stop at the first one that does not.
+
+    The layout runs in plain Python over array('d') columns, like the snapshot tables: every
+    pass is linear in the nodes and edges apart from the sibling sorts, so numpy, which the
+    app does not depend on, would not change how it scales.
+
+    Args:
+        graph_data: The {'nodes': [...], 'edges': [...]} dictionary of GraphBuilder.to_graph_data.
+        sweeps: Number of barycenter sweeps.
+
+    Returns:
+        A tuple of two array('d') columns, the x and y of every node in graph_data['nodes'] order.
+    """
+    node_ids = [node['id'] for node in graph_data['nodes']]
+    index = {node_id: position for position, node_id in enumerate(node_ids)}
+    count = len(node_ids)
+
+    parent = array('l', [-1]) * count
+    children = defaultdict(list)
+    relations = defaultdict(list)
+    for edge in graph_data['edges']:
+        source, target = index.get(edge['from']), index.get(edge['to'])
+        if source is None or target is None or source == target:
+            continue
+        if edge['kind'] in TREE_EDGE_KINDS and parent[target] == -1 and not _is_ancestor(parent, target, source):
+            parent[target] = source
+            children[source].append(target)
+        else:
+            relations[source].append(target)
+            relations[target].append(source)
+
+    roots = [node for node in range(count) if parent[node] == -1]
+    order = _depth_first(roots, children)
+    x = _place(children, order, count)
+    length = _relation_length(relations, x)
+    for _ in range(sweeps):
+        if not relations:
+            break
+        # mean x of the related nodes of every subtree, summed bottom-up
+        total = array('d', [0.0]) * count
+        weight = array('d', [0.0]) * count
+        for node, neighbours in relations.items():
+            for neighbour in neighbours:
+                total[node] += x[neighbour]
+            weight[node] += len(neighbours)
+        for node in reversed(order):
+            if parent[node] != -1:
+                total[parent[node]] += total[node]
+                weight[parent[node]] += weight[node]
+
+        def barycenter(node):
+            return total[node] / weight[node] if weight[node] else x[node]
+
+        swept_children = {node: sorted(node_children, key=barycenter) for node, node_children in children.items()}
+        swept_roots = sorted(roots, key=barycenter)
+        swept_order = _depth_first(swept_roots, swept_children)
+        swept_x = _place(swept_children, swept_order, count)
+        swept_length = _relation_length(relations, swept_x)
+        if swept_length >= length:
+            break
+        children, roots, order, x, length = swept_children, swept_roots, swept_order, swept_x, swept_length
+
+    y = array('d', (float(node.get('level') or 0) * LEVEL_SEPARATION for node in graph_data['nodes']))
+    return x, y
+
+
+def _relation_length(relations, x):
+    """Total horizontal length of the relation edges, each counted from both ends."""
+    return sum(abs(x[node] - x[neighbour]) for node, neighbours in relations.items() for neighbour in neighbours)
+
+
+def _is_ancestor(parent, node, descendant):
+    """Whether node is descendant or one of its ancestors, i.e. parent[node] = descendant would
+    close a cycle."""
+    while descendant != -1:
+        if descendant == node:
+            return True
+        descendant = parent[descendant]
+    return False
+
+
+def _depth_first(roots, children):
+    """Returns the nodes in depth-first order: parents before children, siblings in order."""
+    order = []
+    for root in roots:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(reversed(children.get(node, [])))
+    return order
+
+
+def _place(children, order, count):
+    """Gives leaves consecutive slots in depth-first order and centers parents over children."""
+    x = array('d', [0.0]) * count
+    slot = 0
+    for node in order:
+        if not children.get(node):
+            x[node] = slot * NODE_SPACING
+            slot += 1
+    for node in reversed(order):
+        node_children = children.get(node)
+        if node_children:
+            x[node] = (x[node_children[0]] + x[node_children[-1]]) / 2
+    # center the drawing on x = 0
+    offset = (slot - 1) * NODE_SPACING / 2
+    for node in range(count):
+        x[node] -= offset
+    return x
+
+
+def with_layout(graph_data, sweeps=LAYOUT_SWEEPS):
+    """Returns a copy of graph_data whose nodes carry the 'x' and 'y' of layered_layout."""
+    x, y = layered_layout(graph_data, sweeps)
+    return {
+        "nodes": [dict(node, x=x[row], y=y[row]) for row, node in enumerate(graph_data['nodes'])],
+        "edges": graph_data['edges']
+    }
@@ -0,0 +1,570 @@
+import argparse
+import fcntl
+import ipaddress
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from graph_layout import with_layout
+
+# Directory of the crawl snapshots, one sub-directory per organization
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+# Number of snapshots kept per organization, older ones are removed when a new one is written
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', '10'))
+# Bytes per chunk when a snapshot is sent in a response
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
+# Number of snapshots whose derived tables (clusters, IP index, reachability, ...) each process
+# keeps, the least recently used ones are dropped and computed again when next needed
+SNAPSHOT_DERIVED_CACHE = int(os.environ.get('SNAPSHOT_DERIVED_CACHE', '8'))
+
+LATEST = "latest"
+# Status of the organization's latest crawl job, readable by every worker, see write_job_status
+JOB_STATUS = "job.json"
+
+# Snapshot file format, all integers little-endian:
+#   header      magic, version, reserved flags and the string, node, edge and (version 3) range
+#               counts
+#   offsets     uint32[strings + 1], start of every string in the string data
+#   nodes       one uint32/int32/float32 column per NODE_COLUMNS entry, nodes rows each
+#   edges       one uint32 column per EDGE_COLUMNS entry, edges rows each
+#   ranges      uint32[nodes + 1], first range row of every node, then one column per
+#               RANGE_COLUMNS entry, ranges rows each
+#   strings     UTF-8 string data
+# Strings are interned: ids, labels, kinds, colors, projects, VPCs, range names and CIDRs and
+# the JSON of the attributes without a column of their own are stored once and referenced by
+# index, NO_STRING is a missing value.
+# Version 2 added the x and y node columns of the precomputed layout, see graph_layout.py.
+# Version 3 added the project_id and vpc node columns and the ranges table, read directly by
+# the snapshot analyses without decoding the nodes.
+SNAPSHOT_MAGIC = b"GGSNAPSH"
+SNAPSHOT_VERSION = 3
+NO_STRING = 0xFFFFFFFF
+_HEADER = struct.Struct("<8sHHIII")
+_RANGE_COUNT = struct.Struct("<I")
+NODE_COLUMNS = [("id", "I"), ("label", "I"), ("level", "i"), ("color", "I"), ("kind", "I"), ("extra", "I"),
+                ("x", "f"), ("y", "f"), ("project_id", "I"), ("vpc", "I")]
+EDGE_COLUMNS = [("from", "I"), ("to", "I"), ("kind", "I"), ("label", "I"), ("extra", "I")]
+# network is the first address of an IPv4 range and prefix_length -1 for any other range
+RANGE_COLUMNS = [("node", "I"), ("name", "I"), ("type", "I"), ("cidr", "I"), ("network", "I"),
+                 ("prefix_length", "i")]
+# Keys of the 'ranges' entries stored in the ranges table, nodes with other keys keep theirs in extra
+RANGE_FIELDS = {"name", "type", "cidr"}
+
+
+def node_columns(version):
+    """Returns the node columns of a snapshot format version."""
+    if version >= 3:
+        return NODE_COLUMNS
+    return NODE_COLUMNS[:8] if version >= 2 else NODE_COLUMNS[:6]
+
+
+def ipv4_network(cidr):
+    """Returns the first address and prefix length of an IPv4 CIDR, or (0, -1) for anything else."""
+    try:
+        network = ipaddress.ip_network(cidr, strict=False)
+    except ValueError:
+        return 0, -1
+    if network.version != 4:
+        return 0, -1
+    return int(network.network_address), network.prefixlen
+
+
+def encode_graph(graph_data):
+    """Encodes a graph in the snapshot format.
+
+    Args:
+        graph_data: The {'nodes': [...], 'edges': [...]} dictionary of GraphBuilder.to_graph_data,
+            nodes without 'x' and 'y' are stored at (0, 0).
+
+    Returns:
+        The snapshot as a list of bytes-like chunks, to be written in order.
+    """
+    strings = {}
+
+    def intern(value):
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    def intern_extra(item, fields):
+        extra = {key: value for key, value in item.items() if key not in fields}
+        return intern(json.dumps(extra, sort_keys=True, default=str)) if extra else NO_STRING
+
+    node_fields = {name for name, _ in NODE_COLUMNS}
+    nodes = {name: array(typecode) for name, typecode in NODE_COLUMNS}
+    range_offsets = array('I', [0])
+    ranges = {name: array(typecode) for name, typecode in RANGE_COLUMNS}
+    for row, node in enumerate(graph_data['nodes']):
+        nodes['id'].append(intern(node['id']))
+        nodes['label'].append(intern(node.get('label')))
+        nodes['level'].append(int(node.get('level') or 0))
+        nodes['color'].append(intern(node.get('color')))
+        nodes['kind'].append(intern(node.get('kind')))
+        nodes['x'].append(float(node.get('x') or 0))
+        nodes['y'].append(float(node.get('y') or 0))
+        nodes['project_id'].append(intern(node.get('project_id')))
+        nodes['vpc'].append(intern(node.get('vpc')))
+        # an empty or unusual 'ranges' stays in extra, so it is decoded as it was
+        node_ranges = node.get('ranges')
+        if node_ranges and all(isinstance(ip_range, dict) and ip_range.keys() == RANGE_FIELDS
+                               for ip_range in node_ranges):
+            nodes['extra'].append(intern_extra(node, node_fields | {'ranges'}))
+            for ip_range in node_ranges:
+                network, prefix_length = ipv4_network(ip_range['cidr'])
+                ranges['node'].append(row)
+                ranges['name'].append(intern(ip_range['name']))
+                ranges['type'].append(intern(ip_range['type']))
+                ranges['cidr'].append(intern(ip_range['cidr']))
+                ranges['network'].append(network)
+                ranges['prefix_length'].append(prefix_length)
+        else:
+            nodes['extra'].append(intern_extra(node, node_fields))
+        range_offsets.append(len(ranges['node']))
+
+    edge_fields = {name for name, _ in EDGE_COLUMNS} | {'id'}
+    edges = {name: array(typecode) for name, typecode in EDGE_COLUMNS}
+    for edge in graph_data['edges']:
+        edges['from'].append(intern(edge['from']))
+        edges['to'].append(intern(edge['to']))
+        edges['kind'].append(intern(edge.get('kind')))
+        edges['label'].append(intern(edge.get('label')))
+        edges['extra'].append(intern_extra(edge, edge_fields))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = array('I', [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+
+    columns = ([offsets] + [nodes[name] for name, _ in NODE_COLUMNS] + [edges[name] for name, _ in EDGE_COLUMNS]
+               + [range_offsets] + [ranges[name] for name, _ in RANGE_COLUMNS])
+    if sys.byteorder == 'big':
+        for column in columns:
+            column.byteswap()
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(strings),
+                          len(graph_data['nodes']), len(graph_data['edges']))
+    header += _RANGE_COUNT.pack(len(ranges['node']))
+    return [header] + [column.tobytes() for column in columns] + [b"".join(encoded)]
+
+
+def _column(buffer, offset, typecode, length):
+    """Returns a typed column of buffer and the offset following it, without copying on
+    little-endian machines."""
+    end = offset + 4 * length
+    if sys.byteorder == 'little':
+        return buffer[offset:end].cast(typecode), end
+    column = array(typecode, buffer[offset:end].tobytes())
+    column.byteswap()
+    return column, end
+
+
+class GraphTables:
+    """Read-only columnar view of a snapshot, the columns are slices of the snapshot buffer.
+
+    Loading only reads the header and slices the columns, strings are decoded on first use.
+    Snapshots older than version 3 have no project_id, vpc or ranges columns, see upgraded.
+    """
+
+    def __init__(self, buffer):
+        buffer = memoryview(buffer)
+        if len(buffer) < _HEADER.size:
+            raise ValueError("not a graph snapshot: file too short")
+        magic, version, _, string_count, node_count, edge_count = _HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("not a graph snapshot: bad magic")
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported graph snapshot version {version}")
+        self.version = version
+        self.node_count = node_count
+        self.edge_count = edge_count
+        self.range_count = 0
+
+        offset = _HEADER.size
+        if version >= 3:
+            self.range_count, = _RANGE_COUNT.unpack_from(buffer, offset)
+            offset += _RANGE_COUNT.size
+        self._string_offsets, offset = _column(buffer, offset, 'I', string_count + 1)
+        self.nodes = {}
+        for name, typecode in node_columns(version):
+            self.nodes[name], offset = _column(buffer, offset, typecode, node_count)
+        self.edges = {}
+        for name, typecode in EDGE_COLUMNS:
+            self.edges[name], offset = _column(buffer, offset, typecode, edge_count)
+        self.ranges = {}
+        self.range_offsets = None
+        if version >= 3:
+            self.range_offsets, offset = _column(buffer, offset, 'I', node_count + 1)
+            for name, typecode in RANGE_COLUMNS:
+                self.ranges[name], offset = _column(buffer, offset, typecode, self.range_count)
+        self._string_data = buffer[offset:]
+        self._strings = [None] * string_count
+
+    def string(self, index):
+        """Returns the interned string at index, or None for NO_STRING."""
+        if index == NO_STRING:
+            return None
+        value = self._strings[index]
+        if value is None:
+            value = self._strings[index] = str(
+                self._string_data[self._string_offsets[index]:self._string_offsets[index + 1]], 'utf-8'
+            )
+        return value
+
+    def strings(self, column):
+        """Returns the strings of an interned column, e.g. tables.strings(tables.nodes['id'])."""
+        return [self.string(index) for index in column]
+
+    def node(self, row):
+        """Returns a node as the dictionary GraphBuilder built it."""
+        nodes = self.nodes
+        node = {
+            "id": self.string(nodes['id'][row]),
+            "label": self.string(nodes['label'][row]),
+            "level": nodes['level'][row],
+            "color": self.string(nodes['color'][row]),
+            "kind": self.string(nodes['kind'][row])
+        }
+        if nodes['extra'][row] != NO_STRING:
+            node.update(json.loads(self.string(nodes['extra'][row])))
+        if 'x' in nodes:
+            node['x'] = nodes['x'][row]
+            node['y'] = nodes['y'][row]
+        if self.version >= 3:
+            for name in ('project_id', 'vpc'):
+                if nodes[name][row] != NO_STRING:
+                    node[name] = self.string(nodes[name][row])
+            start, end = self.range_offsets[row], self.range_offsets[row + 1]
+            if start != end:
+                ranges = self.ranges
+                node['ranges'] = [
+                    {
+                        "name": self.string(ranges['name'][position]),
+                        "type": self.string(ranges['type'][position]),
+                        "cidr": self.string(ranges['cidr'][position])
+                    }
+                    for position in range(start, end)
+                ]
+        return node
+
+    def edge(self, row):
+        """Returns an edge as the dictionary GraphBuilder built it."""
+        edges = self.edges
+        edge = {
+            "from": self.string(edges['from'][row]),
+            "to": self.string(edges['to'][row]),
+            "kind": self.string(edges['kind'][row])
+        }
+        if edges['label'][row] != NO_STRING:
+            edge["label"] = self.string(edges['label'][row])
+        if edges['extra'][row] != NO_STRING:
+            edge.update(json.loads(self.string(edges['extra'][row])))
+        return edge
+
+    def to_graph_data(self):
+        """Returns the graph in the {'nodes': [...], 'edges': [...]} shape vis.js DataSets take."""
+        return {
+            "nodes": [self.node(row) for row in range(self.node_count)],
+            "edges": [self.edge(row) for row in range(self.edge_count)]
+        }
+
+    def upgraded(self):
+        """Returns these tables in the current format version, re-encoded in memory when older.
+
+        Nodes of snapshots older than version 3 did not carry their project_id, it is taken
+        from the project node above them.
+        """
+        if self.version >= SNAPSHOT_VERSION:
+            return self
+        graph_data = self.to_graph_data()
+        nodes = {node['id']: node for node in graph_data['nodes']}
+        parents = {}
+        for edge in graph_data['edges']:
+            if edge['kind'] in ("parent", "nat") and edge['to'] not in parents:
+                parents[edge['to']] = edge['from']
+        for node in graph_data['nodes']:
+            ancestor = node['id']
+            while ancestor is not None and nodes.get(ancestor, {}).get('kind') != "project":
+                ancestor = parents.get(ancestor)
+            if ancestor is not None:
+                node['project_id'] = ancestor
+        return GraphTables(b"".join(encode_graph(graph_data)))
+
+
+def is_organization_id(value):
+    """Returns whether value is an organization ID, digits only."""
+    return re.fullmatch(r"[0-9]+", str(value)) is not None
+
+
+def snapshot_dir(organization_id, root=None):
+    """Returns the directory of an organization's snapshots.
+
+    Raises:
+        ValueError: organization_id is not an organization ID, so it cannot name another directory.
+    """
+    if not is_organization_id(organization_id):
+        raise ValueError(f"Invalid organization ID {organization_id!r}")
+    return os.path.join(root or SNAPSHOT_DIR, str(organization_id))
+
+
+def new_stamp(now=None):
+    """Returns a UTC timestamp that sorts in creation order, e.g. "20240131T120000123Z"."""
+    now = now or time.time()
+    return time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}Z"
+
+
+def list_snapshots(organization_id, root=None):
+    """Returns the stamps of an organization's snapshots, oldest first."""
+    directory = snapshot_dir(organization_id, root)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name[:1].isdigit() and '.' not in name)
+
+
+def write_snapshot(organization_id, graph, root=None, stamp=None):
+    """Writes the graph of a crawl as a new snapshot and points 'latest' at it.
+
+    The node coordinates of layered_layout are computed here, once per snapshot. The snapshot
+    and the pointer are written to temporary files and renamed into place, so readers in other
+    processes only ever see complete files.
+
+    Args:
+        organization_id: The organization ID.
+        graph: GraphBuilder of the crawl.
+        root: Snapshot directory, SNAPSHOT_DIR when omitted.
+        stamp: Name of the snapshot, new_stamp() when omitted.
+
+    Returns:
+        The path of the snapshot file, snapshots/<org>/<stamp>.
+    """
+    directory = snapshot_dir(organization_id, root)
+    os.makedirs(directory, exist_ok=True)
+    stamp = stamp or new_stamp()
+    path = os.path.join(directory, stamp)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as f:
+        for chunk in encode_graph(with_layout(graph.to_graph_data())):
+            f.write(chunk)
+    os.replace(temporary_path, path)
+
+    pointer_path = os.path.join(directory, LATEST)
+    with open(f"{pointer_path}.tmp", 'w') as f:
+        f.write(stamp)
+    os.replace(f"{pointer_path}.tmp", pointer_path)
+
+    for old_stamp in list_snapshots(organization_id, root)[:-max(SNAPSHOT_KEEP, 1)]:
+        os.remove(os.path.join(directory, old_stamp))
+    return path
+
+
+def latest_stamp(organization_id, root=None):
+    """Returns the stamp the organization's 'latest' pointer names, or None without snapshots."""
+    try:
+        with open(os.path.join(snapshot_dir(organization_id, root), LATEST)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class Snapshot:
+    """A snapshot file memory-mapped read-only, with its GraphTables.
+
+    Every process mapping the same file shares its pages through the OS page cache, so serving
+    it from many workers does not add a copy per worker. The tables derived from it are not
+    shared: each process computes its own, for at most SNAPSHOT_DERIVED_CACHE snapshots at a
+    time, see derived.
+    """
+
+    def __init__(self, organization_id, stamp, path):
+        self.organization_id = organization_id
+        self.stamp = stamp
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._mmap)
+        # older snapshots are upgraded in this process's memory, until the next crawl replaces them
+        self.tables = GraphTables(self.buffer).upgraded()
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def age(self, now=None):
+        return (now or time.time()) - self.mtime
+
+    def chunks(self, chunk_size=SNAPSHOT_CHUNK_SIZE):
+        """Yields the snapshot file as bytes chunks, for streaming responses."""
+        for offset in range(0, len(self.buffer), chunk_size):
+            yield self.buffer[offset:offset + chunk_size].tobytes()
+
+    def graph_data(self):
+        """Decodes the snapshot into the vis.js {'nodes': [...], 'edges': [...]} dictionary."""
+        return self.tables.to_graph_data()
+
+    def derived(self, name, function):
+        """Returns function(self), e.g. the snapshot's clusters, computed once per process while
+        the snapshot is among the SNAPSHOT_DERIVED_CACHE it used last."""
+        with self._derived_lock:
+            if name not in self._derived:
+                self._derived[name] = function(self)
+            value = self._derived[name]
+        _use_derived(self)
+        return value
+
+    def clear_derived(self):
+        with self._derived_lock:
+            self._derived.clear()
+
+
+# Snapshots holding derived tables in this process, least recently used first
+_derived_snapshots = OrderedDict()
+_derived_snapshots_lock = threading.Lock()
+
+
+def _use_derived(snapshot):
+    """Marks the derived tables of a snapshot as used last, and drops those of the least
+    recently used snapshots past SNAPSHOT_DERIVED_CACHE."""
+    evicted = []
+    with _derived_snapshots_lock:
+        _derived_snapshots[snapshot] = True
+        _derived_snapshots.move_to_end(snapshot)
+        while len(_derived_snapshots) > max(SNAPSHOT_DERIVED_CACHE, 1):
+            evicted.append(_derived_snapshots.popitem(last=False)[0])
+    for old_snapshot in evicted:
+        old_snapshot.clear_derived()
+
+
+# Snapshots mapped by this process, by organization ID
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def open_latest_snapshot(organization_id, root=None):
+    """Returns the organization's latest Snapshot, mapped once per process, or None.
+
+    The mapping is replaced when 'latest' points to a newer snapshot. The previous mapping
+    stays valid for responses still reading it and is unmapped once they release it.
+    """
+    stamp = latest_stamp(organization_id, root)
+    if stamp is None:
+        return None
+    key = (root or SNAPSHOT_DIR, str(organization_id))
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None or snapshot.stamp != stamp:
+            try:
+                snapshot = Snapshot(organization_id, stamp, os.path.join(snapshot_dir(organization_id, root), stamp))
+            except FileNotFoundError:
+                # pruned by a newer crawl between reading the pointer and opening the file
+                return _snapshots.get(key)
+            except ValueError as e:
+                print(f"Ignoring snapshot {stamp} of organization {organization_id}: {str(e)}")
+                return None
+            _snapshots[key] = snapshot
+        return snapshot
+
+
+@contextmanager
+def crawl_lock(organization_id, root=None, on_wait=None, poll_interval=1.0):
+    """Holds an exclusive lock on an organization across processes while it is crawled.
+
+    While another process holds the lock, on_wait() is called every poll_interval seconds, e.g.
+    to follow that crawl through read_job_status.
+    """
+    directory = snapshot_dir(organization_id, root)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), 'w') as f:
+        if on_wait is None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    on_wait()
+                    time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_job_status(organization_id, status, root=None):
+    """Replaces the organization's job status file with status, a JSON-serializable dictionary."""
+    directory = snapshot_dir(organization_id, root)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, JOB_STATUS)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(status, f, default=str)
+    os.replace(temporary_path, path)
+
+
+def read_job_status(organization_id, root=None):
+    """Returns the status write_job_status last wrote for the organization, or None."""
+    try:
+        with open(os.path.join(snapshot_dir(organization_id, root), JOB_STATUS)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def open_snapshot(organization_id, stamp=None, root=None):
+    """Returns the Snapshot with this stamp, or the latest one, without the per-process cache."""
+    stamp = stamp or latest_stamp(organization_id, root)
+    if stamp is None:
+        raise FileNotFoundError(f"No snapshot for organization {organization_id}")
+    return Snapshot(organization_id, stamp, os.path.join(snapshot_dir(organization_id, root), stamp))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the graph snapshots of an organization.")
+    parser.add_argument('--root', default=SNAPSHOT_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparser = subparsers.add_parser('list')
+    subparser.add_argument('organization_id')
+    for command in ('info', 'json'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('organization_id')
+        subparser.add_argument('--stamp', help="snapshot to read, the latest one by default")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        latest = latest_stamp(args.organization_id, args.root)
+        for stamp in list_snapshots(args.organization_id, args.root):
+            size = os.path.getsize(os.path.join(snapshot_dir(args.organization_id, args.root), stamp))
+            print(f"{stamp}  {size:>11} bytes{'  latest' if stamp == latest else ''}")
+
+    elif args.command == 'info':
+        start = time.perf_counter()
+        snapshot = open_snapshot(args.organization_id, args.stamp, args.root)
+        loaded = time.perf_counter()
+        snapshot.graph_data()
+        decoded = time.perf_counter()
+        tables = snapshot.tables
+        print(f"snapshot {snapshot.stamp}: version {tables.version}, {tables.node_count} nodes, "
+              f"{tables.edge_count} edges, {len(snapshot)} bytes")
+        print(f"loaded in {(loaded - start) * 1000:.1f} ms, decoded in {(decoded - loaded) * 1000:.1f} ms")
+
+    elif args.command == 'json':
+        snapshot = open_snapshot(args.organization_id, args.stamp, args.root)
+        json.dump(snapshot.graph_data(), sys.stdout)
+        print()
+
+
+if __name__ == '__main__':
+    main()
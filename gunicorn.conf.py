@@ -0,0 +1,17 @@
+import os
+
+# Production serving: several worker processes, each memory-mapping the shared graph snapshots
+# read-only, see graph_snapshot.py. Crawls of the same organization are serialized across
+# workers with a lock file, the crawling worker publishes its job status next to the snapshots
+# so every worker reports it, and the resulting snapshot is reused by every worker. The tables
+# derived from a snapshot (clusters, IP index, reachability) are computed per worker, each keeps
+# them for its SNAPSHOT_DERIVED_CACHE last used snapshots.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+# threads keep long NDJSON streams from blocking a whole worker
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+worker_class = 'gthread'
+# streams of big organizations last as long as their crawl
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '600'))
+graceful_timeout = 30
+accesslog = '-'
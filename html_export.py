@@ -0,0 +1,187 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+import urllib.request
+
+from graph_layout import with_layout
+from graph_snapshot import SNAPSHOT_DIR, open_snapshot
+
+# "inline" writes one HTML file with the graph in it, "offline" a directory with the page,
+# vis.js and the graph in compressed chunk files, see export_offline_html
+HTML_EXPORT = os.environ.get('HTML_EXPORT', 'inline')
+# Local copy of vis-network.min.js for offline exports, downloaded from VIS_NETWORK_URL if unset
+VIS_NETWORK_JS = os.environ.get('VIS_NETWORK_JS', '')
+VIS_NETWORK_URL = os.environ.get('VIS_NETWORK_URL', 'https://unpkg.com/vis-network/standalone/umd/vis-network.min.js')
+# Nodes or edges per data chunk file
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '5000'))
+
+VIS_OPTIONS = {
+    "nodes": {"shape": "box", "font": {"size": 12, "face": "arial"}, "margin": 10,
+              "widthConstraint": {"minimum": 100, "maximum": 250}},
+    "edges": {"arrows": "to", "smooth": {"type": "cubicBezier", "forceDirection": "vertical"}},
+    "layout": {"hierarchical": False},
+    "physics": False
+}
+
+OFFLINE_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>GCP Organization Structure</title>
+    <script type="text/javascript" src="vis-network.min.js"></script>
+    <style type="text/css">
+        #mynetwork {
+            width: 100%;
+            height: 800px;
+            border: 1px solid lightgray;
+        }
+    </style>
+</head>
+<body>
+"""
+
+OFFLINE_PAGE_SCRIPT = """
+    <div id="mynetwork"></div>
+    <script type="text/javascript">
+        // Loads the gzip chunk files listed in data/manifest.json and adds them as they arrive.
+        // Browsers do not fetch file:// URLs, serve the directory, e.g. python -m http.server
+        var nodes = new vis.DataSet();
+        var edges = new vis.DataSet();
+        var network = new vis.Network(document.getElementById('mynetwork'), { nodes: nodes, edges: edges }, OPTIONS);
+        var status = document.getElementById('export_status');
+
+        function loadChunk(file) {
+            return fetch('data/' + file).then(function (response) {
+                if (!response.ok) {
+                    throw new Error(file + ': ' + response.status);
+                }
+                var body = response.body.pipeThrough(new DecompressionStream('gzip'));
+                return new Response(body).json();
+            });
+        }
+
+        function loadChunks(files, dataSet) {
+            return files.reduce(function (previous, file) {
+                return previous.then(function () {
+                    return loadChunk(file).then(function (items) {
+                        dataSet.add(items);
+                        status.textContent = nodes.length + ' nodes, ' + edges.length + ' edges';
+                    });
+                });
+            }, Promise.resolve());
+        }
+
+        fetch('data/manifest.json').then(function (response) {
+            return response.json();
+        }).then(function (manifest) {
+            return loadChunks(manifest.nodes, nodes).then(function () {
+                network.fit();
+                return loadChunks(manifest.edges, edges);
+            });
+        }).catch(function (error) {
+            status.style.color = 'red';
+            status.textContent = 'Could not load the graph data (' + error + '). '
+                + 'Open this page over HTTP, e.g. run python -m http.server in its directory.';
+        });
+    </script>
+</body>
+</html>
+"""
+
+
+def copy_vis_network(path):
+    """Writes vis-network.min.js to path, from VIS_NETWORK_JS or downloaded from VIS_NETWORK_URL."""
+    if VIS_NETWORK_JS:
+        shutil.copyfile(VIS_NETWORK_JS, path)
+        return
+    with urllib.request.urlopen(VIS_NETWORK_URL) as response, open(path, 'wb') as f:
+        shutil.copyfileobj(response, f)
+
+
+def write_chunks(directory, name, items, chunk_size=EXPORT_CHUNK_SIZE):
+    """Writes items to gzip-compressed JSON array files of chunk_size items each.
+
+    Items are encoded one at a time straight into the compressed file, so only one item is held
+    as JSON in memory.
+
+    Returns:
+        The file names written, e.g. ["nodes-0000.json.gz", ...].
+    """
+    files = []
+    for start in range(0, len(items), chunk_size):
+        file_name = f"{name}-{len(files):04d}.json.gz"
+        with gzip.open(os.path.join(directory, file_name), 'wt', encoding='utf-8') as f:
+            f.write('[')
+            for position, item in enumerate(items[start:start + chunk_size]):
+                if position:
+                    f.write(',')
+                json.dump(item, f, default=str, separators=(',', ':'))
+            f.write(']')
+        files.append(file_name)
+    return files
+
+
+def export_offline_html(organization_id, graph_data, directory=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Exports a graph as a page that works without internet access.
+
+    The directory gets index.html, vis-network.min.js and data/ with manifest.json and the
+    nodes and edges in gzip chunk files, which the page fetches and adds one after the other.
+    Nodes carry the coordinates of layered_layout, so the browser runs no layout.
+
+    Args:
+        organization_id: The organization ID.
+        graph_data: The {'nodes': [...], 'edges': [...]} dictionary of GraphBuilder.to_graph_data.
+        directory: Output directory, gcp_organization_<org>_export by default.
+        chunk_size: Nodes or edges per chunk file.
+
+    Returns:
+        The path of the exported index.html.
+    """
+    directory = directory or f"gcp_organization_{organization_id}_export"
+    data_directory = os.path.join(directory, "data")
+    os.makedirs(data_directory, exist_ok=True)
+
+    if not all('x' in node for node in graph_data['nodes']):
+        graph_data = with_layout(graph_data)
+    manifest = {
+        "organization_id": organization_id,
+        "node_count": len(graph_data['nodes']),
+        "edge_count": len(graph_data['edges']),
+        "nodes": write_chunks(data_directory, "nodes", graph_data['nodes'], chunk_size),
+        "edges": write_chunks(data_directory, "edges", graph_data['edges'], chunk_size)
+    }
+    with open(os.path.join(data_directory, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    vis_path = os.path.join(directory, "vis-network.min.js")
+    if not os.path.exists(vis_path):
+        copy_vis_network(vis_path)
+
+    page_path = os.path.join(directory, "index.html")
+    with open(page_path, 'w') as f:
+        f.write(OFFLINE_PAGE_HEAD)
+        f.write(f"    <h1>GCP Organization Structure: {organization_id}</h1>\n")
+        f.write('    <p id="export_status"></p>\n')
+        f.write(OFFLINE_PAGE_SCRIPT.replace("OPTIONS", json.dumps(VIS_OPTIONS)))
+    return page_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a graph snapshot as an offline HTML page.")
+    parser.add_argument('organization_id')
+    parser.add_argument('--stamp', help="snapshot to export, the latest one by default")
+    parser.add_argument('--root', default=SNAPSHOT_DIR)
+    parser.add_argument('--output', help="output directory")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    snapshot = open_snapshot(args.organization_id, args.stamp, args.root)
+    page_path = export_offline_html(args.organization_id, snapshot.graph_data(), args.output, args.chunk_size)
+    print(f"Visualization exported: {page_path}")
+
+
+if __name__ == '__main__':
+    main()
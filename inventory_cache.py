@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Location of the cache database, an empty value disables caching
+INVENTORY_CACHE_PATH = os.environ.get('INVENTORY_CACHE_PATH', 'inventory_cache.sqlite3')
+
+# Seconds an entry of each resource kind stays fresh, overridable with INVENTORY_CACHE_TTL_<KIND>
+CACHE_TTLS = {
+    'folders': 6 * 3600,
+    'projects': 3600,
+    'networks': 3600,
+    'subnets': 1800,
+    'peerings': 1800,
+    'routers': 1800,
+    'psa_ranges': 3600,
+    'xpn_host': 6 * 3600,
+    # fingerprints of the previous crawl are only replaced, never expired
+    'fingerprints': 365 * 24 * 3600,
+}
+for _kind in CACHE_TTLS:
+    _ttl = os.environ.get(f'INVENTORY_CACHE_TTL_{_kind.upper()}')
+    if _ttl:
+        CACHE_TTLS[_kind] = int(_ttl)
+
+
+class InventoryCache:
+    """SQLite cache of collected inventory, one JSON entry per (scope, kind).
+
+    scope is the resource the entry belongs to: the parent resource name for folders and
+    projects (e.g. "organizations/123" or "folders/456"), the organization for the xpn_host
+    map and the project ID for network kinds.
+    """
+
+    def __init__(self, path=INVENTORY_CACHE_PATH, ttls=None):
+        self.path = path
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " scope TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " PRIMARY KEY (scope, kind))"
+            )
+
+    def is_fresh(self, kind, fetched_at, now=None):
+        return (now or time.time()) - fetched_at < self.ttls.get(kind, 0)
+
+    def get(self, scope, kind, include_expired=False, max_age=None):
+        """Returns (found, value) for an entry, expired entries count as missing by default.
+
+        max_age, in seconds, replaces the kind's TTL for this lookup.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at, payload FROM entries WHERE scope = ? AND kind = ?", (scope, kind)
+            ).fetchone()
+        if row is None:
+            return False, None
+        if max_age is not None:
+            fresh = time.time() - row[0] < max_age
+        else:
+            fresh = self.is_fresh(kind, row[0])
+        if not (include_expired or fresh):
+            return False, None
+        return True, json.loads(row[1])
+
+    def put(self, scope, kind, value):
+        payload = json.dumps(value, default=str)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (scope, kind, fetched_at, payload) VALUES (?, ?, ?, ?)",
+                (scope, kind, time.time(), payload)
+            )
+        # return what a later cache hit returns, so fresh and cached crawls see the same values
+        return json.loads(payload)
+
+    def fetch(self, scope, kind, fetch_function, *args):
+        """Returns the fresh cached value, or calls fetch_function(*args) and caches its result.
+
+        Exceptions raised by fetch_function are not cached.
+        """
+        found, value = self.get(scope, kind)
+        if found:
+            return value
+        return self.put(scope, kind, fetch_function(*args))
+
+    def entries(self, kind=None, scope=None):
+        """Returns (scope, kind, fetched_at, payload size) rows, optionally filtered."""
+        query = "SELECT scope, kind, fetched_at, length(payload) FROM entries WHERE 1 = 1"
+        params = []
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if scope:
+            query += " AND scope = ?"
+            params.append(scope)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY kind, scope", params).fetchall()
+
+    def purge(self, kind=None, scope=None, expired_only=False):
+        """Deletes matching entries and returns how many were removed."""
+        now = time.time()
+        removed = 0
+        with self._lock, self._conn:
+            kinds = [kind] if kind else [row[0] for row in self._conn.execute("SELECT DISTINCT kind FROM entries")]
+            for row_kind in kinds:
+                query = "DELETE FROM entries WHERE kind = ?"
+                params = [row_kind]
+                if scope:
+                    query += " AND scope = ?"
+                    params.append(scope)
+                if expired_only:
+                    query += " AND fetched_at <= ?"
+                    params.append(now - self.ttls.get(row_kind, 0))
+                removed += self._conn.execute(query, params).rowcount
+        return removed
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_inventory_cache():
+    """Returns the process-wide cache at INVENTORY_CACHE_PATH, or None when caching is disabled."""
+    global _default_cache
+    if not INVENTORY_CACHE_PATH:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = InventoryCache()
+        return _default_cache
+
+
+def cached_fetch(cache, scope, kind, fetch_function, *args):
+    """Calls fetch_function(*args) through cache, or directly when cache is None."""
+    if cache is None:
+        return fetch_function(*args)
+    return cache.fetch(scope, kind, fetch_function, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge the inventory cache.")
+    parser.add_argument('--path', default=INVENTORY_CACHE_PATH or 'inventory_cache.sqlite3')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command in ('list', 'stats', 'purge'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('--kind', choices=sorted(CACHE_TTLS))
+        subparser.add_argument('--scope', help="parent resource name or project ID")
+        if command == 'purge':
+            subparser.add_argument('--expired', action='store_true', help="only remove expired entries")
+    args = parser.parse_args()
+
+    cache = InventoryCache(args.path)
+    now = time.time()
+
+    if args.command == 'list':
+        for scope, kind, fetched_at, size in cache.entries(args.kind, args.scope):
+            state = "fresh" if cache.is_fresh(kind, fetched_at, now) else "expired"
+            print(f"{kind:10} {scope:40} {int(now - fetched_at):>8}s old  {size:>9} bytes  {state}")
+
+    elif args.command == 'stats':
+        stats = {}
+        for scope, kind, fetched_at, size in cache.entries(args.kind, args.scope):
+            kind_stats = stats.setdefault(kind, {'entries': 0, 'expired': 0, 'bytes': 0})
+            kind_stats['entries'] += 1
+            kind_stats['bytes'] += size
+            if not cache.is_fresh(kind, fetched_at, now):
+                kind_stats['expired'] += 1
+        for kind, kind_stats in sorted(stats.items()):
+            print(f"{kind:10} ttl {cache.ttls.get(kind, 0):>6}s  {kind_stats['entries']:>7} entries  "
+                  f"{kind_stats['expired']:>7} expired  {kind_stats['bytes']:>11} bytes")
+
+    elif args.command == 'purge':
+        removed = cache.purge(args.kind, args.scope, args.expired)
+        print(f"Removed {removed} entries from {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import ipaddress
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+from cidr_overlaps import collect_ranges, table_ranges
+from graph_clusters import HIERARCHY_EDGE_KINDS
+from graph_snapshot import SNAPSHOT_DIR, open_snapshot
+
+
+class IpLookupIndex:
+    """Longest-prefix-match index from IPv4 addresses to the ranges of a graph.
+
+    The distinct CIDRs of the subnet primary and secondary ranges and of the Private Service
+    Access ranges of the graph nodes (see collect_ranges) are kept in array columns sorted by
+    first address, widest first, with the index of the narrowest CIDR containing each one.
+    CIDRs are either nested or disjoint, so the last CIDR starting at or before an address,
+    found by bisection, is the address's longest prefix match or nested in it: a lookup walks
+    up the containing CIDRs from there, a few steps at most as subnets are rarely nested deeper.
+
+    Every resource is returned with the 'project' and 'vpc' node it belongs to, read from the
+    project_id and vpc columns of a snapshot, or found through the parent edges of a graph.
+    """
+
+    def __init__(self, rows, starts, ends):
+        """Indexes ranges, as returned by collect_ranges with the 'project' of every row."""
+        self.range_count = len(rows)
+        resources = {}
+        for row, start in enumerate(starts):
+            resources.setdefault((start, ends[row]), []).append(rows[row])
+        networks = sorted(resources, key=lambda network: (network[0], -network[1]))
+        self.starts = array('Q', (start for start, _ in networks))
+        self.ends = array('Q', (end for _, end in networks))
+        self.resources = [resources[network] for network in networks]
+        # index of the narrowest CIDR containing each one, -1 for none
+        self.parents = array('l', [-1]) * len(networks)
+        containing = []
+        for position, (start, end) in enumerate(networks):
+            while containing and self.ends[containing[-1]] < start:
+                containing.pop()
+            if containing:
+                self.parents[position] = containing[-1]
+            containing.append(position)
+
+    @classmethod
+    def from_graph_data(cls, graph_data):
+        nodes = {node['id']: node for node in graph_data['nodes']}
+        parents = {}
+        for edge in graph_data['edges']:
+            if edge['kind'] in HIERARCHY_EDGE_KINDS and edge['to'] not in parents:
+                parents[edge['to']] = edge['from']
+        rows, starts, ends = collect_ranges(graph_data['nodes'])
+        rows = [dict(row, project=cls._project_of(row['node'], nodes, parents)) for row in rows]
+        return cls(rows, starts, ends)
+
+    @staticmethod
+    def _project_of(node_id, nodes, parents):
+        while node_id is not None:
+            if nodes.get(node_id, {}).get('kind') == "project":
+                return node_id
+            node_id = parents.get(node_id)
+        return None
+
+    def lookup(self, ip):
+        """Returns the ranges containing an IPv4 address.
+
+        Args:
+            ip: The address, e.g. "10.0.1.5".
+
+        Returns:
+            A list of the matching ranges, longest prefix first, each a dictionary with the
+            'cidr', its 'prefix_length' and the 'resources' using it, several when the same
+            CIDR is used in several VPCs. An empty list when no range contains the address.
+
+        Raises:
+            ValueError: ip is not an IPv4 address.
+        """
+        address = int(ipaddress.IPv4Address(ip.strip()))
+        position = bisect_right(self.starts, address) - 1
+        while position != -1 and self.ends[position] < address:
+            position = self.parents[position]
+        matches = []
+        while position != -1:
+            resources = self.resources[position]
+            prefix_length = 33 - (self.ends[position] - self.starts[position] + 1).bit_length()
+            matches.append({"cidr": resources[0]['cidr'], "prefix_length": prefix_length, "resources": resources})
+            position = self.parents[position]
+        return matches
+
+    def lookup_many(self, ips):
+        """Yields (ip, matches) for every address, with matches None for an invalid address."""
+        for ip in ips:
+            try:
+                yield ip, self.lookup(ip)
+            except ValueError:
+                yield ip, None
+
+
+def snapshot_ip_index(snapshot):
+    """Returns the IpLookupIndex of a Snapshot, computed once per snapshot."""
+    return snapshot.derived(
+        "ip_index", lambda snapshot: IpLookupIndex(*table_ranges(snapshot.tables, with_project=True))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the project, VPC and subnet owning IP addresses.")
+    parser.add_argument('organization_id')
+    parser.add_argument('ips', nargs='*', help="addresses to look up")
+    parser.add_argument('--file', help="file with one address per line, - for stdin")
+    parser.add_argument('--stamp', help="snapshot to read, the latest one by default")
+    parser.add_argument('--root', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    ips = list(args.ips)
+    if args.file:
+        with (sys.stdin if args.file == '-' else open(args.file)) as f:
+            ips.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+    start = time.perf_counter()
+    index = snapshot_ip_index(open_snapshot(args.organization_id, args.stamp, args.root))
+    built = time.perf_counter()
+    for ip, matches in index.lookup_many(ips):
+        if matches is None:
+            print(f"{ip}\tinvalid address")
+        elif not matches:
+            print(f"{ip}\tnot found")
+        else:
+            for resource in matches[0]['resources']:
+                print(f"{ip}\t{resource['cidr']}\t{resource['project']}\t{resource['vpc']}\t"
+                      f"{resource['type']}\t{resource['name']}")
+    done = time.perf_counter()
+    print(f"{index.range_count} ranges indexed in {(built - start) * 1000:.1f} ms, "
+          f"{len(ips)} lookups in {(done - built) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,146 +1,368 @@
 from google.cloud import compute_v1
-from google.auth import default
+import contextvars
 import os
+import hashlib
 import json
 import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
 
-import google.auth
-from googleapiclient import discovery
-from google.auth.transport.requests import Request
+from clients import get_client, get_discovery_service
+
+class CrawlScope:
+    """API call counts and memoized results of one crawl, see crawl_scope.
+
+    Concurrent crawls each get their own scope, so neither their counts nor their memoized
+    results mix.
+    """
+
+    def __init__(self):
+        # Number of compute list calls (pages) issued per API method
+        self.api_calls = Counter()
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def count_api_call(self, method):
+        with self._lock:
+            self.api_calls[method] += 1
+
+    def api_call_total(self):
+        with self._lock:
+            return sum(self.api_calls.values())
+
+    def memoize(self, key, function, *args):
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        value = function(*args)
+        with self._lock:
+            return self._memo.setdefault(key, value)
+
+
+# CrawlScope of the crawl running in the current context, None outside of a crawl
+_current_crawl = contextvars.ContextVar('current_crawl', default=None)
+
+
+@contextmanager
+def crawl_scope(crawl):
+    """Makes crawl the CrawlScope of the current context, worker threads join it through
+    contextvars.copy_context()."""
+    token = _current_crawl.set(crawl)
+    try:
+        yield crawl
+    finally:
+        _current_crawl.reset(token)
+
+
+def count_api_call(method):
+    """Counts one list call (page) of an API method in the current crawl's CrawlScope."""
+    crawl = _current_crawl.get()
+    if crawl is not None:
+        crawl.count_api_call(method)
+
+
+def memoize_for_crawl(key, function, *args):
+    """Returns function(*args), computed once per key in the current crawl's CrawlScope.
+
+    Outside of a crawl nothing is memoized.
+    """
+    crawl = _current_crawl.get()
+    if crawl is None:
+        return function(*args)
+    return crawl.memoize(key, function, *args)
+
+
+def list_regions(project_id):
+    """Returns the names of the Compute Engine regions, listed once per crawl.
+
+    Every project sees the same regions, so the first project to ask lists them on behalf of
+    the others for the rest of the crawl.
+    """
+    def fetch_regions():
+        region_client = get_client(compute_v1.RegionsClient)
+        region_request = compute_v1.ListRegionsRequest(project=project_id)
+        regions = []
+        for page in region_client.list(request=region_request).pages:
+            count_api_call('regions.list')
+            regions.extend(region.name for region in page.items)
+        return regions
+
+    # deliberately not keyed by project: regions.list returns every public region whichever
+    # project it is called in (location org policies restrict where resources are created, not
+    # what is listed), so one listing serves the whole crawl
+    return memoize_for_crawl('regions', fetch_regions)
+
+
+def nat_router_id(project_id, region, router_name):
+    """Returns the id of a Cloud Router, unique in the organization: project/region/router."""
+    return f"{project_id}/{region}/{router_name}"
 
 
 def list_nat_configs(project_id):
-    """Lists all NAT configurations associated with Cloud Routers in all regions of a project,
-    including detailed information about each NAT configuration.
+    """Lists all NAT configurations associated with the Cloud Routers of a project,
+    with a single aggregated-list sweep over all regions.
 
     Args:
         project_id: The Google Cloud project ID.
 
     Returns:
-        A dictionary where keys are router names and values are lists of dictionaries,
-        each containing detailed information about a NAT configuration.
+        A dictionary where keys are router ids, see nat_router_id, and values are lists of
+        dictionaries, each containing the NAT 'name' and the router's 'region' and 'vpc_network'.
     """
-
-    router_client = compute_v1.RoutersClient()
+    router_client = get_client(compute_v1.RoutersClient)
     nat_configs_by_router = {}
 
-    # List all regions in the project
-    regions_client = compute_v1.RegionsClient()
-    regions = [region.name for region in regions_client.list(project=project_id)]
-
-    for region in regions:
-        request = compute_v1.ListRoutersRequest(
-            project=project_id,
-            region=region,
-        )
-
-        for router in router_client.list(request=request):
-            nat_configs = []
-            for nat_config in router.nats:
-                # Extract subnetwork from source_subnetwork_ip_ranges_to_nat
-                subnetwork = None
-                if nat_config.source_subnetwork_ip_ranges_to_nat:
-                    subnetwork_range = nat_config.source_subnetwork_ip_ranges_to_nat[0]
-                    subnetwork = subnetwork_range.split('/')[-1]  # Get the last part after the slash
-
-                # Get NAT IP addresses from nat_ip_allocate_option
-                nat_ip_addresses = nat_config.nat_ip_allocate_option.split(
-                    ',') if nat_config.nat_ip_allocate_option else []
-
-                nat_config_details = {
-                    'name': nat_config.name
-                }
-                nat_configs.append(nat_config_details)
-            nat_configs_by_router[router.name] = nat_configs
+    request = compute_v1.AggregatedListRoutersRequest(project=project_id)
+    for page in router_client.aggregated_list(request=request).pages:
+        count_api_call('routers.aggregatedList')
+        for scope, scoped_list in page.items.items():
+            for router in scoped_list.routers:
+                router_id = nat_router_id(project_id, router.region.split('/')[-1], router.name)
+                nat_configs_by_router[router_id] = [
+                    {
+                        'name': nat_config.name,
+                        'region': router.region.split('/')[-1],
+                        'vpc_network': router.network.split('/')[-1]
+                    }
+                    for nat_config in router.nats
+                ]
 
     return nat_configs_by_router
 
 
-def list_vpc_networks_with_subnets_and_peering(project_id):
-    credentials, _ = default()
-    network_client = compute_v1.NetworksClient(credentials=credentials)
-    subnet_client = compute_v1.SubnetworksClient(credentials=credentials)
-    region_client = compute_v1.RegionsClient(credentials=credentials)
+def subnet_details(subnet):
+    """Converts a compute_v1.Subnetwork into the subnet dictionary used in vpc_details."""
+    return {
+        'name': subnet.name,
+        'region': subnet.region.split('/')[-1],
+        'ip_cidr_range': subnet.ip_cidr_range,
+        'private_ip_google_access': subnet.private_ip_google_access,
+        'fingerprint': subnet.fingerprint,
+        'secondary_ip_ranges': [
+            {'range_name': range.range_name, 'ip_cidr_range': range.ip_cidr_range}
+            for range in subnet.secondary_ip_ranges
+        ]
+    }
 
-    vpc_details = []
-    vpc_peering_pairs = []
 
-    # List all regions
-    region_request = compute_v1.ListRegionsRequest(project=project_id)
-    regions = [region.name for region in region_client.list(request=region_request)]
+def list_subnets_by_network(project_id, credentials=None):
+    """Lists every subnet of a project with a single aggregated-list sweep and groups them by VPC.
 
-    # List all VPC networks
-    network_request = compute_v1.ListNetworksRequest(project=project_id)
-    networks = network_client.list(request=network_request)
+    Args:
+        project_id: The Google Cloud project ID.
+        credentials: Optional credentials, application default credentials are used when omitted.
 
-    for network in networks:
-        vpc_name = network.name
-        subnets = []
+    Returns:
+        A dictionary where keys are VPC network names and values are lists of subnet dictionaries.
+    """
+    subnet_client = get_client(compute_v1.SubnetworksClient, credentials)
+
+    subnets_by_network = {}
+    request = compute_v1.AggregatedListSubnetworksRequest(project=project_id)
+    for page in subnet_client.aggregated_list(request=request).pages:
+        count_api_call('subnetworks.aggregatedList')
+        for scope, scoped_list in page.items.items():
+            for subnet in scoped_list.subnetworks:
+                network_name = subnet.network.split('/')[-1]
+                subnets_by_network.setdefault(network_name, []).append(subnet_details(subnet))
+
+    return subnets_by_network
+
+
+def list_subnets_by_network_per_region(project_id, network_names, credentials=None):
+    """Legacy collection mode: lists the subnets of every region once for every VPC network.
+
+    Kept for comparison with list_subnets_by_network, it issues networks x regions list calls.
+    """
+    subnet_client = get_client(compute_v1.SubnetworksClient, credentials)
+    regions = list_regions(project_id)
+
+    subnets_by_network = {}
+    for vpc_name in network_names:
+        subnets = subnets_by_network.setdefault(vpc_name, [])
 
         # List subnets for each region
         for region in regions:
             subnet_request = compute_v1.ListSubnetworksRequest(project=project_id, region=region)
-            for subnet in subnet_client.list(request=subnet_request):
-                if subnet.network.split('/')[-1] == vpc_name:
-                    subnets.append({
-                        'name': subnet.name,
-                        'region': region,
-                        'ip_cidr_range': subnet.ip_cidr_range,
-                        'private_ip_google_access': subnet.private_ip_google_access,
-                        'secondary_ip_ranges': [
-                            {'range_name': range.range_name, 'ip_cidr_range': range.ip_cidr_range}
-                            for range in subnet.secondary_ip_ranges
-
-                        ]
-                    })
-
-        vpc_details.append({
-            'name': vpc_name,
-            'subnets': subnets
-        })
+            for page in subnet_client.list(request=subnet_request).pages:
+                count_api_call('subnetworks.list')
+                for subnet in page.items:
+                    if subnet.network.split('/')[-1] == vpc_name:
+                        subnets.append(subnet_details(subnet))
+
+    return subnets_by_network
+
+
+def peering_details(network):
+    """Converts the peerings of a compute_v1.Network into the list_vpc_peerings dictionaries."""
+    return [
+        {
+            'network': network.name,
+            'name': peering.name,
+            'peered_network': peering.network,
+            'state': peering.state,
+            'auto_create_routes': peering.auto_create_routes
+        }
+        for peering in network.peerings
+    ]
+
+
+def list_networks(project_id):
+    """Lists the VPC networks of a project once per crawl, see memoize_for_crawl.
+
+    list_vpc_network_names, list_vpc_network_fingerprints and list_vpc_peerings all read this
+    one networks.list sweep.
+
+    Returns:
+        A list of dictionaries with the network 'name', its 'fingerprint' (see
+        network_fingerprint) and its 'peerings' (see peering_details).
+    """
+    def fetch_networks():
+        network_client = get_client(compute_v1.NetworksClient)
+        network_request = compute_v1.ListNetworksRequest(project=project_id)
+        networks = []
+        for page in network_client.list(request=network_request).pages:
+            count_api_call('networks.list')
+            networks.extend(
+                {'name': network.name, 'fingerprint': network_fingerprint(network), 'peerings': peering_details(network)}
+                for network in page.items
+            )
+        return networks
+
+    return memoize_for_crawl(('networks', project_id), fetch_networks)
+
+
+def list_vpc_network_names(project_id):
+    """Returns the names of the VPC networks of a project."""
+    return [network['name'] for network in list_networks(project_id)]
+
+
+def network_fingerprint(network):
+    """Digest of the parts of a compute_v1.Network the graph is built from.
+
+    Networks carry no API fingerprint, so this hashes their subnetwork links, peerings and
+    routing settings, which change whenever a subnet or peering is added, removed or updated.
+    """
+    parts = [network.name, str(network.id), network.routing_config.routing_mode, str(network.mtu)]
+    parts.extend(sorted(network.subnetworks))
+    parts.extend(sorted(
+        f"{peering.name}|{peering.network}|{peering.state}|{peering.auto_create_routes}"
+        for peering in network.peerings
+    ))
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+
+def list_vpc_network_fingerprints(project_id):
+    """Returns a dictionary of VPC network name to network_fingerprint, see list_networks."""
+    return {network['name']: network['fingerprint'] for network in list_networks(project_id)}
+
 
-        vpc_peering_pairs = list_vpc_peerings(project_id)
+def build_vpc_details(network_names, subnets_by_network):
+    """Joins network names with their subnets into the vpc_details list."""
+    return [
+        {'name': vpc_name, 'subnets': subnets_by_network.get(vpc_name, [])}
+        for vpc_name in network_names
+    ]
 
-        '''
-        # Collect VPC peering information
-        for peering in network.peerings:
-            if peering.state == compute_v1.NetworkPeering.State.ACTIVE:
-                peer_network = peering.network.split('/')[-1]
-                vpc_peering_pairs.append((vpc_name, peer_network))
-                print("this is the vpc peering stage")
-        '''
+
+def list_vpc_networks_with_subnets_and_peering(project_id, subnet_mode="aggregated"):
+    """Lists the VPC networks of a project together with their subnets and peerings.
+
+    Args:
+        project_id: The Google Cloud project ID.
+        subnet_mode: "aggregated" (default) reads all subnets with one aggregated-list call,
+            "per_region" lists the subnets of every region once per network.
+
+    Returns:
+        A tuple of (vpc_details, vpc_peering_pairs). vpc_details is a list of dictionaries with
+        the VPC 'name' and its 'subnets'.
+    """
+    # List all VPC networks
+    network_names = list_vpc_network_names(project_id)
+
+    if subnet_mode == "per_region":
+        subnets_by_network = list_subnets_by_network_per_region(project_id, network_names)
+    else:
+        subnets_by_network = list_subnets_by_network(project_id)
+
+    vpc_details = build_vpc_details(network_names, subnets_by_network)
+
+    vpc_peering_pairs = list_vpc_peerings(project_id)
 
     return vpc_details, vpc_peering_pairs
 
 
+def compare_subnet_collection_modes(project_id):
+    """Collects the VPCs of a project in both subnet modes and prints the API calls each one made."""
+    results = {}
+    for subnet_mode in ("per_region", "aggregated"):
+        with crawl_scope(CrawlScope()) as crawl:
+            results[subnet_mode] = list_vpc_networks_with_subnets_and_peering(project_id, subnet_mode)
+        print(f"{subnet_mode}: {crawl.api_call_total()} list calls {dict(crawl.api_calls)}")
+
+    def by_name(vpc_details):
+        return {vpc['name']: sorted(vpc['subnets'], key=lambda subnet: (subnet['region'], subnet['name']))
+                for vpc in vpc_details}
+
+    if by_name(results["per_region"][0]) != by_name(results["aggregated"][0]):
+        print("WARNING: subnet collection modes returned different vpc_details")
+    return results
+
+
 ########### START : this is a custom function from gemini-vpc-peering.py file #########
 
 def list_vpc_peerings(project_id):
-    client = compute_v1.NetworksClient()
+    """Returns the peerings of every VPC network of a project, see list_networks."""
+    return [peering for network in list_networks(project_id) for peering in network['peerings']]
 
-    # List all networks in the project
-    networks = client.list(project=project_id)
 
-    peerings = []
+########### END : this is a custom function from gemini-vpc-peering.py file #########
 
-    # Iterate through networks and check for peerings
-    for network in networks:
-        for peering in network.peerings:
-            peerings.append({
-                'network': network.name,
-                'peered_network': peering.network,
-                'state': peering.state,
-                'auto_create_routes': peering.auto_create_routes
-            })
+def list_routes_by_next_hop_peering(project_id):
+    """Lists every route of a project in one paged sweep and indexes the peering routes.
 
-    return peerings
+    Args:
+        project_id: The Google Cloud project ID.
 
+    Returns:
+        A dictionary keyed by (network name, nextHopPeering) whose values are the
+        destination ranges of the routes with that next hop.
+    """
+    compute = get_discovery_service('compute', 'v1')
+    routes_by_peering = {}
+
+    routes_request = compute.routes().list(project=project_id)
+    while routes_request is not None:
+        routes_response = routes_request.execute()
+        count_api_call('routes.list')
+
+        for route in routes_response.get('items', []):
+            if 'nextHopPeering' in route:
+                key = (route['network'].split('/')[-1], route['nextHopPeering'])
+                routes_by_peering.setdefault(key, []).append(route['destRange'])
+
+        routes_request = compute.routes().list_next(previous_request=routes_request,
+                                                    previous_response=routes_response)
+    return routes_by_peering
+
+
+def peering_imported_ranges(routes_by_peering, peering):
+    """Returns the destination ranges imported through a peering from the route index.
+
+    nextHopPeering holds the peering name, the peered network URL is matched as well.
+    """
+    ranges = []
+    for next_hop in (peering.get('name'), peering['peered_network']):
+        ranges.extend(routes_by_peering.get((peering['network'], next_hop), []))
+    return ranges
 
-########### END : this is a custom function from gemini-vpc-peering.py file #########
 
 def generate_network_visualization(project_id, vpc_details, vpc_peering_pairs):
     nodes = []
     edges = []
+    # built on the first servicenetworking peering, shared by all peerings of the project
+    routes_by_peering = None
 
     # Add project node
     nodes.append({
@@ -198,37 +420,21 @@ def generate_network_visualization(project_id, vpc_details, vpc_peering_pairs):
             gcp_managed_vpc_string = "gcp-managed-vpc-" + str(peering['network'])
             print(gcp_managed_vpc_string)
 
-            edges.append({"from": peering['network'], "to": gcp_managed_vpc_string, "smooth": {type: "curvedCW", "roundness": 0.2} ,"dashes": 'true', "color": 'red'})
+            edges.append({"from": peering['network'], "to": gcp_managed_vpc_string, "smooth": {"type": "curvedCW", "roundness": 0.2} ,"dashes": 'true', "color": 'red'})
             allocated_ip_range_string2 = list_allocated_ranges(project_id, peering['network'])
             print(f"allocated_ip_range_string2: {allocated_ip_range_string2}")
             nl = '\n'
 
-            # List all routes
-            compute = discovery.build('compute', 'v1')
-            routes_request = compute.routes().list(project=project_id, filter=f"network eq .*/{peering['network']}$")
+            # Imported routes of this peering, from the project's route index
+            if routes_by_peering is None:
+                routes_by_peering = list_routes_by_next_hop_peering(project_id)
             destination_ip_range = "destination_ip_range :" + "\n"
-            if routes_request:
-                print(routes_request)
-            else:
-                print("Nothing in Route Request")
-
-            while routes_request is not None:
-                routes_response = routes_request.execute()
-
-                for route in routes_response.get('items', []):
-                    # print(route['destRange'] + "and" + route['nextHopPeering'])
-                    # Check if the route is an imported one from this peering
-                    if 'nextHopPeering' in route and route['nextHopPeering'] == peering['peered_network']:
-                        print(f"  Destination: {route['destRange']}")
-                        destination_ip_range = destination_ip_range + route['destRange'] + "\n"
-                        print(destination_ip_range)
-
-                routes_request = compute.routes().list_next(previous_request=routes_request,
-                                                            previous_response=routes_response)
+            for dest_range in peering_imported_ranges(routes_by_peering, peering):
+                destination_ip_range = destination_ip_range + dest_range + "\n"
 
             nodes.append({
                 "id": f"{gcp_managed_vpc_string}",
-                "label": f"vpc : {extracted_text} {nl}{allocated_ip_range_string2}",
+                "label": f"vpc : {extracted_text} {nl}{allocated_ip_range_string2}{nl}{destination_ip_range}",
                 "level": 1
             })
 
@@ -237,7 +443,7 @@ def generate_network_visualization(project_id, vpc_details, vpc_peering_pairs):
         print("-" * 40)
 
         if extracted_text != 'servicenetworking':
-            edges.append({"from": peering['network'], "to": extracted_text, "smooth": {type: "curvedCW", "roundness": 0.2},"dashes": 'true', "color": 'green'})
+            edges.append({"from": peering['network'], "to": extracted_text, "smooth": {"type": "curvedCW", "roundness": 0.2},"dashes": 'true', "color": 'green'})
             print(f"normal vpc peering - from {peering['network']} to {extracted_text}")
 
     return nodes, edges
@@ -245,12 +451,40 @@ def generate_network_visualization(project_id, vpc_details, vpc_peering_pairs):
 
 ######## Start Allocted IP range ####
 
-def list_allocated_ranges(project_id, network):
-    """Lists allocated IP ranges for services in a GCP project and network."""
+def list_psa_global_addresses(project_id):
+    """Lists the global addresses a project reserved for Private Service Access in one paged sweep.
+
+    Args:
+        project_id: The Google Cloud project ID.
+
+    Returns:
+        A dictionary keyed by address name with the range's 'name', 'network' (VPC name),
+        'address' and 'prefix_length'.
+    """
+    compute = get_discovery_service('compute', 'v1')
+    addresses = {}
+
+    address_request = compute.globalAddresses().list(project=project_id, filter='purpose = "VPC_PEERING"')
+    while address_request is not None:
+        address_response = address_request.execute()
+        count_api_call('globalAddresses.list')
+
+        for address in address_response.get('items', []):
+            addresses[address['name']] = {
+                'name': address['name'],
+                'network': address.get('network', '').split('/')[-1],
+                'address': address.get('address', 'N/A'),
+                'prefix_length': address.get('prefixLength', 'N/A')
+            }
+
+        address_request = compute.globalAddresses().list_next(previous_request=address_request,
+                                                              previous_response=address_response)
+    return addresses
+
 
-    credentials, _ = default()
-    service_networking = discovery.build('servicenetworking', 'v1', credentials=credentials)
-    compute = discovery.build('compute', 'v1', credentials=credentials)
+def list_service_connections(project_id, network):
+    """Lists the servicenetworking connections of a VPC network."""
+    service_networking = get_discovery_service('servicenetworking', 'v1')
 
     # Construct the parent resource name
     parent = 'services/servicenetworking.googleapis.com'
@@ -258,33 +492,49 @@ def list_allocated_ranges(project_id, network):
     # Construct the network resource name
     network_name = f'projects/{project_id}/global/networks/{network}'
 
-    try:
-        # List the connections
-        request = service_networking.services().connections().list(parent=parent, network=network_name)
-        response = request.execute()
-
-        if 'connections' in response:
-            for connection in response['connections']:
-                print(f"Service: {connection.get('service', 'N/A')}")
-                print(f"Network: {connection.get('network', 'N/A')}")
-                print("Allocated IP Ranges:")
-                for range_name in connection.get('reservedPeeringRanges', []):
-                    # Fetch the actual CIDR range
-                    range_request = compute.globalAddresses().get(project=project_id, address=range_name)
-                    range_response = range_request.execute()
-                    cidr = range_response.get('address', 'N/A')
-                    prefix_length = range_response.get('prefixLength', 'N/A')
-                    print(f"  - {range_name}: {cidr}/{prefix_length}")
-                    allocated_ip_range_string = f" {range_name} : {cidr}/{prefix_length}"
-
-                    return allocated_ip_range_string
-
-                print("---")
-        else:
-            print("No connections found.")
+    request = service_networking.services().connections().list(parent=parent, network=network_name)
+    response = request.execute()
+    count_api_call('connections.list')
+    return response.get('connections', [])
+
+
+def resolve_psa_ranges(project_id, network):
+    """Returns every Private Service Access range allocated to a VPC network.
+
+    The project's PSA addresses and the network's connections are each listed once per crawl
+    (see memoize_for_crawl) and joined in memory.
+
+    Returns:
+        A list of dictionaries with the range 'name', 'address', 'prefix_length' and the
+        'service' of the connection using it.
+    """
+    addresses = memoize_for_crawl(('psa_addresses', project_id), list_psa_global_addresses, project_id)
+    connections = memoize_for_crawl(('psa_connections', project_id, network), list_service_connections,
+                                    project_id, network)
+    ranges = []
+    for connection in connections:
+        for range_name in connection.get('reservedPeeringRanges', []):
+            address = addresses.get(range_name, {'address': 'N/A', 'prefix_length': 'N/A'})
+            ranges.append({
+                'name': range_name,
+                'address': address['address'],
+                'prefix_length': address['prefix_length'],
+                'service': connection.get('service', 'N/A')
+            })
+    return ranges
+
 
+def list_allocated_ranges(project_id, network):
+    """Lists allocated IP ranges for services in a GCP project and network."""
+    try:
+        ranges = resolve_psa_ranges(project_id, network)
     except Exception as e:
         print(f"An error occurred: {e}")
+        return None
+
+    if not ranges:
+        print("No connections found.")
+    return "\n".join(f" {range['name']} : {range['address']}/{range['prefix_length']}" for range in ranges)
 
 
 ######## End AllocatedA IP Range ###
@@ -373,11 +623,17 @@ def main():
     if not project_id:
         raise ValueError("Please set the GOOGLE_CLOUD_PROJECT environment variable")
 
-    print(f"Fetching VPC information for project: {project_id}")
-    vpc_details, vpc_peering_pairs = list_vpc_networks_with_subnets_and_peering(project_id)
+    if os.environ.get('COMPARE_SUBNET_MODES'):
+        print(f"Comparing subnet collection modes for project: {project_id}")
+        compare_subnet_collection_modes(project_id)
+
+    # one crawl, so the networks, routes and PSA listings are shared by the steps below
+    with crawl_scope(CrawlScope()):
+        print(f"Fetching VPC information for project: {project_id}")
+        vpc_details, vpc_peering_pairs = list_vpc_networks_with_subnets_and_peering(project_id)
 
-    print("Generating network visualization...")
-    nodes, edges = generate_network_visualization(project_id, vpc_details, vpc_peering_pairs)
+        print("Generating network visualization...")
+        nodes, edges = generate_network_visualization(project_id, vpc_details, vpc_peering_pairs)
 
     print("Creating HTML file...")
     create_html(project_id, nodes, edges)
@@ -0,0 +1,716 @@
+import os
+from collections import Counter, defaultdict
+from contextvars import copy_context
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from google.cloud import resourcemanager_v3
+from nw_pycharm_2 import *
+from clients import get_client
+from inventory_cache import cached_fetch, get_inventory_cache
+from asset_collector import collect_org_from_assets
+from graph_builder import RELATION_EDGE_STYLE, GraphBuilder
+from graph_clusters import HIERARCHY_EDGE_KINDS
+from graph_snapshot import open_latest_snapshot
+from cidr_overlaps import add_overlap_edges
+
+# Number of concurrent list_folders/list_projects calls while discovering the hierarchy
+HIERARCHY_WORKERS = int(os.environ.get('HIERARCHY_WORKERS', '8'))
+# Number of projects whose network inventory is collected concurrently
+PROJECT_WORKERS = int(os.environ.get('PROJECT_WORKERS', '16'))
+# INCREMENTAL_REFRESH=1 makes crawls skip projects whose fingerprints did not change
+INCREMENTAL_REFRESH = os.environ.get('INCREMENTAL_REFRESH', '') == '1'
+# Longest time, in seconds, an unchanged project is copied from the previous snapshot before it
+# is collected in full again
+INCREMENTAL_MAX_AGE = int(os.environ.get('INCREMENTAL_MAX_AGE', str(7 * 24 * 3600)))
+# "compute" crawls folder by folder and project by project, "assets" reads Cloud Asset Inventory
+COLLECTOR_BACKEND = os.environ.get('COLLECTOR_BACKEND', 'compute')
+# Project the Shared VPC hosts are listed through, any collected project of the crawl by default
+XPN_CALLER_PROJECT = os.environ.get('XPN_CALLER_PROJECT', '')
+# Number of projects tried in turn when listing the Shared VPC hosts fails
+XPN_CALLER_ATTEMPTS = int(os.environ.get('XPN_CALLER_ATTEMPTS', '3'))
+
+
+def get_organization_structure(organization_id, use_cache=True, incremental=INCREMENTAL_REFRESH,
+                               backend=COLLECTOR_BACKEND, graph=None, progress=None, warnings=None,
+                               crawl=None):
+    """Crawls an organization and returns its graph as a GraphBuilder.
+
+    With use_cache, folders, projects and network inventory are read from the inventory cache
+    and only missing or expired entries are fetched from the APIs. With incremental, the graph
+    of the organization's latest snapshot is patched: projects whose fingerprints did not change
+    since the previous crawl are copied from it instead of being collected again.
+    backend "assets" collects everything from Cloud Asset Inventory instead, without the cache.
+
+    The compute backend adds folders and projects as they are listed and each project's network
+    resources as soon as it is collected, pass a graph with a listener to follow the crawl.
+    progress, an optional collections.Counter, counts the 'folders' and 'projects' found, the
+    hierarchy 'listings_done' and the 'projects_collected' while the crawl runs. warnings, an
+    optional list, collects the parts of the crawl that failed without failing the whole crawl,
+    e.g. the Shared VPC hosts, which are printed otherwise. crawl, an optional CrawlScope, counts
+    the crawl's API calls and holds what it memoizes, a new one is used by default.
+    """
+    parent = f"organizations/{organization_id}"
+
+    print(f"Fetching resources for organization: {organization_id}")
+
+    with crawl_scope(crawl or CrawlScope()):
+        if graph is None:
+            graph = GraphBuilder()
+        graph.add_node(organization_id, "organization", f"Organization\n{organization_id}", 0)
+
+        if backend == "assets":
+            containers, inventories = collect_org_from_assets(organization_id)
+            if progress is not None:
+                for container in containers:
+                    progress['listings_done'] += 2
+                    progress['folders'] += len(container['folders'])
+                    progress['projects'] += len(container['projects'])
+                progress['projects_collected'] += len(inventories)
+            resolve_shared_vpc(organization_id, inventories, warnings=warnings)
+            assemble_graph(graph, containers, inventories)
+            return graph
+
+        folder_client = get_client(resourcemanager_v3.FoldersClient)
+        project_client = get_client(resourcemanager_v3.ProjectsClient)
+
+        cache = get_inventory_cache() if use_cache else None
+        previous = load_previous_graph(organization_id) if incremental and cache is not None else None
+        recursive_list_resources(folder_client, project_client, parent, graph, cache=cache,
+                                 incremental=incremental, progress=progress, warnings=warnings,
+                                 previous=previous)
+
+        return graph
+
+
+def load_previous_graph(organization_id):
+    """Returns the graph of the organization's latest snapshot as a GraphBuilder, or None."""
+    try:
+        snapshot = open_latest_snapshot(organization_id)
+    except (OSError, ValueError) as e:
+        print(f"Error reading the latest snapshot of organization {organization_id}: {str(e)}")
+        return None
+    if snapshot is None:
+        return None
+    return GraphBuilder.from_graph_data(snapshot.graph_data())
+
+
+def fetch_folders(client, parent):
+    request = resourcemanager_v3.ListFoldersRequest(parent=parent)
+    folders = []
+    page_result = client.list_folders(request=request)
+    for response in page_result:
+        folders.append({
+            "name": response.name,
+            "display_name": response.display_name,
+            "state": response.state,
+            "etag": response.etag,
+            "update_time": response.update_time
+        })
+    return folders
+
+
+def fetch_projects(client, parent):
+    request = resourcemanager_v3.ListProjectsRequest(parent=parent)
+    projects = []
+    page_result = client.list_projects(request=request)
+    for response in page_result:
+        if response.state == resourcemanager_v3.Project.State.ACTIVE:
+            projects.append({
+                "project_id": response.project_id,
+                "name": response.name,
+                "create_time": response.create_time,
+                "update_time": response.update_time,
+                "etag": response.etag,
+                "labels": dict(response.labels)
+            })
+    return projects
+
+
+def list_folders(client, parent, cache=None):
+    folders = []
+    try:
+        folders = cached_fetch(cache, parent, 'folders', fetch_folders, client, parent)
+    except Exception as e:
+        print(f"Error listing folders under {parent}: {str(e)}")
+    return folders
+
+
+def list_projects(client, parent, cache=None):
+    projects = []
+    try:
+        projects = cached_fetch(cache, parent, 'projects', fetch_projects, client, parent)
+    except Exception as e:
+        print(f"Error listing projects under {parent}: {str(e)}")
+    return projects
+
+
+def discover_hierarchy(folder_client, project_client, parent, level=0, max_workers=HIERARCHY_WORKERS, cache=None,
+                       on_listed=None):
+    """Discovers the folder tree under parent breadth-first on a bounded worker pool.
+
+    The folders and projects of every container are listed concurrently, and the children of a
+    folder are scheduled as soon as its folder listing returns.
+
+    Args:
+        folder_client: resourcemanager_v3.FoldersClient
+        project_client: resourcemanager_v3.ProjectsClient
+        parent: Resource name to start from, e.g. "organizations/123".
+        level: Graph level of the parent node.
+        max_workers: Maximum number of concurrent list calls.
+        cache: Optional InventoryCache the folder and project listings are read through.
+        on_listed: Optional callback called as on_listed(container, kind) in the calling thread
+            each time the 'folders' or 'projects' of a container are listed.
+
+    Returns:
+        A list of dictionaries in breadth-first order, one per container (the parent and every
+        folder below it), with the container's 'parent' resource name, its 'level' and the
+        'folders' and 'projects' listed directly under it.
+    """
+    containers = {}
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def visit(name, container_level, key):
+            containers[key] = {"parent": name, "level": container_level, "folders": [], "projects": []}
+            pending[executor.submit(list_folders, folder_client, name, cache)] = ("folders", key)
+            pending[executor.submit(list_projects, project_client, name, cache)] = ("projects", key)
+
+        visit(parent, level, ())
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                container = containers[key]
+                container[kind] = future.result()
+                if on_listed is not None:
+                    on_listed(container, kind)
+                if kind == "folders":
+                    for index, folder in enumerate(container["folders"]):
+                        visit(folder["name"], container["level"] + 1, key + (index,))
+
+    # keys are the child index path from the parent, so this is a deterministic breadth-first order
+    return [containers[key] for key in sorted(containers, key=lambda key: (len(key), key))]
+
+
+def recursive_list_resources(folder_client, project_client, parent, graph, level=0, cache=None,
+                             incremental=False, progress=None, warnings=None, previous=None):
+    """Crawls the hierarchy under parent and adds it to the graph while it is discovered.
+
+    Folders and projects are added as soon as they are listed and the network resources of a
+    project as soon as its inventory is collected, or copied from previous, the previous crawl's
+    GraphBuilder, when an incremental crawl reuses the project. Peerings and shared VPC edges
+    need the whole crawl and are added last. progress and warnings are updated as described in
+    get_organization_structure.
+    """
+    if progress is None:
+        progress = Counter()
+    project_levels = {}
+
+    def on_listed(container, kind):
+        progress['listings_done'] += 1
+        progress[kind] += len(container[kind])
+        add_container(graph, container, kind)
+        if kind == "projects":
+            for project in container['projects']:
+                project_levels[project['project_id']] = container['level']
+
+    containers = discover_hierarchy(folder_client, project_client, parent, level, cache=cache,
+                                    on_listed=on_listed)
+
+    peerings_by_project = {}
+    previous_edges = None
+
+    def on_collected(project, inventory):
+        nonlocal previous_edges
+        project_id = project['project_id']
+        progress['projects_collected'] += 1
+        peerings_by_project[project_id] = []
+        if inventory['reused']:
+            if previous_edges is None:
+                previous_edges = hierarchy_edges_by_target(previous)
+            copy_project_resources(graph, previous, project_id, previous_edges)
+            peerings_by_project[project_id] = [
+                peering_record(project_id, vpcpeering, project_levels[project_id])
+                for vpcpeering in inventory['vpc_peering_pairs']
+            ]
+        else:
+            add_project_resources(graph, [project], project_levels[project_id], {project_id: inventory},
+                                  peerings_by_project[project_id])
+
+    projects = [project for container in containers for project in container['projects']]
+    inventories = collect_inventories(projects, cache=cache, incremental=incremental, on_collected=on_collected,
+                                      previous=previous)
+    if incremental:
+        reused = sum(1 for inventory in inventories.values() if inventory['reused'])
+        print(f"Incremental refresh: {len(projects) - reused} of {len(projects)} projects changed")
+
+    if parent.startswith("organizations/"):
+        resolve_shared_vpc(parent.split('/')[-1], inventories, cache, warnings)
+
+    # resolve peerings in crawl order, so the same org always gets the same edge directions
+    peerings = [peering for project in projects for peering in peerings_by_project[project['project_id']]]
+    finish_graph(graph, containers, inventories, peerings)
+
+
+def add_container(graph, container, kind):
+    """Adds the 'folders' or 'projects' listed directly under a container to the graph."""
+    parent_id = container['parent'].split('/')[-1]
+    container_level = container['level']
+
+    if kind == "folders":
+        for folder in container['folders']:
+            folder_id = folder['name'].split('/')[-1]
+            graph.add_node(folder_id, "folder", folder['display_name'], container_level + 1)
+            graph.add_edge(parent_id, folder_id)
+    else:
+        for project in container['projects']:
+            graph.add_node(project['project_id'], "project", f"{project['project_id']}\n{project['name']}",
+                           container_level + 1, project_id=project['project_id'])
+            graph.add_edge(parent_id, project['project_id'])
+
+
+def hierarchy_edges_by_target(graph):
+    """Returns the parent and NAT edges of a graph indexed by the node they lead to."""
+    edges = defaultdict(list)
+    for edge in graph.edges:
+        if edge['kind'] in HIERARCHY_EDGE_KINDS:
+            edges[edge['to']].append(edge)
+    return edges
+
+
+def copy_project_resources(graph, previous, project_id, previous_edges):
+    """Adds the VPCs, subnets and Cloud NATs of a project as the previous crawl's graph has them.
+
+    Args:
+        graph: GraphBuilder the nodes and edges are added to.
+        previous: GraphBuilder of the previous crawl, see load_previous_graph.
+        project_id: The project, its own node is added with its container, see add_container.
+        previous_edges: Hierarchy edges of previous, see hierarchy_edges_by_target.
+    """
+    for node_id in previous.project_node_ids(project_id):
+        if node_id == project_id:
+            continue
+        graph.add_node_data(previous.get_node(node_id))
+        for edge in previous_edges.get(node_id, []):
+            graph.add_edge_data(edge)
+
+
+def assemble_graph(graph, containers, inventories):
+    """Adds the folders, projects and project network resources of a crawl to the graph.
+
+    Args:
+        graph: GraphBuilder the nodes and edges are added to.
+        containers: Containers in breadth-first order, as returned by discover_hierarchy.
+        inventories: Inventories by project ID, as returned by collect_inventories.
+    """
+    for container in containers:
+        add_container(graph, container, "folders")
+        add_container(graph, container, "projects")
+
+    peerings = []
+    for container in containers:
+        add_project_resources(graph, container['projects'], container['level'], inventories, peerings)
+
+    finish_graph(graph, containers, inventories, peerings)
+
+
+def finish_graph(graph, containers, inventories, peerings):
+    """Adds the edges that need the whole crawl: shared VPC, peering and CIDR overlap edges."""
+    add_shared_vpc_edges(graph, inventories)
+
+    org_project_ids = {project['project_id'] for container in containers for project in container['projects']}
+    resolve_peerings(graph, peerings, org_project_ids)
+
+    add_overlap_edges(graph)
+
+
+def subnet_ranges(subnet):
+    """Returns the primary and secondary ranges of a subnet, as the 'ranges' of its node."""
+    return [{"name": subnet['name'], "type": "primary", "cidr": subnet['ip_cidr_range']}] + [
+        {"name": secondary['range_name'], "type": "secondary", "cidr": secondary['ip_cidr_range']}
+        for secondary in subnet['secondary_ip_ranges']
+    ]
+
+
+def list_psa_ranges(project_id, vpc_peering_pairs):
+    """Returns the Private Service Access ranges used by the VPC networks of a project.
+
+    Only the networks with a servicenetworking peering are asked for their connections, and
+    resolve_psa_ranges joins each connection to the project's PSA addresses, so addresses
+    reserved for VPC peering but used by no connection are left out.
+
+    Returns:
+        A list of the resolve_psa_ranges dictionaries, each with the VPC 'network' it is in.
+    """
+    networks = sorted({
+        peering['network'] for peering in vpc_peering_pairs
+        if re.search(r"(?<=networks/)([^/?]+)", peering['peered_network']).group(1) == 'servicenetworking'
+    })
+    return [
+        dict(psa_range, network=network)
+        for network in networks
+        for psa_range in resolve_psa_ranges(project_id, network)
+    ]
+
+
+def peering_record(project_id, vpcpeering, level):
+    """Returns the raw record of a peering as collected, before resolve_peerings classifies it."""
+    peered_vpc = re.search(r"(?<=networks/)([^/?]+)", vpcpeering['peered_network'])
+    peered_vpc_project = re.search(r"(?<=projects\/)([^/]+)", vpcpeering['peered_network'])
+    return {
+        "project_id": project_id,
+        "network": vpcpeering['network'],
+        "peered_project_id": peered_vpc_project.group(1),
+        "peered_network": peered_vpc.group(1),
+        "level": level
+    }
+
+
+def resolve_peerings(graph, peerings, org_project_ids):
+    """Adds the peering edges of a crawl in one pass over the raw peering records.
+
+    Peerings have the following cases - (a) within the same project (b) within the same org
+    (c) across orgs, where the peered project and VPC get their own nodes (d) Private Service
+    Access (service networking api), where the Google managed VPC gets a node. Both sides of a
+    peering inside the org report it, the edge is added once for the first record seen.
+
+    Args:
+        graph: GraphBuilder the nodes and edges are added to.
+        peerings: Raw records from peering_record, in crawl order.
+        org_project_ids: Set of every project ID in the organization.
+    """
+    seen = set()
+    for peering in peerings:
+        source_vpc_string = f"{peering['project_id']}_{peering['network']}"
+        level = peering['level']
+
+        #case d - service networking api vpc peering
+        if peering['peered_network'] == 'servicenetworking':
+            gcp_managed_vpc_string = "gcp-managed-vpc-" + str(peering['network'])
+            graph.add_node(peering['peered_project_id'], "vpc", gcp_managed_vpc_string, level + 2)
+            graph.add_edge(source_vpc_string, peering['peered_project_id'], "psa-peering",
+                           label="vpc-peering", **RELATION_EDGE_STYLE)
+            continue
+
+        dest_vpc_string = f"{peering['peered_project_id']}_{peering['peered_network']}"
+        pair = (min(source_vpc_string, dest_vpc_string), max(source_vpc_string, dest_vpc_string))
+        if pair in seen:
+            continue
+        seen.add(pair)
+
+        #case c - the peered vpc project is not in the org, so add nodes for the project and its vpc
+        if peering['peered_project_id'] not in org_project_ids:
+            graph.add_node(peering['peered_project_id'], "project", peering['peered_project_id'], level + 1,
+                           project_id=peering['peered_project_id'])
+            graph.add_node(dest_vpc_string, "vpc", peering['peered_network'], level + 2,
+                           project_id=peering['peered_project_id'])
+            graph.add_edge(peering['peered_project_id'], dest_vpc_string)
+
+        #case a, b, c
+        graph.add_edge(source_vpc_string, dest_vpc_string, "vpc-peering",
+                       label="vpc-peering", **RELATION_EDGE_STYLE)
+
+
+def project_fingerprints(project):
+    """Returns the change signal an incremental refresh compares for a project.
+
+    That is the project's etag (or update time), already listed with the hierarchy, and the
+    fingerprint of each of its VPC networks, which covers their subnet links and peerings, from
+    the crawl's one networks.list sweep of the project (see list_networks). In-place subnet
+    updates, NAT and PSA range changes are not part of it, they are picked up when the project
+    is collected in full again, at the latest after INCREMENTAL_MAX_AGE.
+    """
+    return {
+        'project': project.get('etag') or str(project.get('update_time')),
+        'networks': list_vpc_network_fingerprints(project['project_id'])
+    }
+
+
+def collect_project_inventory(project, cache=None, incremental=False, previous=None):
+    """Runs the blocking network API calls of one project.
+
+    Failures are recorded per step in 'errors' instead of being raised, so one project without
+    the Compute Engine API does not stop the others. With a cache, every resource kind is read
+    from it and only fetched when missing or expired.
+
+    With incremental, the project_fingerprints are compared with the previous crawl. A project
+    that did not change and is in previous, the previous crawl's GraphBuilder, is 'reused': only
+    its peerings are read, from the fingerprints' networks listing, and its resources are copied
+    from previous, see copy_project_resources. A changed one is collected again even if its
+    cache entries are still fresh.
+
+    Returns:
+        A dictionary with the project's 'vpc_details', 'vpc_peering_pairs',
+        'nat_configs_by_router', 'psa_ranges', whether it was 'reused' from the previous crawl
+        and the 'errors' raised by each step. 'xpn_host' is set later by resolve_shared_vpc.
+    """
+    project_id = project['project_id']
+    inventory = {
+        "project_id": project_id,
+        "vpc_details": [],
+        "vpc_peering_pairs": [],
+        "nat_configs_by_router": {},
+        "psa_ranges": [],
+        "xpn_host": None,
+        "reused": False,
+        "errors": {}
+    }
+
+    fingerprints = None
+    if incremental and cache is not None:
+        try:
+            fingerprints = project_fingerprints(project)
+        except Exception:
+            # e.g. Compute Engine API disabled, the regular collection below records the error
+            fingerprints = None
+    if fingerprints is not None and previous is not None and previous.project_node_ids(project_id):
+        found, previous_fingerprints = cache.get(project_id, 'fingerprints', max_age=INCREMENTAL_MAX_AGE)
+        if found and previous_fingerprints == fingerprints:
+            inventory['vpc_peering_pairs'] = list_vpc_peerings(project_id)
+            inventory['reused'] = True
+            return inventory
+
+    def fetch(kind, fetch_function):
+        # a changed project is collected again even if its cache entries are still fresh
+        if fingerprints is not None:
+            return cache.put(project_id, kind, fetch_function(project_id))
+        return cached_fetch(cache, project_id, kind, fetch_function, project_id)
+
+    try:
+        network_names = fetch('networks', list_vpc_network_names)
+        subnets_by_network = fetch('subnets', list_subnets_by_network)
+        inventory['vpc_details'] = build_vpc_details(network_names, subnets_by_network)
+        inventory['vpc_peering_pairs'] = fetch('peerings', list_vpc_peerings)
+    except Exception as e:
+        inventory['errors']['networks'] = e
+    try:
+        inventory['nat_configs_by_router'] = fetch('routers', list_nat_configs)
+    except Exception as e:
+        inventory['errors']['nat'] = e
+    if fingerprints is not None and not inventory['errors']:
+        cache.put(project_id, 'fingerprints', fingerprints)
+
+    # PSA ranges are not covered by the fingerprints, they are only read through the cache TTL
+    if inventory['vpc_peering_pairs']:
+        try:
+            inventory['psa_ranges'] = cached_fetch(cache, project_id, 'psa_ranges', list_psa_ranges, project_id,
+                                                   inventory['vpc_peering_pairs'])
+        except Exception as e:
+            inventory['errors']['psa'] = e
+    return inventory
+
+
+def collect_inventories(projects, max_workers=PROJECT_WORKERS, cache=None, incremental=False, on_collected=None,
+                        previous=None):
+    """Collects the network inventory of many projects concurrently.
+
+    Args:
+        projects: Projects to collect, as returned by list_projects.
+        max_workers: Maximum number of projects collected at the same time.
+        cache: Optional InventoryCache passed to collect_project_inventory.
+        incremental: Skip the deep collection of projects unchanged since the previous crawl.
+        on_collected: Optional callback called as on_collected(project, inventory) in the
+            calling thread as soon as each project is collected.
+        previous: Optional GraphBuilder of the previous crawl, unchanged projects in it are
+            reused, see collect_project_inventory.
+
+    Returns:
+        A dictionary mapping every project ID to its collect_project_inventory result, in the
+        order of projects.
+    """
+    collected = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            # every project is collected in a copy of this context, so in the current crawl_scope
+            executor.submit(copy_context().run, collect_project_inventory, project, cache, incremental,
+                            previous): project
+            for project in projects
+        }
+        for future in as_completed(futures):
+            project = futures[future]
+            collected[project['project_id']] = future.result()
+            if on_collected is not None:
+                on_collected(project, collected[project['project_id']])
+    return {project['project_id']: collected[project['project_id']] for project in projects}
+
+
+def add_project_resources(graph, projects, level, inventories, peerings):
+    """Adds the VPCs, subnets and Cloud NATs of sibling projects.
+
+    Args:
+        graph: GraphBuilder the nodes and edges are added to.
+        projects: Projects listed under the same parent, as returned by list_projects.
+        level: Graph level of the projects' parent.
+        inventories: Collected inventories by project ID, as returned by collect_inventories.
+        peerings: List the projects' raw peering records are appended to, for resolve_peerings.
+    """
+    for project in projects:
+        project_id = project['project_id']
+        inventory = inventories[project_id]
+        try:
+            if 'networks' in inventory['errors']:
+                raise inventory['errors']['networks']
+            vpc_details, vpc_peering_pairs = inventory['vpc_details'], inventory['vpc_peering_pairs']
+            psa_ranges_by_network = defaultdict(list)
+            for psa_range in inventory.get('psa_ranges', []):
+                psa_ranges_by_network[psa_range['network']].append({
+                    "name": psa_range['name'],
+                    "type": "psa",
+                    "cidr": f"{psa_range['address']}/{psa_range['prefix_length']}"
+                })
+            for vpc in vpc_details:
+
+                vpc_node_id = str(project_id) + "_" + str(vpc['name'])
+                graph.add_node(vpc_node_id, "vpc", vpc['name'], level + 2, project_id=project_id, vpc=vpc_node_id,
+                               ranges=psa_ranges_by_network.get(vpc['name'], []))
+                graph.add_edge(project_id, vpc_node_id)
+
+                for subnets in vpc['subnets']:
+                    # adding region also to the subnet id so that it remains unique (failed in case of default vpc and default vpcs)
+                    subnet_node_id = str(vpc_node_id) + "_" + str(subnets['name']) + "_" + str(subnets['region'])
+                    graph.add_node(
+                        subnet_node_id, "subnet",
+                        f"{subnets['ip_cidr_range']}\n{subnets['region']}\n{subnets['private_ip_google_access']}\n{subnets['secondary_ip_ranges']}",
+                        level + 3, project_id=project_id, vpc=vpc_node_id, ranges=subnet_ranges(subnets)
+                    )
+                    graph.add_edge(vpc_node_id, subnet_node_id)
+
+                ###### vpc and subnets complete ######
+
+            # peerings are resolved once the whole org is known, see resolve_peerings
+            for vpcpeering in vpc_peering_pairs:
+                if len(vpcpeering) != 0:
+                    peerings.append(peering_record(project_id, vpcpeering, level))
+        except Exception:
+            print(f"project: {project_id} does not Compute Engine API Enabled")
+
+        #cloud nat code here
+        try:
+            if 'nat' in inventory['errors']:
+                raise inventory['errors']['nat']
+            for router_id, nat_configs in inventory['nat_configs_by_router'].items():
+                for nat_config in nat_configs:
+                    graph.add_node(
+                        router_id, "nat",
+                        f"{nat_config['name']}\n{nat_config['region']}\n{nat_config['vpc_network']}",
+                        level + 4, project_id=project_id
+                    )
+                    nat_vpc_string = str(project_id) + "_" + str(nat_config['vpc_network'])
+                    graph.add_edge(nat_vpc_string, router_id, "nat")
+        except Exception:
+            print(f"project: {project_id} does not Compute Engine API Enabled")
+            ######
+
+
+def add_shared_vpc_edges(graph, inventories):
+    """Adds an edge from the Shared VPC host project to each service project."""
+    #shared vpc host-service vpc start
+    for project_id, inventory in inventories.items():
+        if inventory['xpn_host'] is None:
+            # not a service project
+            continue
+        host_project_id = inventory['xpn_host']
+        graph.add_edge(host_project_id, project_id, "shared-vpc",
+                       label="shared-vpc-projects", **RELATION_EDGE_STYLE)
+        #shared vpc host-service vpc end
+        ######
+
+
+######
+def list_xpn_hosts(organization_id, project_id):
+    """Lists the Shared VPC host projects of an organization.
+
+    Args:
+        organization_id: The organization ID.
+        project_id: Any project of the organization, the API is called on its behalf.
+
+    Returns:
+        The project IDs of the organization's host projects.
+    """
+    client = get_client(compute_v1.ProjectsClient)
+    request = compute_v1.ListXpnHostsProjectsRequest(
+        project=project_id,
+        projects_list_xpn_hosts_request_resource=compute_v1.ProjectsListXpnHostsRequest(
+            organization=organization_id
+        )
+    )
+    return [host.name for host in client.list_xpn_hosts(request=request)]
+
+
+def list_xpn_service_projects(host_project_id):
+    """Returns the IDs of the service projects attached to a Shared VPC host project."""
+    client = get_client(compute_v1.ProjectsClient)
+    request = compute_v1.GetXpnResourcesProjectsRequest(project=host_project_id)
+    return [
+        resource.id for resource in client.get_xpn_resources(request=request)
+        if resource.type_ == "PROJECT"
+    ]
+
+
+def fetch_shared_vpc_hosts(organization_id, project_id, max_workers=PROJECT_WORKERS):
+    """Builds the Shared VPC service project to host project map of an organization.
+
+    The host projects are listed once and their attached service projects are fetched
+    concurrently, so the cost grows with the number of hosts, not of projects.
+
+    Returns:
+        A dictionary mapping every service project ID to its host project ID.
+    """
+    host_project_ids = list_xpn_hosts(organization_id, project_id)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        service_projects = executor.map(list_xpn_service_projects, host_project_ids)
+        return {
+            service_project_id: host_project_id
+            for host_project_id, service_project_ids in zip(host_project_ids, service_projects)
+            for service_project_id in service_project_ids
+        }
+
+
+def xpn_caller_projects(inventories, caller_project=XPN_CALLER_PROJECT, attempts=XPN_CALLER_ATTEMPTS):
+    """Returns the projects to list the Shared VPC hosts through, in the order they are tried.
+
+    The configured caller_project comes first, then up to attempts projects whose inventory was
+    collected without errors, since a project without the Compute Engine API cannot list them.
+    """
+    candidates = [caller_project] if caller_project else []
+    candidates += [
+        project_id for project_id, inventory in inventories.items()
+        if not inventory['errors'] and project_id != caller_project
+    ][:attempts]
+    return candidates
+
+
+def resolve_shared_vpc(organization_id, inventories, cache=None, warnings=None):
+    """Sets the 'xpn_host' of every inventory from the organization's Shared VPC hosts.
+
+    The hosts are listed through the projects of xpn_caller_projects, one after the other until
+    one succeeds. When none does, every 'xpn_host' stays None and the failure is recorded.
+
+    Args:
+        organization_id: The organization ID.
+        inventories: Inventories by project ID, as returned by collect_inventories.
+        cache: Optional InventoryCache, the host map is cached per organization.
+        warnings: Optional list the failure is appended to, it is printed otherwise.
+    """
+    if not inventories:
+        return
+    errors = []
+    for project_id in xpn_caller_projects(inventories):
+        try:
+            service_hosts = cached_fetch(cache, f"organizations/{organization_id}", 'xpn_host',
+                                         fetch_shared_vpc_hosts, organization_id, project_id)
+            break
+        except Exception as e:
+            errors.append(f"{project_id}: {str(e)}")
+    else:
+        message = (f"Shared VPC host projects of organization {organization_id} could not be listed"
+                   + (f" ({'; '.join(errors)})" if errors else ", no project was collected without errors"))
+        if warnings is None:
+            print(message)
+        else:
+            warnings.append(message)
+        return
+    for project_id, inventory in inventories.items():
+        inventory['xpn_host'] = service_hosts.get(project_id)
+
+######
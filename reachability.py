@@ -0,0 +1,286 @@
+import argparse
+import json
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+from graph_snapshot import SNAPSHOT_DIR, open_snapshot
+
+# Peering edges between VPC nodes, see resolve_peerings
+PEERING_EDGE_KINDS = ("vpc-peering", "psa-peering")
+# Nodes and edges the reachability is computed from
+NODE_KINDS = ("project", "vpc")
+EDGE_KINDS = ("parent", "shared-vpc") + PEERING_EDGE_KINDS
+# Non-transitive peerings listed by summary, the rest is only counted
+SUMMARY_GAP_LIMIT = 1000
+
+
+class Reachability:
+    """Answers whether a VPC or project can reach another over VPC peering and Shared VPC.
+
+    Peerings are kept as a compressed sparse row adjacency over the VPC nodes: the peers of VPC
+    i are targets[offsets[i]:offsets[i + 1]], sorted, so a peering test is one bisect. Peering is
+    not transitive, so two VPCs reach each other when they are the same VPC or directly peered.
+    A Private Service Access peering connects the Google managed VPC to its consumer VPC only.
+
+    A project reaches through its own VPCs and, for a Shared VPC service project, the VPCs of
+    its host project.
+
+    Queries and the summary walk these arrays in plain Python: a query stops at the first
+    direct peering and the summary is one pass over the peerings plus one per pair of peers of
+    a VPC, which numpy, not a dependency of the app, would not make cheaper to express.
+    """
+
+    def __init__(self, kinds, edges):
+        """Indexes the peerings of a graph.
+
+        Args:
+            kinds: Dictionary of the kind of the project and VPC nodes, in graph order.
+            edges: (from, to, kind) of the parent, shared-vpc and peering edges.
+        """
+        self.kinds = kinds
+        self.edge_ids = set()
+        self.vpc_ids = [node_id for node_id, kind in kinds.items() if kind == "vpc"]
+        self.index = {vpc_id: position for position, vpc_id in enumerate(self.vpc_ids)}
+
+        self.project_vpcs = defaultdict(list)
+        self.host_of = {}
+        peers = defaultdict(set)
+        psa_pairs = set()
+        for from_id, to_id, kind in edges:
+            if kind == "parent" and to_id in self.index and self._kind(from_id) == "project":
+                self.project_vpcs[from_id].append(self.index[to_id])
+            elif kind == "shared-vpc":
+                self.host_of[to_id] = from_id
+            elif kind in PEERING_EDGE_KINDS and from_id in self.index and to_id in self.index:
+                first, second = self.index[from_id], self.index[to_id]
+                if first != second:
+                    peers[first].add(second)
+                    peers[second].add(first)
+                    if kind == "psa-peering":
+                        psa_pairs.add((min(first, second), max(first, second)))
+            else:
+                continue
+            self.edge_ids.add(f"{from_id}|{to_id}|{kind}")
+
+        count = len(self.vpc_ids)
+        self.offsets = array('l', [0]) * (count + 1)
+        for vpc in range(count):
+            self.offsets[vpc + 1] = self.offsets[vpc] + len(peers.get(vpc, ()))
+        self.targets = array('l')
+        self.is_psa = array('b')
+        for vpc in range(count):
+            for peer in sorted(peers.get(vpc, ())):
+                self.targets.append(peer)
+                self.is_psa.append((min(vpc, peer), max(vpc, peer)) in psa_pairs)
+
+    @classmethod
+    def from_graph_data(cls, graph_data):
+        kinds = {node['id']: node.get('kind') for node in graph_data['nodes'] if node.get('kind') in NODE_KINDS}
+        edges = [(edge['from'], edge['to'], edge['kind']) for edge in graph_data['edges'] if edge['kind'] in EDGE_KINDS]
+        return cls(kinds, edges)
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Indexes the peerings of a snapshot's GraphTables from its id and kind columns."""
+        nodes, edges = tables.nodes, tables.edges
+        kinds = {
+            tables.string(nodes['id'][row]): kind
+            for row, kind in enumerate(tables.strings(nodes['kind'])) if kind in NODE_KINDS
+        }
+        return cls(kinds, [
+            (tables.string(edges['from'][row]), tables.string(edges['to'][row]), kind)
+            for row, kind in enumerate(tables.strings(edges['kind'])) if kind in EDGE_KINDS
+        ])
+
+    def _kind(self, node_id):
+        return self.kinds.get(node_id)
+
+    def peers(self, vpc):
+        """Returns the slice of targets holding the peers of VPC index vpc."""
+        return self.targets[self.offsets[vpc]:self.offsets[vpc + 1]]
+
+    def peering(self, first, second):
+        """Returns the position in targets of the peering between two VPC indexes, or -1."""
+        start, end = self.offsets[first], self.offsets[first + 1]
+        position = bisect_left(self.targets, second, start, end)
+        return position if position < end and self.targets[position] == second else -1
+
+    def attachments(self, endpoint):
+        """Returns the (VPC index, hops) an endpoint reaches through without peering.
+
+        hops are the (from, to, kind) steps from the endpoint to the VPC: none for a VPC, the
+        project's parent edge for its own VPCs, and the shared-vpc edge and the host project's
+        parent edge for the VPCs of a Shared VPC host.
+
+        Raises:
+            KeyError: endpoint is not a VPC or project node.
+        """
+        if endpoint in self.index:
+            return [(self.index[endpoint], [])]
+        if self._kind(endpoint) != "project":
+            raise KeyError(endpoint)
+        attached = [(vpc, [(endpoint, self.vpc_ids[vpc], "parent")]) for vpc in self.project_vpcs.get(endpoint, [])]
+        host = self.host_of.get(endpoint)
+        if host is not None:
+            attached += [
+                (vpc, [(endpoint, host, "shared-vpc"), (host, self.vpc_ids[vpc], "parent")])
+                for vpc in self.project_vpcs.get(host, [])
+            ]
+        return attached
+
+    def query(self, source, target):
+        """Finds how source reaches target.
+
+        Args:
+            source: Id of a VPC or project node.
+            target: Id of a VPC or project node.
+
+        Returns:
+            A dictionary with 'reachable', the 'nodes' and 'edges' (graph edge ids) of the path
+            and its 'hops'. When target is not reachable, the path is the shortest chain of
+            peerings between them, if any, which only a VPN or an appliance could make work,
+            and 'reason' says why.
+
+        Raises:
+            KeyError: source or target is not a VPC or project node.
+        """
+        sources = self.attachments(source)
+        targets = {vpc: hops for vpc, hops in self.attachments(target)}
+
+        for vpc, hops in sources:
+            if vpc in targets:
+                return self._result(True, hops + _reversed(targets[vpc]), "same VPC")
+        for vpc, hops in sources:
+            for position in range(self.offsets[vpc], self.offsets[vpc + 1]):
+                peer = self.targets[position]
+                if peer in targets:
+                    peering = (self.vpc_ids[vpc], self.vpc_ids[peer], self._peering_kind(position))
+                    return self._result(True, hops + [peering] + _reversed(targets[peer]), "peered")
+
+        # peering is not transitive: a longer chain of peerings does not route
+        previous = {vpc: None for vpc, _ in sources}
+        first_hops = {vpc: hops for vpc, hops in sources}
+        pending = deque(previous)
+        while pending:
+            vpc = pending.popleft()
+            if vpc in targets:
+                target_hops = _reversed(targets[vpc])
+                chain = []
+                while previous[vpc] is not None:
+                    position = previous[vpc]
+                    chain.append((self.vpc_ids[self.targets[position]], self.vpc_ids[vpc], self._peering_kind(position)))
+                    vpc = self.targets[position]
+                hops = first_hops[vpc] + chain[::-1] + target_hops
+                return self._result(False, hops, "peering is not transitive")
+            for position in range(self.offsets[vpc], self.offsets[vpc + 1]):
+                peer = self.targets[position]
+                if peer not in previous:
+                    # the peering from vpc to peer, found again from peer's side when walking back
+                    previous[peer] = self.peering(peer, vpc)
+                    pending.append(peer)
+        return self._result(False, [], "not connected")
+
+    def _peering_kind(self, position):
+        return "psa-peering" if self.is_psa[position] else "vpc-peering"
+
+    def _result(self, reachable, hops, reason):
+        nodes = [hops[0][0]] + [hop[1] for hop in hops] if hops else []
+        edges = []
+        for from_id, to_id, kind in hops:
+            for edge_id in (f"{from_id}|{to_id}|{kind}", f"{to_id}|{from_id}|{kind}"):
+                if edge_id in self.edge_ids:
+                    edges.append(edge_id)
+                    break
+        return {
+            "reachable": reachable,
+            "reason": reason,
+            "nodes": nodes,
+            "edges": edges,
+            "hops": [{"from": from_id, "to": to_id, "kind": kind} for from_id, to_id, kind in hops]
+        }
+
+    def summary(self, gap_limit=SUMMARY_GAP_LIMIT):
+        """Summarizes the reachability between every pair of VPCs.
+
+        Returns:
+            A dictionary with the 'vpc_count', the 'peering_count' (reachable pairs), the
+            peering 'components' sizes, the 'unreachable_in_component' pairs that are connected
+            only through other VPCs, the 'isolated' VPCs and the 'gaps', up to gap_limit
+            {'from', 'via', 'to'} triples where two VPCs peer with the same VPC but not with each
+            other, with their total 'gap_count'.
+        """
+        count = len(self.vpc_ids)
+        component = array('l', [-1]) * count
+        sizes = []
+        for start in range(count):
+            if component[start] != -1:
+                continue
+            component[start] = len(sizes)
+            size = 0
+            pending = [start]
+            while pending:
+                vpc = pending.pop()
+                size += 1
+                for peer in self.peers(vpc):
+                    if component[peer] == -1:
+                        component[peer] = len(sizes)
+                        pending.append(peer)
+            sizes.append(size)
+
+        peering_count = len(self.targets) // 2
+        connected_pairs = sum(size * (size - 1) // 2 for size in sizes)
+
+        gaps = []
+        gap_count = 0
+        for via in range(count):
+            via_peers = self.peers(via)
+            for position, first in enumerate(via_peers):
+                for second in via_peers[position + 1:]:
+                    if self.peering(first, second) == -1:
+                        gap_count += 1
+                        if len(gaps) < gap_limit:
+                            gaps.append({"from": self.vpc_ids[first], "via": self.vpc_ids[via], "to": self.vpc_ids[second]})
+
+        return {
+            "vpc_count": count,
+            "peering_count": peering_count,
+            "components": sorted((size for size in sizes if size > 1), reverse=True),
+            "unreachable_in_component": connected_pairs - peering_count,
+            "isolated": [self.vpc_ids[vpc] for vpc in range(count) if self.offsets[vpc] == self.offsets[vpc + 1]],
+            "gap_count": gap_count,
+            "gaps": gaps
+        }
+
+
+def _reversed(hops):
+    """Returns the hops from an endpoint to a VPC as the hops from the VPC to the endpoint."""
+    return [(to_id, from_id, kind) for from_id, to_id, kind in reversed(hops)]
+
+
+def snapshot_reachability(snapshot):
+    """Returns the Reachability of a Snapshot, computed once per snapshot."""
+    return snapshot.derived("reachability", lambda snapshot: Reachability.from_tables(snapshot.tables))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the VPC reachability of an organization's snapshot.")
+    parser.add_argument('organization_id')
+    parser.add_argument('source', nargs='?', help="VPC or project node id, omit for the summary")
+    parser.add_argument('target', nargs='?')
+    parser.add_argument('--stamp', help="snapshot to read, the latest one by default")
+    parser.add_argument('--root', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    if args.source and not args.target:
+        parser.error("give both source and target, or neither for the summary")
+
+    reachability = snapshot_reachability(open_snapshot(args.organization_id, args.stamp, args.root))
+    if args.source and args.target:
+        print(json.dumps(reachability.query(args.source, args.target), indent=2))
+    else:
+        print(json.dumps(reachability.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
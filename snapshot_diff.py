@@ -0,0 +1,189 @@
+import argparse
+import json
+from collections import Counter
+
+from graph_builder import GraphBuilder
+from graph_layout import with_layout
+from graph_snapshot import SNAPSHOT_DIR, list_snapshots, open_snapshot
+from org_structure import generate_html
+
+# Node attributes that are not compared: coordinates move whenever anything else changes
+IGNORED_ATTRIBUTES = ("x", "y")
+# Edges without a direction: either side of a peering may be crawled first, and overlaps are
+# symmetric, so from and to can swap between two crawls of the same edge
+UNDIRECTED_EDGE_KINDS = ("vpc-peering", "overlap")
+
+# Colors of the nodes and edges of the delta graph, unchanged ones are drawn in UNCHANGED_COLOR
+DIFF_COLORS = {"added": "#2ca02c", "removed": "#d62728", "changed": "#ff7f0e"}
+UNCHANGED_COLOR = "#dddddd"
+
+
+def edge_key(edge):
+    """Returns the key an edge keeps across crawls, from|to|kind like the id of the graph stream,
+    with the endpoints of UNDIRECTED_EDGE_KINDS in sorted order."""
+    from_id, to_id = edge['from'], edge['to']
+    if edge['kind'] in UNDIRECTED_EDGE_KINDS and to_id < from_id:
+        from_id, to_id = to_id, from_id
+    return f"{from_id}|{to_id}|{edge['kind']}"
+
+
+def _diff_items(old_items, new_items, key, ignored=IGNORED_ATTRIBUTES):
+    """Compares two lists of nodes or edges by key in one pass over each, without the ignored
+    attributes."""
+    old_by_key = {key(item): item for item in old_items}
+    added, changed = [], []
+    seen = set()
+    for item in new_items:
+        item_key = key(item)
+        seen.add(item_key)
+        old_item = old_by_key.get(item_key)
+        if old_item is None:
+            added.append(item)
+            continue
+        changes = {
+            name: {"old": old_item.get(name), "new": item.get(name)}
+            for name in old_item.keys() | item.keys()
+            if name not in ignored and old_item.get(name) != item.get(name)
+        }
+        if changes:
+            changed.append({"id": item_key, "kind": item.get('kind'), "changes": changes})
+    removed = [item for item_key, item in old_by_key.items() if item_key not in seen]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def diff_graphs(old_graph_data, new_graph_data):
+    """Compares two graphs by node id and by edge (from, to, kind).
+
+    Node ids are stable across crawls, e.g. <project>_<vpc>_<subnet>_<region> for a subnet, so a
+    changed CIDR shows as a changed subnet and a new peering as an added edge. Edges are
+    compared by edge_key, so a peering drawn from its other side is the same edge.
+
+    Returns:
+        A dictionary with the 'nodes' and 'edges' that were 'added' and 'removed', the 'changed'
+        ones with the old and new value of every changed attribute, and a 'summary' counting
+        each of them by kind.
+    """
+    diff = {
+        "nodes": _diff_items(old_graph_data['nodes'], new_graph_data['nodes'], lambda node: node['id']),
+        # the endpoints are part of the key, an undirected edge drawn the other way is unchanged
+        "edges": _diff_items(old_graph_data['edges'], new_graph_data['edges'], edge_key,
+                             IGNORED_ATTRIBUTES + ("from", "to"))
+    }
+    diff["summary"] = {
+        part: {status: dict(Counter(item['kind'] for item in items)) for status, items in diff[part].items()}
+        for part in ("nodes", "edges")
+    }
+    return diff
+
+
+def delta_graph(old_graph_data, new_graph_data, diff=None):
+    """Returns the union of two graphs with the changes highlighted, laid out with with_layout.
+
+    Added, removed and changed nodes and edges are drawn in DIFF_COLORS and carry their 'diff'
+    status, the others are greyed out. Removed nodes stay under their old parent.
+    """
+    diff = diff or diff_graphs(old_graph_data, new_graph_data)
+    statuses = {}
+    for part, key in (("nodes", lambda node: node['id']), ("edges", edge_key)):
+        for status in ("added", "removed"):
+            statuses.update((key(item), status) for item in diff[part][status])
+        statuses.update((item['id'], "changed") for item in diff[part]['changed'])
+    changes = {item['id']: item['changes'] for part in ("nodes", "edges") for item in diff[part]['changed']}
+
+    def highlight(item, item_key, is_node):
+        status = statuses.get(item_key)
+        color = DIFF_COLORS.get(status, UNCHANGED_COLOR)
+        highlighted = dict(item, diff=status or "unchanged")
+        if is_node:
+            highlighted['color'] = color
+        else:
+            highlighted.update(color=color, width=3 if status else 1)
+        if status == "removed":
+            highlighted['dashes'] = True
+            highlighted['label'] = f"[removed] {item.get('label', item.get('kind'))}"
+        elif status == "changed":
+            highlighted['title'] = "\n".join(
+                f"{name}: {change['old']} -> {change['new']}" for name, change in sorted(changes[item_key].items())
+            )
+        return highlighted
+
+    nodes = [highlight(node, node['id'], True) for node in new_graph_data['nodes']]
+    nodes += [highlight(node, node['id'], True) for node in diff['nodes']['removed']]
+    edges = [highlight(edge, edge_key(edge), False) for edge in new_graph_data['edges']]
+    edges += [highlight(edge, edge_key(edge), False) for edge in diff['edges']['removed']]
+    for edge in edges:
+        edge['id'] = edge_key(edge)
+    return with_layout({
+        "nodes": [{name: value for name, value in node.items() if name not in IGNORED_ATTRIBUTES} for node in nodes],
+        "edges": edges
+    })
+
+
+def previous_stamp(organization_id, stamp=None, root=None):
+    """Returns the stamp of the snapshot before stamp, or before the latest one, or None."""
+    stamps = list_snapshots(organization_id, root)
+    if stamp is None:
+        return stamps[-2] if len(stamps) > 1 else None
+    older = [candidate for candidate in stamps if candidate < stamp]
+    return older[-1] if older else None
+
+
+def diff_snapshots(organization_id, old_stamp=None, new_stamp=None, root=None):
+    """Opens two snapshots of an organization and compares them with diff_graphs.
+
+    Args:
+        organization_id: The organization ID.
+        old_stamp: The older snapshot, the one before new_stamp by default.
+        new_stamp: The newer snapshot, the latest one by default.
+        root: Snapshot directory.
+
+    Returns:
+        A tuple of the old and new Snapshot, and the diff.
+
+    Raises:
+        FileNotFoundError: There is no such snapshot, or no snapshot before new_stamp.
+    """
+    stamps = list_snapshots(organization_id, root)
+    for stamp in (old_stamp, new_stamp):
+        if stamp is not None and stamp not in stamps:
+            raise FileNotFoundError(f"No snapshot {stamp} of organization {organization_id}")
+    new_snapshot = open_snapshot(organization_id, new_stamp, root)
+    old_stamp = old_stamp or previous_stamp(organization_id, new_snapshot.stamp, root)
+    if old_stamp is None:
+        raise FileNotFoundError(f"No snapshot of organization {organization_id} before {new_snapshot.stamp}")
+    old_snapshot = open_snapshot(organization_id, old_stamp, root)
+    return old_snapshot, new_snapshot, diff_graphs(old_snapshot.graph_data(), new_snapshot.graph_data())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two graph snapshots of an organization.")
+    parser.add_argument('organization_id')
+    parser.add_argument('--old', help="older snapshot, the one before --new by default")
+    parser.add_argument('--new', help="newer snapshot, the latest one by default")
+    parser.add_argument('--root', default=SNAPSHOT_DIR)
+    parser.add_argument('--json', action='store_true', help="print the whole diff as JSON")
+    parser.add_argument('--html', help="also write the delta-highlighted graph to this HTML file")
+    args = parser.parse_args()
+
+    old_snapshot, new_snapshot, diff = diff_snapshots(args.organization_id, args.old, args.new, args.root)
+    if args.json:
+        print(json.dumps(diff, indent=2, default=str))
+    else:
+        print(f"Changes from {old_snapshot.stamp} to {new_snapshot.stamp}")
+        for part in ("nodes", "edges"):
+            for status in ("added", "removed", "changed"):
+                items = diff[part][status]
+                counts = ", ".join(f"{count} {kind}" for kind, count in sorted(diff['summary'][part][status].items()))
+                print(f"{status} {part}: {len(items)}" + (f" ({counts})" if counts else ""))
+                for item in items:
+                    item_id = item['id'] if status == "changed" or part == "nodes" else edge_key(item)
+                    print(f"    {item_id}" + (f"  {', '.join(sorted(item['changes']))}" if status == "changed" else ""))
+
+    if args.html:
+        graph = GraphBuilder.from_graph_data(delta_graph(old_snapshot.graph_data(), new_snapshot.graph_data(), diff))
+        title = f"{args.organization_id} changes {old_snapshot.stamp} to {new_snapshot.stamp}"
+        print(f"Visualization generated: {generate_html(title, graph, path=args.html)}")
+
+
+if __name__ == '__main__':
+    main()
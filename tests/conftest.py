@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asset_collector import FakeAssetServiceClient, collect_org_from_assets
+from graph_builder import GraphBuilder
+from graph_snapshot import open_snapshot, write_snapshot
+from org_crawler import assemble_graph
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "org_assets.json")
+
+
+@pytest.fixture
+def fixture_graph():
+    """Containers, inventories and graph data of organization 1, collected from org_assets.json.
+
+    Organization 1 holds project p-a and folder 20, which holds project p-b. Their VPCs net-a
+    and net-b are peered and have one subnet each, the subnets overlap.
+    """
+    containers, inventories = collect_org_from_assets("1", FakeAssetServiceClient.from_file(FIXTURE))
+    graph = GraphBuilder()
+    graph.add_node("1", "organization", "Organization\n1", 0)
+    assemble_graph(graph, containers, inventories)
+    return containers, inventories, graph.to_graph_data()
+
+
+@pytest.fixture
+def fixture_snapshot(fixture_graph, tmp_path):
+    """Snapshot of the fixture_graph, written under tmp_path."""
+    _, _, graph_data = fixture_graph
+    write_snapshot("1", GraphBuilder.from_graph_data(graph_data), root=str(tmp_path))
+    return open_snapshot("1", root=str(tmp_path))
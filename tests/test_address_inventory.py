@@ -0,0 +1,230 @@
+import csv
+import fcntl
+import io
+import queue
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import address_inventory
+from address_inventory import ADDRESS_COLUMNS, AddressInventory, iter_csv
+
+
+def address(project_id, ip):
+    return dict({column: "" for column in ADDRESS_COLUMNS}, address=ip, name=f"{project_id}-{ip}")
+
+
+class Projects(dict):
+    """Addresses of the fake organization's projects by project ID, None when listing fails,
+    and the 'listings' of addresses the fake API returned."""
+
+
+@pytest.fixture
+def projects(monkeypatch):
+    projects = Projects({"p-a": ["10.0.0.10", "10.0.0.9"], "p-b": ["10.0.1.1"]})
+    listings = []
+
+    def iter_allocated_ip_ranges(project_id):
+        if projects[project_id] is None:
+            raise RuntimeError("Compute Engine API disabled")
+        for ip in projects[project_id]:
+            listings.append(ip)
+            yield address(project_id, ip)
+
+    monkeypatch.setattr(address_inventory, "iter_allocated_ip_ranges", iter_allocated_ip_ranges)
+    monkeypatch.setattr(address_inventory, "list_org_project_ids", lambda organization_id: sorted(projects))
+    projects.listings = listings
+    return projects
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    return AddressInventory(str(tmp_path / "addresses.sqlite3"))
+
+
+def addresses(inventory, organization_id="1", **kwargs):
+    rows, _ = inventory.page(organization_id, **kwargs)
+    return [row['address'] for row in rows]
+
+
+def generations(inventory, organization_id="1"):
+    with sqlite3.connect(inventory.path) as conn:
+        return sorted({row[0] for row in conn.execute(
+            "SELECT generation FROM addresses WHERE organization_id = ?", (organization_id,))})
+
+
+def test_refresh_replaces_the_previous_generation(inventory, projects):
+    status = inventory.refresh("1")
+    assert (status['project_count'], status['address_count'], status['failed_projects']) == (2, 3, 0)
+    assert addresses(inventory) == ["10.0.0.9", "10.0.0.10", "10.0.1.1"]
+
+    projects["p-b"] = None
+    status = inventory.refresh("1")
+    assert (status['address_count'], status['failed_projects']) == (2, 1)
+    assert addresses(inventory) == ["10.0.0.9", "10.0.0.10"]
+    assert generations(inventory) == [2]
+
+
+def test_readers_see_the_previous_generation_during_a_refresh(inventory, projects, monkeypatch):
+    inventory.refresh("1")
+    monkeypatch.setattr(address_inventory, "ADDRESS_BATCH_SIZE", 1)
+    listed = threading.Event()
+    release = threading.Event()
+    listing = address_inventory.iter_allocated_ip_ranges
+
+    def slow_listing(project_id):
+        for row in listing(project_id):
+            yield row
+            if project_id == "p-a":
+                listed.set()
+                release.wait(5)
+
+    monkeypatch.setattr(address_inventory, "iter_allocated_ip_ranges", slow_listing)
+    projects["p-a"] = ["10.1.0.1", "10.1.0.2"]
+    refresh = threading.Thread(target=inventory.refresh, args=("1",))
+    refresh.start()
+    try:
+        assert listed.wait(5)
+        deadline = time.time() + 5
+        while generations(inventory) != [1, 2] and time.time() < deadline:
+            time.sleep(0.01)
+        assert generations(inventory) == [1, 2]
+        assert addresses(inventory) == ["10.0.0.9", "10.0.0.10", "10.0.1.1"]
+        assert inventory.is_refreshing("1")
+    finally:
+        release.set()
+        refresh.join(5)
+    assert addresses(inventory) == ["10.0.1.1", "10.1.0.1", "10.1.0.2"]
+    assert not inventory.is_refreshing("1")
+
+
+def test_one_writer_drains_a_bounded_queue(inventory, projects, monkeypatch):
+    projects.update({f"p-{number}": [f"10.2.{number}.{host}" for host in range(50)] for number in range(8)})
+    monkeypatch.setattr(address_inventory, "ADDRESS_BATCH_SIZE", 4)
+    queues = []
+
+    class RecordingQueue(queue.Queue):
+        def __init__(self, maxsize):
+            super().__init__(maxsize)
+            self.largest = 0
+            self.readers = set()
+            queues.append(self)
+
+        def put(self, item, block=True, timeout=None):
+            super().put(item, block, timeout)
+            self.largest = max(self.largest, self.qsize())
+
+        def get(self, block=True, timeout=None):
+            self.readers.add(threading.current_thread())
+            time.sleep(0.001)
+            return super().get(block, timeout)
+
+    monkeypatch.setattr(address_inventory, "queue", SimpleNamespace(Queue=RecordingQueue, Full=queue.Full))
+    status = inventory.refresh("1", max_workers=2)
+
+    assert status['address_count'] == 403
+    assert queues[0].maxsize == 4
+    assert queues[0].largest <= 4
+    assert queues[0].readers == {threading.current_thread()}
+
+
+def test_a_failed_writer_stops_the_refresh_and_keeps_the_previous_generation(inventory, projects, monkeypatch):
+    previous = inventory.refresh("1")
+    projects.update({f"p-{number}": [f"10.2.{number}.{host}" for host in range(200)] for number in range(4)})
+    monkeypatch.setattr(address_inventory, "ADDRESS_BATCH_SIZE", 1)
+
+    class FailingQueue(queue.Queue):
+        gets = 0
+
+        def get(self, block=True, timeout=None):
+            FailingQueue.gets += 1
+            if FailingQueue.gets > 3:
+                raise sqlite3.OperationalError("disk I/O error")
+            return super().get(block, timeout)
+
+    monkeypatch.setattr(address_inventory, "queue", SimpleNamespace(Queue=FailingQueue, Full=queue.Full))
+    projects.listings.clear()
+    with pytest.raises(sqlite3.OperationalError):
+        inventory.refresh("1", max_workers=2)
+
+    assert len(projects.listings) < 100
+    assert inventory.status("1") == previous
+    assert addresses(inventory) == ["10.0.0.9", "10.0.0.10", "10.0.1.1"]
+
+
+def test_concurrent_ensure_fresh_calls_refresh_once(inventory, projects, monkeypatch):
+    release = threading.Event()
+    listings = []
+
+    def list_org_project_ids(organization_id):
+        listings.append(organization_id)
+        release.wait(5)
+        return sorted(projects)
+
+    monkeypatch.setattr(address_inventory, "list_org_project_ids", list_org_project_ids)
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(inventory.ensure_fresh("1"))) for _ in range(8)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join(5)
+    assert results == [(None, True)] * 8
+
+    release.set()
+    inventory._refreshes["1"].result(5)
+    status, refreshing = inventory.ensure_fresh("1")
+    assert status['address_count'] == 3 and not refreshing
+    assert listings == ["1"]
+
+    assert inventory.ensure_fresh("1", refresh=True) == (status, True)
+    inventory._refreshes["1"].result(5)
+    assert listings == ["1", "1"]
+
+
+def test_a_failed_background_refresh_is_raised_once(inventory, projects, monkeypatch):
+    def list_org_project_ids(organization_id):
+        raise RuntimeError("permission denied")
+
+    monkeypatch.setattr(address_inventory, "list_org_project_ids", list_org_project_ids)
+    inventory.ensure_fresh("1")
+    inventory._refreshes["1"].exception(5)
+
+    with pytest.raises(RuntimeError):
+        inventory.ensure_fresh("1")
+    assert inventory.ensure_fresh("1") == (None, True)
+
+
+def test_the_refresh_lock_is_shared_across_processes(inventory, projects):
+    # another process refreshing the organization holds the lock file
+    with open(f"{inventory.path}.1.lock", 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        assert inventory.is_refreshing("1")
+        started = time.time()
+        refresh = threading.Thread(target=inventory.refresh, args=("1",), kwargs={"refreshed_before": started})
+        refresh.start()
+        refresh.join(0.2)
+        assert refresh.is_alive()
+        other = AddressInventory(inventory.path)._refresh("1", ["p-b"], 2)
+        fcntl.flock(f, fcntl.LOCK_UN)
+    refresh.join(5)
+
+    # the waiting refresh found the other process's fresh result and did not list again
+    assert inventory.status("1") == other
+    assert addresses(inventory) == ["10.0.1.1"]
+    assert not inventory.is_refreshing("1")
+
+
+def test_rows_stream_as_csv_chunks(inventory, projects):
+    inventory.refresh("1")
+
+    chunks = list(iter_csv(inventory.rows("1", sort='address', descending=True), rows_per_chunk=2))
+    assert len(chunks) == 2
+    table = list(csv.reader(io.StringIO("".join(chunks))))
+    assert table[0] == ADDRESS_COLUMNS
+    assert [row[ADDRESS_COLUMNS.index('address')] for row in table[1:]] == ["10.0.1.1", "10.0.0.10", "10.0.0.9"]
+
+    table = list(csv.reader(io.StringIO("".join(iter_csv(inventory.rows("1", query="p-b-"))))))
+    assert [dict(zip(table[0], row))['name'] for row in table[1:]] == ["p-b-10.0.1.1"]
@@ -0,0 +1,54 @@
+def test_containers_follow_the_folder_hierarchy(fixture_graph):
+    containers, inventories, _ = fixture_graph
+
+    assert [(container['parent'], container['level']) for container in containers] == [
+        ("organizations/1", 0), ("folders/20", 1)
+    ]
+    assert [folder['name'] for folder in containers[0]['folders']] == ["folders/20"]
+    assert [project['project_id'] for project in containers[0]['projects']] == ["p-a"]
+    assert [project['project_id'] for project in containers[1]['projects']] == ["p-b"]
+    assert set(inventories) == {"p-a", "p-b"}
+    assert inventories['p-b']['psa_ranges'] == [
+        {"name": "psa-b", "network": "net-b", "address": "10.8.0.0", "prefix_length": 20}
+    ]
+
+
+def test_assemble_graph_from_assets(fixture_graph):
+    _, _, graph_data = fixture_graph
+    nodes = {node['id']: node for node in graph_data['nodes']}
+    edges = {(edge['from'], edge['to'], edge['kind']) for edge in graph_data['edges']}
+
+    assert {node_id: node['kind'] for node_id, node in nodes.items()} == {
+        "1": "organization",
+        "20": "folder",
+        "p-a": "project",
+        "p-b": "project",
+        "p-a_net-a": "vpc",
+        "p-b_net-b": "vpc",
+        "p-a_net-a_sub-a_europe-west1": "subnet",
+        "p-b_net-b_sub-b_europe-west1": "subnet",
+        "p-a/europe-west1/router-a": "nat",
+    }
+    assert nodes['p-a_net-a_sub-a_europe-west1']['ranges'] == [
+        {"name": "sub-a", "type": "primary", "cidr": "10.0.0.0/24"},
+        {"name": "pods", "type": "secondary", "cidr": "10.4.0.0/16"},
+    ]
+    assert nodes['p-b_net-b']['ranges'] == [{"name": "psa-b", "type": "psa", "cidr": "10.8.0.0/20"}]
+
+    assert {
+        ("1", "20", "parent"),
+        ("1", "p-a", "parent"),
+        ("20", "p-b", "parent"),
+        ("p-a", "p-a_net-a", "parent"),
+        ("p-a_net-a", "p-a_net-a_sub-a_europe-west1", "parent"),
+        ("p-b_net-b", "p-b_net-b_sub-b_europe-west1", "parent"),
+        ("p-a_net-a", "p-a/europe-west1/router-a", "nat"),
+    } <= edges
+    # both sides report the peering, it is drawn once
+    assert len([edge for edge in edges if edge[2] == "vpc-peering"]) == 1
+    assert {("p-a_net-a", "p-b_net-b")} == {
+        tuple(sorted(edge[:2])) for edge in edges if edge[2] == "vpc-peering"
+    }
+    assert {tuple(sorted(edge[:2])) for edge in edges if edge[2] == "overlap"} == {
+        ("p-a_net-a_sub-a_europe-west1", "p-b_net-b_sub-b_europe-west1")
+    }
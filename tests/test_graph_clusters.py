@@ -0,0 +1,87 @@
+import pytest
+
+import app
+import graph_snapshot
+from graph_clusters import GraphClusters
+
+
+def edge_set(edges, kind):
+    return {tuple(sorted((edge['from'], edge['to']))) for edge in edges if edge['kind'] == kind}
+
+
+@pytest.fixture
+def clusters(fixture_graph):
+    _, _, graph_data = fixture_graph
+    return GraphClusters.from_graph_data(graph_data)
+
+
+def test_view_collapses_folders_and_rolls_up_subnets(clusters):
+    nodes = {node['id']: node for node in clusters.view['nodes']}
+
+    assert set(nodes) == {"1", "20", "p-a", "p-a_net-a", "p-a_net-a|subnets", "p-a/europe-west1/router-a"}
+    assert nodes["20"]['cluster'] == "folder"
+    assert nodes["20"]['counts'] == {"project": 1, "vpc": 1, "subnet": 1}
+    assert nodes["p-a_net-a|subnets"]['cluster'] == "subnets"
+    assert nodes["p-a_net-a|subnets"]['counts'] == {"subnet": 1}
+    assert all("x" in node and "y" in node for node in nodes.values())
+
+
+def test_view_draws_relations_on_the_visible_clusters(clusters):
+    edges = clusters.view['edges']
+
+    assert edge_set(edges, "vpc-peering") == {("20", "p-a_net-a")}
+    assert edge_set(edges, "overlap") == {("20", "p-a_net-a|subnets")}
+    assert all(edge['id'] for edge in edges)
+
+
+def test_cluster_path(clusters):
+    assert clusters.cluster_path("p-b_net-b_sub-b_europe-west1") == [
+        "20", "p-b_net-b|subnets", "p-b_net-b_sub-b_europe-west1"
+    ]
+    assert clusters.cluster_path("p-b") == ["20", "p-b"]
+    assert clusters.cluster_path("p-a") == ["p-a"]
+    assert clusters.cluster_path("1") == ["1"]
+
+
+def test_expand_folder(clusters):
+    expansion = clusters.expand("20")
+
+    assert {node['id'] for node in expansion['nodes']} == {"20", "p-b", "p-b_net-b", "p-b_net-b|subnets"}
+    assert expansion['remove'] == []
+    assert expansion['relative_to'] == "20"
+    assert next(node['x'] for node in expansion['nodes'] if node['id'] == "20") == 0
+    assert edge_set(expansion['relations'], "vpc-peering") == {("p-a_net-a", "p-b_net-b")}
+    assert clusters.expand("20") is expansion
+
+
+def test_expand_subnets(clusters):
+    expansion = clusters.expand("p-a_net-a|subnets")
+
+    assert [node['id'] for node in expansion['nodes']] == ["p-a_net-a_sub-a_europe-west1"]
+    assert [edge['id'] for edge in expansion['edges']] == ["p-a_net-a|p-a_net-a_sub-a_europe-west1|parent"]
+    assert expansion['remove'] == ["p-a_net-a|subnets"]
+    assert edge_set(expansion['relations'], "overlap") == {
+        ("p-a_net-a_sub-a_europe-west1", "p-b_net-b_sub-b_europe-west1")
+    }
+
+
+def test_expand_unknown_clusters(clusters):
+    assert clusters.expand("p-a") is None
+    assert clusters.expand("p-a|subnets") is None
+    assert clusters.expand("missing") is None
+
+
+def test_snapshot_endpoints(fixture_snapshot, tmp_path, monkeypatch, clusters):
+    monkeypatch.setattr(graph_snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    client = app.app.test_client()
+
+    response = client.get("/api/snapshot/1")
+    assert response.status_code == 200
+    assert {node['id'] for node in response.get_json()['nodes']} == {node['id'] for node in clusters.view['nodes']}
+
+    response = client.get("/api/snapshot/1/expand?id=20")
+    assert response.status_code == 200
+    assert response.get_json()['relative_to'] == "20"
+
+    assert client.get("/api/snapshot/1/expand?id=p-a").status_code == 404
+    assert client.get("/api/snapshot/2/expand?id=20").status_code == 404
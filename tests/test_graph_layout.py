@@ -0,0 +1,72 @@
+from graph_layout import LEVEL_SEPARATION, NODE_SPACING, layered_layout, with_layout
+
+
+def graph(nodes, edges):
+    return {
+        "nodes": [{"id": node_id, "level": level} for node_id, level in nodes],
+        "edges": [{"from": source, "to": target, "kind": kind} for source, target, kind in edges]
+    }
+
+
+def positions(graph_data, sweeps=4):
+    x, y = layered_layout(graph_data, sweeps)
+    return {node['id']: (x[row], y[row]) for row, node in enumerate(graph_data['nodes'])}
+
+
+def test_tree_leaves_are_spaced_and_parents_centered():
+    placed = positions(graph(
+        [("org", 0), ("p-a", 1), ("p-b", 1), ("vpc-a", 2), ("nat-a", 2), ("vpc-b", 2)],
+        [("org", "p-a", "parent"), ("org", "p-b", "parent"), ("p-a", "vpc-a", "parent"),
+         ("p-a", "nat-a", "nat"), ("p-b", "vpc-b", "parent")]
+    ))
+
+    assert [placed[node_id][0] for node_id in ("vpc-a", "nat-a", "vpc-b")] == [
+        -NODE_SPACING, 0.0, NODE_SPACING
+    ]
+    assert placed["p-a"][0] == -NODE_SPACING / 2
+    assert placed["p-b"][0] == NODE_SPACING
+    assert placed["org"][0] == (placed["p-a"][0] + placed["p-b"][0]) / 2
+    assert [placed[node_id][1] for node_id in ("org", "p-a", "vpc-b")] == [0.0, LEVEL_SEPARATION, 2 * LEVEL_SEPARATION]
+
+
+def test_sweeps_move_related_siblings_closer():
+    graph_data = graph(
+        [("org", 0), ("a", 1), ("b", 1), ("c", 1), ("d", 1)],
+        [("org", "a", "parent"), ("org", "b", "parent"), ("org", "c", "parent"), ("org", "d", "parent"),
+         ("d", "org", "shared-vpc")]
+    )
+
+    unswept = positions(graph_data, sweeps=0)
+    swept = positions(graph_data)
+
+    assert sorted("abcd", key=lambda node_id: unswept[node_id][0]) == ["a", "b", "c", "d"]
+    assert sorted("abcd", key=lambda node_id: swept[node_id][0]) == ["a", "b", "d", "c"]
+    assert abs(swept["d"][0] - swept["org"][0]) < abs(unswept["d"][0] - unswept["org"][0])
+
+
+def test_sweeps_never_lengthen_relations():
+    # both ends of the relation move in a sweep, which only mirrors the drawing
+    graph_data = graph(
+        [("r", 0), ("a", 1), ("b", 1), ("s", 0), ("c", 1), ("d", 1)],
+        [("r", "a", "parent"), ("r", "b", "parent"), ("s", "c", "parent"), ("s", "d", "parent"),
+         ("a", "d", "vpc-peering")]
+    )
+
+    assert positions(graph_data) == positions(graph_data, sweeps=0)
+
+
+def test_parent_cycles_and_unknown_endpoints_are_ignored():
+    placed = positions(graph(
+        [("a", 0), ("b", 1)],
+        [("a", "b", "parent"), ("b", "a", "parent"), ("a", "missing", "parent"), ("a", "a", "parent")]
+    ))
+
+    assert placed == {"a": (0.0, 0.0), "b": (0.0, LEVEL_SEPARATION)}
+
+
+def test_with_layout_copies_the_nodes():
+    graph_data = graph([("a", 0)], [])
+    laid_out = with_layout(graph_data)
+
+    assert laid_out['nodes'] == [{"id": "a", "level": 0, "x": 0.0, "y": 0.0}]
+    assert graph_data['nodes'] == [{"id": "a", "level": 0}]
@@ -0,0 +1,56 @@
+import graph_snapshot
+from graph_clusters import GraphClusters, snapshot_clusters
+from graph_snapshot import SNAPSHOT_VERSION, open_snapshot
+from cidr_overlaps import analyze_overlaps, snapshot_overlaps
+from ip_lookup import IpLookupIndex, snapshot_ip_index
+from reachability import Reachability, snapshot_reachability
+
+
+def test_snapshot_round_trip(fixture_snapshot, fixture_graph):
+    snapshot = fixture_snapshot
+    _, _, graph_data = fixture_graph
+
+    assert snapshot.tables.version == SNAPSHOT_VERSION
+    assert snapshot.tables.range_count == 4
+    decoded = snapshot.graph_data()
+    assert [{name: value for name, value in node.items() if name not in ("x", "y")} for node in decoded['nodes']] \
+        == graph_data['nodes']
+    assert decoded['edges'] == graph_data['edges']
+
+
+def test_snapshot_analyses_read_columns(fixture_snapshot):
+    snapshot = fixture_snapshot
+    graph_data = snapshot.graph_data()
+
+    assert snapshot_overlaps(snapshot) == analyze_overlaps(graph_data)
+
+    ips = ["10.0.0.130", "10.4.1.1", "10.8.0.1", "192.168.0.1"]
+    index = snapshot_ip_index(snapshot)
+    assert [index.lookup(ip) for ip in ips] == [IpLookupIndex.from_graph_data(graph_data).lookup(ip) for ip in ips]
+    assert index.lookup("10.8.0.1")[0]['resources'][0]['project'] == "p-b"
+
+    reachability = snapshot_reachability(snapshot)
+    assert reachability.summary() == Reachability.from_graph_data(graph_data).summary()
+    assert reachability.query("p-a", "p-b")['reachable']
+
+    clusters = snapshot_clusters(snapshot)
+    expected = GraphClusters.from_graph_data(graph_data)
+    assert clusters.view == expected.view
+    for cluster_id in ("20", "p-a_net-a|subnets", "p-b_net-b|subnets", "p-a"):
+        assert clusters.expand(cluster_id) == expected.expand(cluster_id)
+
+
+def test_derived_tables_are_kept_for_the_last_used_snapshots(fixture_snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_snapshot, "SNAPSHOT_DERIVED_CACHE", 1)
+    calls = []
+
+    def count(snapshot):
+        calls.append(snapshot)
+        return len(calls)
+
+    other = open_snapshot("1", root=str(tmp_path))
+    assert fixture_snapshot.derived("count", count) == 1
+    assert fixture_snapshot.derived("count", count) == 1
+    assert other.derived("count", count) == 2
+    assert fixture_snapshot.derived("count", count) == 3
+    assert other.derived("count", count) == 4
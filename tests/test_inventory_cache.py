@@ -0,0 +1,124 @@
+import sys
+import time
+
+import pytest
+
+import inventory_cache
+from inventory_cache import CACHE_TTLS, InventoryCache, cached_fetch
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Current time of the cache, moved forward by the tests."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return InventoryCache(str(tmp_path / "cache.sqlite3"))
+
+
+def test_entries_expire_with_the_ttl_of_their_kind(cache, clock):
+    cache.put("p-a", "subnets", {"net": []})
+    cache.put("organizations/1", "folders", ["folders/20"])
+
+    clock[0] += CACHE_TTLS['subnets'] - 1
+    assert cache.get("p-a", "subnets") == (True, {"net": []})
+
+    clock[0] += 1
+    assert cache.get("p-a", "subnets") == (False, None)
+    assert cache.get("p-a", "subnets", include_expired=True) == (True, {"net": []})
+    assert cache.get("organizations/1", "folders") == (True, ["folders/20"])
+
+
+def test_max_age_replaces_the_ttl(cache, clock):
+    cache.put("p-a", "networks", ["net"])
+    clock[0] += 10
+    assert cache.get("p-a", "networks", max_age=5) == (False, None)
+    assert cache.get("p-a", "networks", max_age=60) == (True, ["net"])
+
+
+def test_fingerprints_are_kept_for_a_year(cache, clock):
+    assert CACHE_TTLS['fingerprints'] == 365 * 24 * 3600
+    cache.put("p-a", "fingerprints", {"project": "etag"})
+
+    clock[0] += 364 * 24 * 3600
+    assert cache.get("p-a", "fingerprints") == (True, {"project": "etag"})
+    clock[0] += 24 * 3600
+    assert cache.get("p-a", "fingerprints") == (False, None)
+
+
+def test_ttls_override_per_cache(tmp_path, clock):
+    cache = InventoryCache(str(tmp_path / "cache.sqlite3"), ttls={'routers': 10})
+    cache.put("p-a", "routers", {})
+    clock[0] += 10
+    assert cache.get("p-a", "routers") == (False, None)
+    assert cache.ttls['subnets'] == CACHE_TTLS['subnets']
+
+
+def test_cached_fetch_calls_the_api_only_when_missing_or_expired(cache, clock):
+    calls = []
+
+    def fetch(project_id):
+        calls.append(project_id)
+        return {"fetched": len(calls)}
+
+    assert cached_fetch(cache, "p-a", "peerings", fetch, "p-a") == {"fetched": 1}
+    assert cached_fetch(cache, "p-a", "peerings", fetch, "p-a") == {"fetched": 1}
+    clock[0] += CACHE_TTLS['peerings']
+    assert cached_fetch(cache, "p-a", "peerings", fetch, "p-a") == {"fetched": 2}
+    assert cached_fetch(None, "p-a", "peerings", fetch, "p-a") == {"fetched": 3}
+
+
+def test_failed_fetches_are_not_cached(cache):
+    def fail(project_id):
+        raise RuntimeError("Compute Engine API disabled")
+
+    with pytest.raises(RuntimeError):
+        cache.fetch("p-a", "networks", fail, "p-a")
+    assert cache.get("p-a", "networks", include_expired=True) == (False, None)
+
+
+def test_purge(cache, clock):
+    cache.put("p-a", "subnets", {})
+    cache.put("p-b", "subnets", {})
+    cache.put("p-a", "routers", {})
+    clock[0] += CACHE_TTLS['subnets']
+    cache.put("p-c", "subnets", {})
+
+    assert cache.purge(expired_only=True) == 3
+    assert [row[:2] for row in cache.entries()] == [("p-c", "subnets")]
+
+    cache.put("p-a", "routers", {})
+    assert cache.purge(kind="subnets", scope="p-a") == 0
+    assert cache.purge(kind="subnets") == 1
+    assert [row[:2] for row in cache.entries()] == [("p-a", "routers")]
+
+
+def run_cli(monkeypatch, capsys, path, *args):
+    monkeypatch.setattr(sys, "argv", ["inventory_cache.py", "--path", path] + list(args))
+    inventory_cache.main()
+    return capsys.readouterr().out.splitlines()
+
+
+def test_cli_lists_counts_and_purges(tmp_path, clock, monkeypatch, capsys):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = InventoryCache(path)
+    cache.put("p-a", "subnets", {"net": []})
+    cache.put("p-b", "subnets", {})
+    clock[0] += CACHE_TTLS['subnets']
+    cache.put("p-a", "routers", {})
+
+    listed = run_cli(monkeypatch, capsys, path, "list")
+    assert [line.split()[:2] + line.split()[-1:] for line in listed] == [
+        ["routers", "p-a", "fresh"], ["subnets", "p-a", "expired"], ["subnets", "p-b", "expired"]
+    ]
+
+    stats = run_cli(monkeypatch, capsys, path, "stats", "--kind", "subnets")
+    assert len(stats) == 1 and stats[0].split()[0] == "subnets"
+    assert "2 entries" in " ".join(stats[0].split()) and "2 expired" in " ".join(stats[0].split())
+
+    assert run_cli(monkeypatch, capsys, path, "purge", "--expired") == [f"Removed 2 entries from {path}"]
+    assert [row[:2] for row in cache.entries()] == [("p-a", "routers")]
@@ -0,0 +1,88 @@
+import ipaddress
+import random
+
+import pytest
+
+from ip_lookup import IpLookupIndex
+
+
+def subnet(node_id, vpc, cidrs):
+    return {"id": node_id, "kind": "subnet", "vpc": vpc,
+            "ranges": [{"name": f"{node_id}-{position}", "type": "primary", "cidr": cidr}
+                       for position, cidr in enumerate(cidrs)]}
+
+
+@pytest.fixture
+def index():
+    nodes = [
+        {"id": "p-a", "kind": "project"},
+        {"id": "p-b", "kind": "project"},
+        {"id": "p-a_net", "kind": "vpc"},
+        {"id": "p-b_net", "kind": "vpc"},
+        subnet("a-wide", "p-a_net", ["10.0.0.0/16"]),
+        subnet("a-narrow", "p-a_net", ["10.0.1.0/24", "10.0.1.128/25"]),
+        subnet("a-other", "p-a_net", ["10.2.0.0/24"]),
+        # the same CIDR in another VPC
+        subnet("b-same", "p-b_net", ["10.0.1.0/24"]),
+        subnet("b-last", "p-b_net", ["255.255.255.0/24", "fd00::/64"]),
+    ]
+    edges = [
+        {"from": "p-a", "to": "p-a_net", "kind": "parent"},
+        {"from": "p-b", "to": "p-b_net", "kind": "parent"},
+    ] + [
+        {"from": node['vpc'], "to": node['id'], "kind": "parent"} for node in nodes if node.get('vpc')
+    ]
+    return IpLookupIndex.from_graph_data({"nodes": nodes, "edges": edges})
+
+
+def cidrs(matches):
+    return [match['cidr'] for match in matches]
+
+
+def test_longest_prefix_first(index):
+    assert cidrs(index.lookup("10.0.1.200")) == ["10.0.1.128/25", "10.0.1.0/24", "10.0.0.0/16"]
+    assert [match['prefix_length'] for match in index.lookup("10.0.1.200")] == [25, 24, 16]
+    assert cidrs(index.lookup("10.0.1.5")) == ["10.0.1.0/24", "10.0.0.0/16"]
+    assert cidrs(index.lookup("10.0.200.1")) == ["10.0.0.0/16"]
+    assert cidrs(index.lookup("10.2.0.255")) == ["10.2.0.0/24"]
+
+
+def test_same_cidr_in_several_vpcs(index):
+    match = index.lookup("10.0.1.5")[0]
+
+    assert [(resource['node'], resource['project']) for resource in match['resources']] == [
+        ("a-narrow", "p-a"), ("b-same", "p-b")
+    ]
+
+
+def test_misses(index):
+    for ip in ("9.255.255.255", "10.1.0.0", "10.2.1.0", "0.0.0.0", "255.255.254.255"):
+        assert index.lookup(ip) == []
+    assert cidrs(index.lookup("255.255.255.255")) == ["255.255.255.0/24"]
+    assert IpLookupIndex([], [], []).lookup("10.0.0.1") == []
+
+
+def test_invalid_addresses(index):
+    with pytest.raises(ValueError):
+        index.lookup("fd00::1")
+    assert [matches for _, matches in index.lookup_many(["not an ip", " 10.2.0.1 "])] == [
+        None, index.lookup("10.2.0.1")
+    ]
+
+
+def test_matches_every_containing_range():
+    generator = random.Random(7)
+    networks = {
+        ipaddress.ip_network((generator.getrandbits(32), generator.randint(8, 28)), strict=False)
+        for _ in range(300)
+    }
+    nodes = [subnet(f"s{position}", "vpc", [str(network)]) for position, network in enumerate(sorted(networks))]
+    index = IpLookupIndex.from_graph_data({"nodes": nodes, "edges": []})
+
+    for _ in range(300):
+        network = generator.choice(sorted(networks))
+        address = ipaddress.IPv4Address(int(network.network_address) + generator.randrange(network.num_addresses))
+        for candidate in (address, ipaddress.IPv4Address(generator.getrandbits(32))):
+            expected = sorted((network for network in networks if candidate in network),
+                              key=lambda network: -network.prefixlen)
+            assert cidrs(index.lookup(str(candidate))) == [str(network) for network in expected]
@@ -0,0 +1,99 @@
+import pytest
+
+import app
+import graph_snapshot
+from reachability import Reachability
+
+
+@pytest.fixture
+def reachability():
+    projects = {"p-a": ["a1", "a2"], "p-b": ["b1"], "p-c": ["c1"], "p-d": ["d1"], "host": ["h1"], "service": []}
+    nodes = [{"id": project_id, "kind": "project"} for project_id in projects]
+    nodes += [{"id": vpc, "kind": "vpc"} for vpcs in projects.values() for vpc in vpcs]
+    nodes.append({"id": "gcp-managed", "kind": "vpc"})
+    edges = [{"from": project_id, "to": vpc, "kind": "parent"} for project_id, vpcs in projects.items() for vpc in vpcs]
+    edges += [
+        {"from": "host", "to": "service", "kind": "shared-vpc"},
+        {"from": "a1", "to": "b1", "kind": "vpc-peering"},
+        {"from": "c1", "to": "b1", "kind": "vpc-peering"},
+        {"from": "h1", "to": "a1", "kind": "vpc-peering"},
+        {"from": "a1", "to": "gcp-managed", "kind": "psa-peering"},
+    ]
+    return Reachability.from_graph_data({"nodes": nodes, "edges": edges})
+
+
+def test_same_vpc(reachability):
+    assert reachability.query("a1", "a1")['reachable']
+    result = reachability.query("p-a", "a2")
+    assert (result['reachable'], result['reason']) == (True, "same VPC")
+    assert result['nodes'] == ["p-a", "a2"]
+    assert result['edges'] == ["p-a|a2|parent"]
+
+
+def test_shared_vpc_service_projects_reach_through_the_host(reachability):
+    result = reachability.query("service", "h1")
+    assert (result['reachable'], result['reason']) == (True, "same VPC")
+    assert result['edges'] == ["host|service|shared-vpc", "host|h1|parent"]
+
+    result = reachability.query("service", "p-a")
+    assert (result['reachable'], result['reason']) == (True, "peered")
+    assert result['nodes'] == ["service", "host", "h1", "a1", "p-a"]
+
+
+def test_direct_peering(reachability):
+    result = reachability.query("p-b", "p-a")
+    assert (result['reachable'], result['reason']) == (True, "peered")
+    assert result['nodes'] == ["p-b", "b1", "a1", "p-a"]
+    assert result['edges'] == ["p-b|b1|parent", "a1|b1|vpc-peering", "p-a|a1|parent"]
+
+    result = reachability.query("gcp-managed", "a1")
+    assert result['reachable']
+    assert result['hops'] == [{"from": "gcp-managed", "to": "a1", "kind": "psa-peering"}]
+
+
+def test_peering_is_not_transitive(reachability):
+    result = reachability.query("a1", "c1")
+    assert (result['reachable'], result['reason']) == (False, "peering is not transitive")
+    assert result['nodes'] == ["a1", "b1", "c1"]
+    assert result['edges'] == ["a1|b1|vpc-peering", "c1|b1|vpc-peering"]
+
+    assert reachability.query("h1", "c1")['nodes'] == ["h1", "a1", "b1", "c1"]
+    assert not reachability.query("gcp-managed", "b1")['reachable']
+
+
+def test_not_connected(reachability):
+    result = reachability.query("p-d", "a1")
+    assert (result['reachable'], result['reason'], result['nodes']) == (False, "not connected", [])
+    with pytest.raises(KeyError):
+        reachability.query("a1", "missing")
+    with pytest.raises(KeyError):
+        reachability.query("a1-subnet", "a1")
+
+
+def test_summary(reachability):
+    summary = reachability.summary()
+
+    assert summary['vpc_count'] == 7
+    assert summary['peering_count'] == 4
+    assert summary['components'] == [5]
+    assert summary['unreachable_in_component'] == 6
+    assert summary['isolated'] == ["a2", "d1"]
+    assert summary['gap_count'] == 4
+    assert {"from": "a1", "via": "b1", "to": "c1"} in summary['gaps']
+    assert len(reachability.summary(gap_limit=1)['gaps']) == 1
+
+
+def test_reachability_endpoint(fixture_snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    client = app.app.test_client()
+
+    response = client.get("/api/reachability/1?from=p-a&to=p-b")
+    assert response.status_code == 200
+    assert response.get_json()['reachable']
+    assert response.get_json()['node_paths']['p-b'] == ["20", "p-b"]
+
+    assert "vpc_count" in client.get("/api/reachability/1").get_json()
+    assert client.get("/api/reachability/1?from=p-a").status_code == 400
+    assert client.get("/api/reachability/1?to=p-a").status_code == 400
+    assert client.get("/api/reachability/1?from=p-a&to=missing").status_code == 404
+    assert client.get("/api/reachability/2?from=p-a&to=p-b").status_code == 404
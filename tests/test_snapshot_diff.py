@@ -0,0 +1,116 @@
+import copy
+import sys
+
+import pytest
+
+import snapshot_diff
+from graph_builder import GraphBuilder
+from graph_snapshot import write_snapshot
+from snapshot_diff import DIFF_COLORS, UNCHANGED_COLOR, delta_graph, diff_graphs, diff_snapshots, edge_key, previous_stamp
+
+SUBNET_A = "p-a_net-a_sub-a_europe-west1"
+SUBNET_B = "p-b_net-b_sub-b_europe-west1"
+
+
+@pytest.fixture
+def graphs(fixture_graph):
+    """The fixture graph and a later crawl of it: a subnet CIDR changed, the NAT was removed, a
+    VPC was added and the peering was crawled from its other side."""
+    _, _, old = fixture_graph
+    new = copy.deepcopy(old)
+    subnet = next(node for node in new['nodes'] if node['id'] == SUBNET_A)
+    subnet['ranges'][0]['cidr'] = "10.0.0.0/23"
+    new['nodes'] = [node for node in new['nodes'] if node['kind'] != "nat"]
+    new['nodes'].append({"id": "p-a_net-c", "label": "net-c", "level": 3, "kind": "vpc", "project_id": "p-a"})
+    new['edges'] = [edge for edge in new['edges'] if edge['kind'] != "nat"]
+    new['edges'].append({"from": "p-a", "to": "p-a_net-c", "kind": "parent"})
+    for edge in new['edges']:
+        if edge['kind'] == "vpc-peering":
+            edge['from'], edge['to'] = edge['to'], edge['from']
+    return old, new
+
+
+def test_edge_key_sorts_the_endpoints_of_undirected_edges():
+    assert edge_key({"from": "b", "to": "a", "kind": "vpc-peering"}) == "a|b|vpc-peering"
+    assert edge_key({"from": "a", "to": "b", "kind": "vpc-peering"}) == "a|b|vpc-peering"
+    assert edge_key({"from": "b", "to": "a", "kind": "overlap"}) == "a|b|overlap"
+    assert edge_key({"from": "b", "to": "a", "kind": "psa-peering"}) == "b|a|psa-peering"
+    assert edge_key({"from": "b", "to": "a", "kind": "parent"}) == "b|a|parent"
+
+
+def test_diff_graphs(graphs):
+    old, new = graphs
+    diff = diff_graphs(old, new)
+
+    assert [node['id'] for node in diff['nodes']['added']] == ["p-a_net-c"]
+    assert [node['id'] for node in diff['nodes']['removed']] == ["p-a/europe-west1/router-a"]
+    assert [node['id'] for node in diff['nodes']['changed']] == [SUBNET_A]
+    assert diff['nodes']['changed'][0]['changes']['ranges']['new'][0]['cidr'] == "10.0.0.0/23"
+    assert [edge_key(edge) for edge in diff['edges']['added']] == ["p-a|p-a_net-c|parent"]
+    assert [edge_key(edge) for edge in diff['edges']['removed']] == ["p-a_net-a|p-a/europe-west1/router-a|nat"]
+    # the peering crawled from its other side is the same edge
+    assert diff['edges']['changed'] == []
+    assert diff['summary']['nodes'] == {
+        "added": {"vpc": 1}, "removed": {"nat": 1}, "changed": {"subnet": 1}
+    }
+    assert diff_graphs(old, old)['summary']['edges'] == {"added": {}, "removed": {}, "changed": {}}
+
+
+def test_delta_graph(graphs):
+    old, new = graphs
+    delta = delta_graph(old, new)
+    nodes = {node['id']: node for node in delta['nodes']}
+    edges = {edge['id']: edge for edge in delta['edges']}
+
+    assert len(nodes) == len(new['nodes']) + 1
+    assert (nodes["p-a_net-c"]['diff'], nodes["p-a_net-c"]['color']) == ("added", DIFF_COLORS['added'])
+    removed = nodes["p-a/europe-west1/router-a"]
+    assert (removed['diff'], removed['color']) == ("removed", DIFF_COLORS['removed'])
+    assert removed['label'].startswith("[removed] ")
+    assert nodes[SUBNET_A]['diff'] == "changed"
+    assert "ranges:" in nodes[SUBNET_A]['title']
+    assert (nodes[SUBNET_B]['diff'], nodes[SUBNET_B]['color']) == ("unchanged", UNCHANGED_COLOR)
+    assert all("x" in node and "y" in node for node in delta['nodes'])
+
+    assert edges["p-a_net-a|p-a/europe-west1/router-a|nat"]['dashes']
+    assert edges["p-a_net-a|p-b_net-b|vpc-peering"]['diff'] == "unchanged"
+
+
+def test_previous_stamp(fixture_graph, tmp_path):
+    _, _, graph_data = fixture_graph
+    root = str(tmp_path)
+    assert previous_stamp("1", root=root) is None
+
+    for stamp in ("20260101T000000", "20260102T000000", "20260103T000000"):
+        write_snapshot("1", GraphBuilder.from_graph_data(graph_data), root=root, stamp=stamp)
+
+    assert previous_stamp("1", root=root) == "20260102T000000"
+    assert previous_stamp("1", "20260102T000000", root=root) == "20260101T000000"
+    assert previous_stamp("1", "20260101T000000", root=root) is None
+
+    old_snapshot, new_snapshot, diff = diff_snapshots("1", root=root)
+    assert (old_snapshot.stamp, new_snapshot.stamp) == ("20260102T000000", "20260103T000000")
+    with pytest.raises(FileNotFoundError):
+        diff_snapshots("1", new_stamp="20260101T000000", root=root)
+    with pytest.raises(FileNotFoundError):
+        diff_snapshots("1", old_stamp="20250101T000000", root=root)
+
+
+def test_cli_writes_the_delta_graph_as_html(graphs, tmp_path, monkeypatch, capsys):
+    old, new = graphs
+    root = str(tmp_path / "snapshots")
+    write_snapshot("1", GraphBuilder.from_graph_data(old), root=root, stamp="20260101T000000")
+    write_snapshot("1", GraphBuilder.from_graph_data(new), root=root, stamp="20260102T000000")
+    html = str(tmp_path / "delta.html")
+
+    monkeypatch.setattr(sys, "argv", ["snapshot_diff.py", "1", "--root", root, "--html", html])
+    snapshot_diff.main()
+    output = capsys.readouterr().out.splitlines()
+
+    assert output[0] == "Changes from 20260101T000000 to 20260102T000000"
+    assert "added nodes: 1 (1 vpc)" in output
+    assert "changed edges: 0" in output
+    assert output[-1] == f"Visualization generated: {html}"
+    with open(html) as f:
+        page = f.read()
+    assert "[removed] " in page and DIFF_COLORS['added'] in page